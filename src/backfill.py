@@ -0,0 +1,161 @@
+"""Export the completed workflow runs of a repository over a date range.
+
+Runs are exported by a bounded pool of workers. The id of every run whose
+jobs were all exported and flushed is appended to a checkpoint file, so an
+interrupted backfill resumes with the runs it has not exported yet.
+"""
+import argparse
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone
+
+from exporter import configure_debug, export_and_flush
+from lib.config import Config
+from lib.github_api import GithubApi
+from lib.otel import export_lost, shutdown_providers
+from lib.rate_limit import get_scheduler
+
+
+class Checkpoint:
+    """Append-only file of exported run ids."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._lock = threading.Lock()
+
+    def __contains__(self, run_id):
+        return str(run_id) in self.done
+
+    def add(self, run_id):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(str(run_id) + "\n")
+            self.done.add(str(run_id))
+
+
+def iter_days(since, until):
+    day = since
+    while day <= until:
+        yield day
+        day += timedelta(days=1)
+
+
+# GitHub returns at most this many runs for a filtered listing
+MAX_LISTED_RUNS = 1000
+
+
+def created_ranges(api, start, length, **filters):
+    """Yield created filters covering length from start, none over MAX_LISTED_RUNS.
+
+    A day with more runs is split into hours, an hour into minutes.
+    """
+    if length == timedelta(days=1):
+        created = start.date().isoformat()
+    else:
+        end = start + length - timedelta(seconds=1)
+        created = "{}..{}".format(
+            start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+        )
+    total_count = api.count_workflow_runs(
+        cached=True, created=created, status="completed", **filters
+    )
+    if total_count <= MAX_LISTED_RUNS or length <= timedelta(minutes=1):
+        if total_count > MAX_LISTED_RUNS:
+            print("Only", MAX_LISTED_RUNS, "of", total_count, "runs listed ->", created)
+        yield created
+        return
+
+    print(total_count, "runs created", created, "- listing them in smaller ranges")
+    parts = 24 if length > timedelta(hours=1) else 60
+    for part in range(parts):
+        yield from created_ranges(
+            api, start + part * length / parts, length / parts, **filters
+        )
+
+
+def list_runs(api, since, until, checkpoint, **filters):
+    """Yield completed runs created between since and until, oldest day first.
+
+    Runs are listed one day at a time, or in smaller ranges on days with
+    more runs than GitHub lists.
+    """
+    for day in iter_days(since, until):
+        start = datetime.combine(day, time(), tzinfo=timezone.utc)
+        for created in created_ranges(api, start, timedelta(days=1), **filters):
+            for run in api.get_workflow_runs(
+                cached=True, created=created, status="completed", **filters
+            ):
+                if run.id not in checkpoint:
+                    yield run
+
+
+def export_run(api, run, checkpoint):
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            exported = export_and_flush(api, str(run.id), run.name, workdir)
+        except Exception as e:
+            print("Unable to export workflow run", run.id, "<- due to error", e)
+            return False
+    if not exported:
+        print("Workflow run not fully exported, not checkpointed ->", run.id)
+        return False
+    checkpoint.add(run.id)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--since", required=True, type=date.fromisoformat)
+    parser.add_argument("--until", default=date.today(), type=date.fromisoformat)
+    parser.add_argument("--branch")
+    parser.add_argument("--event")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkpoint", default="backfill.checkpoint")
+    args = parser.parse_args(argv)
+
+    Config.check_env_vars(single_run=False)
+    configure_debug()
+
+    filters = {k: v for k, v in (("branch", args.branch), ("event", args.event)) if v}
+    api = GithubApi()
+    checkpoint = Checkpoint(args.checkpoint)
+    print(
+        "Backfilling workflow runs from",
+        args.since,
+        "to",
+        args.until,
+        "-",
+        len(checkpoint.done),
+        "already exported",
+    )
+
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        results = list(
+            executor.map(
+                lambda run: export_run(api, run, checkpoint),
+                list_runs(api, args.since, args.until, checkpoint, **filters),
+            )
+        )
+
+    report = shutdown_providers()
+    print("GitHub API usage ->", get_scheduler().stats())
+    print("Export summary ->", report)
+    print(
+        "Backfill finished ->",
+        results.count(True),
+        "runs exported,",
+        results.count(False),
+        "failed",
+    )
+    if not all(results) or export_lost(report):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""End-to-end export benchmark against synthetic runs and a local OTLP sink.
+
+Drives exporter.export_workflow_run for a generated workflow run, with the
+GitHub API answered by FakeGithubSession and OTLP data sent over gRPC to an
+in-process OtlpSink, so it needs no network access. Reports wall time per
+phase, spans/s and log records/s as received by the sink, and peak RSS.
+
+Run from src/: python -m benchmarks.bench_export --jobs 20 --steps 10 --lines 1000
+"""
+import argparse
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from unittest.mock import patch
+
+import exporter
+import lib.github_api
+import lib.http_client
+import lib.log_parser
+from benchmarks.otlp_sink import OtlpSink
+from benchmarks.synthetic import FakeGithubSession, SyntheticRun
+from lib.config import Config
+from lib.log_policy import LogPolicy, split_patterns
+from lib.models import Job
+from lib.otel import shutdown_providers
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.seconds[phase] += seconds
+
+    def wrap(self, phase, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - started)
+
+        return timed
+
+
+def run_benchmark(run, endpoint, workers=1, stream_logs=False, parse_logs=True, settings=None):
+    """Export run to the OTLP endpoint, return the PhaseTimer of the export.
+
+    settings are extra Config attributes to set for the export.
+    """
+    timer = PhaseTimer()
+    session = FakeGithubSession(run)
+    api_class = lib.github_api.GithubApi
+    patches = [
+        patch.object(Config, "GHA_SERVICE_NAME", "o/r"),
+        patch.object(Config, "GITHUB_REPOSITORY_OWNER", "o"),
+        patch.object(Config, "GITHUB_API_URL", "https://api.github.invalid"),
+        patch.object(Config, "NEW_RELIC_LICENSE_KEY", "benchmark"),
+        patch.object(Config, "OTEL_EXPORTER_OTLP_ENDPOINT", endpoint),
+        patch.object(Config, "PARSE_LOGS", parse_logs),
+        patch.object(Config, "STREAM_LOGS", stream_logs),
+        patch.object(Config, "GHA_EXPORT_WORKERS", workers),
+        patch.object(Config, "GHA_API_RATE", 1000000.0),
+        patch.object(lib.github_api, "get_session", lambda: session),
+        patch.object(lib.http_client, "get_session", lambda: session),
+        patch.object(
+            lib.log_parser,
+            "download_log_files",
+            timer.wrap("log_download", lib.log_parser.download_log_files),
+        ),
+        patch.object(
+            lib.log_parser,
+            "download_job_logs",
+            timer.wrap("log_download", lib.log_parser.download_job_logs),
+        ),
+        patch.object(
+            lib.log_parser,
+            "parse_log_files",
+            timer.wrap("log_parse (cumulative)", lib.log_parser.parse_log_files),
+        ),
+    ]
+    patches.extend(patch.object(Config, name, value) for name, value in (settings or {}).items())
+    for name in (
+        "get_workflow_run_jobs_by_run_id",
+        "get_workflow_run_by_id",
+        "get_commit_count_of_workflow_run",
+    ):
+        patches.append(
+            patch.object(api_class, name, timer.wrap("github_api", getattr(api_class, name)))
+        )
+
+    for p in patches:
+        p.start()
+    try:
+        api = api_class()
+        with tempfile.TemporaryDirectory() as workdir:
+            started = time.perf_counter()
+            exporter.export_workflow_run(api, str(run.run_id), "CI", workdir)
+            timer.add("export", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            shutdown_providers()
+            timer.add("flush", time.perf_counter() - started)
+    finally:
+        for p in reversed(patches):
+            p.stop()
+
+    return timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--stream-logs", action="store_true")
+    parser.add_argument("--no-logs", action="store_true")
+    parser.add_argument(
+        "--log-jobs", default="*", help="GHA_LOG_JOBS, e.g. job-1 to fetch one job log"
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    run = SyntheticRun(jobs=args.jobs, steps=args.steps, lines_per_step=args.lines)
+    run.log_zip()
+    generate_seconds = time.perf_counter() - started
+
+    sink = OtlpSink().start()
+    try:
+        timer = run_benchmark(
+            run,
+            sink.endpoint,
+            args.workers,
+            args.stream_logs,
+            parse_logs=not args.no_logs,
+            settings={"GHA_LOG_JOBS": args.log_jobs},
+        )
+    finally:
+        sink.stop()
+    timer.seconds = dict(generate=generate_seconds, **timer.seconds)
+
+    export_seconds = timer.seconds["export"] + timer.seconds["flush"]
+    expected_spans = 1 + args.jobs + args.jobs * args.steps
+    expected_logs = 0
+    if not args.no_logs:
+        policy = LogPolicy(split_patterns(args.log_jobs))
+        selected = sum(1 for job in run.jobs if policy.selects_job(Job(job))) / args.jobs
+        expected_logs = int(run.log_lines * selected)
+        if Config.GHA_LOG_GROUP_SPANS:
+            expected_spans += int(run.log_groups * selected)
+    print(
+        "jobs={} steps={} lines/step={} workers={} stream_logs={}".format(
+            args.jobs, args.steps, args.lines, args.workers, args.stream_logs
+        )
+    )
+    for phase, seconds in timer.seconds.items():
+        print("  {:<24}{:>10.3f} s".format(phase, seconds))
+    print(
+        "  {:<24}{:>10d} / {} ({:.0f}/s)".format(
+            "spans", sink.spans, expected_spans, sink.spans / export_seconds
+        )
+    )
+    print(
+        "  {:<24}{:>10d} / {} ({:.0f}/s)".format(
+            "log records",
+            sink.log_records,
+            expected_logs,
+            sink.log_records / export_seconds,
+        )
+    )
+    print("  {:<24}{:>10d}".format("metrics", sink.metrics))
+    print("  {:<24}{:>10d}".format("OTLP bytes", sink.bytes))
+    print(
+        "  {:<24}{:>10.1f} MiB".format(
+            "peak RSS", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Scaling of the export with the number of log parser processes.
+
+Exports the same synthetic run with GHA_LOG_PROCESSES set to each of the
+given worker counts, 0 being the in-process parser, and reports the export
+time and log records/s received by the sink for each.
+
+Run from src/: python -m benchmarks.bench_log_processes --processes 0,1,2,4,8
+"""
+import argparse
+import time
+
+from benchmarks.bench_export import run_benchmark
+from benchmarks.otlp_sink import OtlpSink
+from benchmarks.synthetic import SyntheticRun
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--processes", default="0,1,2,4")
+    args = parser.parse_args()
+
+    run = SyntheticRun(jobs=args.jobs, steps=args.steps, lines_per_step=args.lines)
+    run.log_zip()
+    print(
+        "jobs={} steps={} lines/step={} workers={}".format(
+            args.jobs, args.steps, args.lines, args.workers
+        )
+    )
+    print(
+        "  {:>10}{:>12}{:>12}{:>14}{:>10}".format(
+            "processes", "parse s", "export s", "records/s", "speedup"
+        )
+    )
+    baseline = None
+    for processes in [int(value) for value in args.processes.split(",")]:
+        sink = OtlpSink().start()
+        try:
+            timer = run_benchmark(
+                run,
+                sink.endpoint,
+                args.workers,
+                settings={"GHA_LOG_PROCESSES": processes},
+            )
+        finally:
+            sink.stop()
+        seconds = timer.seconds["export"] + timer.seconds["flush"]
+        baseline = baseline or seconds
+        print(
+            "  {:>10d}{:>12.3f}{:>12.3f}{:>14.0f}{:>9.2f}x".format(
+                processes,
+                timer.seconds["log_parse (cumulative)"],
+                seconds,
+                sink.log_records / seconds,
+                baseline / seconds,
+            )
+        )
+        if sink.log_records != run.log_lines:
+            print("    lost log records:", run.log_lines - sink.log_records)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    main()
+    print("total {:.1f} s".format(time.perf_counter() - started))
@@ -0,0 +1,278 @@
+"""Micro-benchmark of parse_attributes against the previous hand-unrolled walker.
+
+Run from src/: python -m benchmarks.bench_parse_attributes [iterations]
+"""
+import sys
+import timeit
+
+from lib.custom_parser import do_parse, do_string, do_time_ms, parse_attributes
+
+
+def make_job(steps=30):
+    return {
+        "id": 123456789,
+        "run_id": 987654321,
+        "workflow_name": "CI",
+        "head_branch": "main",
+        "run_url": "https://api.github.com/repos/o/r/actions/runs/987654321",
+        "run_attempt": 1,
+        "node_id": "CR_kwDOABCDEF8AAAAB",
+        "head_sha": "0123456789abcdef0123456789abcdef01234567",
+        "url": "https://api.github.com/repos/o/r/actions/jobs/123456789",
+        "html_url": "https://github.com/o/r/actions/runs/987654321/job/123456789",
+        "status": "completed",
+        "conclusion": "success",
+        "created_at": "2024-01-01T10:00:00Z",
+        "started_at": "2024-01-01T10:00:05Z",
+        "completed_at": "2024-01-01T10:12:00Z",
+        "name": "build (ubuntu-latest, 3.11)",
+        "check_run_url": "https://api.github.com/repos/o/r/check-runs/123456789",
+        "labels": ["ubuntu-latest"],
+        "runner_id": 42,
+        "runner_name": "GitHub Actions 42",
+        "runner_group_id": 2,
+        "runner_group_name": "GitHub Actions",
+        "steps": [
+            {
+                "name": "Step {}".format(number),
+                "status": "completed",
+                "conclusion": "success",
+                "number": number,
+                "started_at": "2024-01-01T10:00:{:02d}Z".format(number),
+                "completed_at": "2024-01-01T10:01:{:02d}Z".format(number),
+            }
+            for number in range(1, steps + 1)
+        ],
+    }
+
+
+def make_workflow_run():
+    repository = {
+        "id": 1,
+        "name": "r",
+        "full_name": "o/r",
+        "private": True,
+        "owner": {"login": "o", "id": 2, "type": "Organization", "site_admin": False},
+        "html_url": "https://github.com/o/r",
+    }
+    return {
+        "id": 987654321,
+        "name": "CI",
+        "head_branch": "main",
+        "head_sha": "0123456789abcdef0123456789abcdef01234567",
+        "path": ".github/workflows/ci.yaml",
+        "run_number": 100,
+        "event": "push",
+        "status": "completed",
+        "conclusion": "success",
+        "workflow_id": 5,
+        "created_at": "2024-01-01T10:00:00Z",
+        "updated_at": "2024-01-01T10:15:00Z",
+        "run_started_at": "2024-01-01T10:00:00Z",
+        "actor": {"login": "dev", "id": 3, "type": "User", "site_admin": False},
+        "pull_requests": [],
+        "head_commit": {
+            "id": "0123456789abcdef0123456789abcdef01234567",
+            "message": "Fix things",
+            "timestamp": "2024-01-01T09:59:00Z",
+            "author": {"name": "Dev", "email": "dev@example.com"},
+        },
+        "repository": repository,
+        "head_repository": repository,
+    }
+
+
+# The implementation parse_attributes replaced, kept verbatim for comparison
+def legacy_parse_attributes(obj, att_to_drop, otype):
+    obj_atts = {}
+    attributes_to_drop = []
+    # todo
+    # if "GHA_ATTRIBUTES_DROP" in os.environ:
+    #     try:
+    #         if os.getenv("GHA_ATTRIBUTES_DROP") != "":
+    #             user_attributes_to_drop =str(os.getenv("GHA_ATTRIBUTES_DROP")).lower().split(",")
+    #             for attribute in user_attributes_to_drop:
+    #                 attributes_to_drop.append(attribute)
+    #     except:
+    #         print("Unable to parse GHA_ATTRIBUTES_DROP, check your configuration")
+    for attribute in list(obj):
+        attribute_name = str(attribute).lower()
+        if attribute_name.endswith("_at"):
+            if obj["conclusion"] == "skipped" or obj["conclusion"] == "cancelled":
+                pass
+            else:
+                new_Att_name = attribute_name + "_ms"
+                obj_atts[new_Att_name] = do_time_ms(obj[attribute])
+
+        if attribute_name not in attributes_to_drop:
+            if do_parse(obj[attribute]):
+                if type(obj[attribute]) is dict:
+                    for sub_att in obj[attribute]:
+                        attribute_name = do_string(attribute) + "." + do_string(sub_att)
+                        if attribute_name not in attributes_to_drop:
+                            if type(obj[attribute][sub_att]) is dict:
+                                for att in obj[attribute][sub_att]:
+                                    attribute_name = (
+                                        do_string(attribute)
+                                        + "."
+                                        + do_string(sub_att)
+                                        + "."
+                                        + do_string(att)
+                                    )
+                                    if attribute_name not in attributes_to_drop:
+                                        obj_atts[attribute_name] = str(
+                                            obj[attribute][sub_att][att]
+                                        )
+                                        if attribute_name.endswith("_at"):
+                                            if (
+                                                obj["conclusion"] == "skipped"
+                                                or obj["conclusion"] == "cancelled"
+                                            ):
+                                                pass
+                                            else:
+                                                new_Att_name = attribute_name + "_ms"
+                                                obj_atts[new_Att_name] = do_time_ms(
+                                                    obj[attribute][sub_att][att]
+                                                )
+
+                            elif type(obj[attribute][sub_att]) is list:
+                                for key in obj[attribute][sub_att]:
+                                    if type(key) is dict:
+                                        for att in key:
+                                            if do_parse(key[att]):
+                                                attribute_name = (
+                                                    do_string(attribute)
+                                                    + "."
+                                                    + do_string(sub_att)
+                                                    + "."
+                                                    + do_string(att)
+                                                )
+                                                if (
+                                                    attribute_name
+                                                    not in attributes_to_drop
+                                                ):
+                                                    obj_atts[attribute_name] = str(
+                                                        key[att]
+                                                    )
+                                                    if attribute_name.endswith("_at"):
+                                                        if (
+                                                            obj["conclusion"]
+                                                            == "skipped"
+                                                            or obj["conclusion"]
+                                                            == "cancelled"
+                                                        ):
+                                                            pass
+                                                        else:
+                                                            new_Att_name = (
+                                                                attribute_name + "_ms"
+                                                            )
+                                                            obj_atts[new_Att_name] = (
+                                                                do_time_ms(key[att])
+                                                            )
+
+                                    else:
+                                        attribute_name = (
+                                            do_string(attribute)
+                                            + "."
+                                            + do_string(sub_att)
+                                        )
+                                        if attribute_name not in attributes_to_drop:
+                                            obj_atts[attribute_name] = str(key)
+                                            if attribute_name.endswith("_at"):
+                                                if (
+                                                    obj["conclusion"] == "skipped"
+                                                    or obj["conclusion"] == "cancelled"
+                                                ):
+                                                    pass
+                                                else:
+                                                    new_Att_name = (
+                                                        attribute_name + "_ms"
+                                                    )
+                                                    obj_atts[new_Att_name] = do_time_ms(
+                                                        key
+                                                    )
+
+                            else:
+                                attribute_name = (
+                                    do_string(attribute) + "." + do_string(sub_att)
+                                )
+                                if attribute_name not in attributes_to_drop:
+                                    obj_atts[attribute_name] = str(
+                                        obj[attribute][sub_att]
+                                    )
+                                    if attribute_name.endswith("_at"):
+                                        if (
+                                            obj["conclusion"] == "skipped"
+                                            or obj["conclusion"] == "cancelled"
+                                        ):
+                                            pass
+                                        else:
+                                            new_Att_name = attribute_name + "_ms"
+                                            obj_atts[new_Att_name] = do_time_ms(
+                                                obj[attribute][sub_att]
+                                            )
+
+                elif type(obj[attribute]) is list:
+                    for key in obj[attribute]:
+                        if type(key) is dict:
+                            for att in key:
+                                if do_parse(key[att]):
+                                    attribute_name = (
+                                        do_string(attribute) + "." + do_string(att)
+                                    )
+                                    if attribute_name not in attributes_to_drop:
+                                        obj_atts[attribute_name] = str(key[att])
+                                        if attribute_name.endswith("_at"):
+                                            if (
+                                                obj["conclusion"] == "skipped"
+                                                or obj["conclusion"] == "cancelled"
+                                            ):
+                                                pass
+                                            else:
+                                                new_Att_name = attribute_name + "_ms"
+                                                obj_atts[new_Att_name] = do_time_ms(
+                                                    key[att]
+                                                )
+                else:
+                    if do_parse(obj[attribute]):
+                        attribute_name = do_string(attribute)
+                        if attribute_name not in attributes_to_drop:
+                            obj_atts[attribute_name] = str(obj[attribute])
+                            if attribute_name.endswith("_at"):
+                                if (
+                                    obj["conclusion"] == "skipped"
+                                    or obj["conclusion"] == "cancelled"
+                                ):
+                                    pass
+                                else:
+                                    new_Att_name = attribute_name + "_ms"
+                                    obj_atts[new_Att_name] = do_time_ms(obj[attribute])
+    return obj_atts
+
+
+def main(iterations):
+    cases = [
+        ("workflow run", make_workflow_run(), "", "workflow"),
+        ("job", make_job(), "steps", "job"),
+        ("step", make_job()["steps"][0], "", "step"),
+    ]
+    print("{:<14}{:>14}{:>14}{:>10}".format("object", "legacy us", "new us", "speedup"))
+    for name, obj, att_to_drop, otype in cases:
+        legacy = timeit.timeit(
+            lambda: legacy_parse_attributes(obj, att_to_drop, otype), number=iterations
+        )
+        new = timeit.timeit(
+            lambda: parse_attributes(obj, att_to_drop, otype), number=iterations
+        )
+        print(
+            "{:<14}{:>14.1f}{:>14.1f}{:>9.1f}x".format(
+                name,
+                legacy / iterations * 1e6,
+                new / iterations * 1e6,
+                legacy / new,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,78 @@
+"""Start-up benchmark: exporter import time and time to the first GitHub API call.
+
+Each sample runs the exporter in a fresh interpreter with the GitHub session
+replaced by a stub that records the first request and exits, so no network
+access is needed. Track the medians for regressions.
+
+Run from src/: python -m benchmarks.bench_startup [samples]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DRIVER = """
+import json, os, time
+start = time.perf_counter()
+import exporter
+imported = time.perf_counter()
+import lib.github_api
+
+
+class FirstCallSession:
+    def get(self, url, **kwargs):
+        now = time.perf_counter()
+        print(json.dumps({
+            "import_ms": (imported - start) * 1000,
+            "first_call_ms": (now - start) * 1000,
+            "modules": len(__import__("sys").modules),
+        }))
+        os._exit(0)
+
+
+lib.github_api.get_session = FirstCallSession
+exporter.main()
+"""
+
+ENV = {
+    "GHA_TOKEN": "token",
+    "NEW_RELIC_LICENSE_KEY": "key",
+    "GHA_RUN_ID": "1",
+    "GHA_RUN_NAME": "CI",
+    "GITHUB_REPOSITORY": "o/r",
+    "GITHUB_REPOSITORY_OWNER": "o",
+    "GITHUB_API_URL": "https://api.github.invalid",
+}
+
+
+def sample():
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", DRIVER],
+        env=dict(os.environ, **ENV),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main(samples):
+    results = [sample() for _ in range(samples)]
+    for key in ("import_ms", "first_call_ms", "process_ms"):
+        values = [r[key] for r in results]
+        print(
+            "{:<14} median {:8.1f} ms   min {:8.1f} ms".format(
+                key, statistics.median(values), min(values)
+            )
+        )
+    print("{:<14} {:8d}".format("modules", results[-1]["modules"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
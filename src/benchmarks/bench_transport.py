@@ -0,0 +1,75 @@
+"""OTLP transport benchmark: bytes on the wire and export time per protocol and compression.
+
+Exports the same synthetic workflow run once for every combination of
+OTEL_EXPORTER_OTLP_PROTOCOL and OTEL_EXPORTER_OTLP_COMPRESSION, to an
+in-process collector behind a TCP proxy that counts the bytes sent.
+
+Run from src/: python -m benchmarks.bench_transport --jobs 10 --steps 10 --lines 500
+"""
+import argparse
+
+from benchmarks.bench_export import run_benchmark
+from benchmarks.otlp_sink import ByteCountingProxy, OtlpHttpSink, OtlpSink
+from benchmarks.synthetic import SyntheticRun
+
+SINKS = {"grpc": OtlpSink, "http/protobuf": OtlpHttpSink}
+COMPRESSIONS = ("none", "gzip")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    run = SyntheticRun(jobs=args.jobs, steps=args.steps, lines_per_step=args.lines)
+    run.log_zip()
+
+    results = []
+    for protocol, sink_class in SINKS.items():
+        for compression in COMPRESSIONS:
+            sink = sink_class().start()
+            proxy = ByteCountingProxy(sink.endpoint).start()
+            try:
+                timer = run_benchmark(
+                    run,
+                    proxy.endpoint,
+                    args.workers,
+                    settings={
+                        "OTEL_EXPORTER_OTLP_PROTOCOL": protocol,
+                        "OTEL_EXPORTER_OTLP_COMPRESSION": compression,
+                    },
+                )
+            finally:
+                proxy.stop()
+                sink.stop()
+            results.append((protocol, compression, proxy.bytes_sent, timer, sink))
+
+    print(
+        "jobs={} steps={} lines/step={} -> {} log lines".format(
+            args.jobs, args.steps, args.lines, run.log_lines
+        )
+    )
+    print(
+        "{:<15}{:<8}{:>14}{:>10}{:>10}{:>10}{:>12}".format(
+            "protocol", "compr.", "wire bytes", "ratio", "export s", "flush s", "log records"
+        )
+    )
+    for protocol, compression, wire_bytes, timer, sink in results:
+        print(
+            "{:<15}{:<8}{:>14d}{:>10.2f}{:>10.3f}{:>10.3f}{:>12d}".format(
+                protocol,
+                compression,
+                wire_bytes,
+                wire_bytes / max(sink.bytes, 1),
+                timer.seconds["export"],
+                timer.seconds["flush"],
+                sink.log_records,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""In-process OTLP collector stand-ins that count what they receive."""
+import gzip
+import socket
+import threading
+import zlib
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2, logs_service_pb2_grpc
+from opentelemetry.proto.collector.metrics.v1 import (
+    metrics_service_pb2,
+    metrics_service_pb2_grpc,
+)
+from opentelemetry.proto.collector.trace.v1 import (
+    trace_service_pb2,
+    trace_service_pb2_grpc,
+)
+
+
+class _Counts:
+    def __init__(self):
+        self.spans = 0
+        self.log_records = 0
+        self.metrics = 0
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.endpoint = None
+
+    def count(self, request):
+        with self._lock:
+            self.requests += 1
+            self.bytes += request.ByteSize()
+            if isinstance(request, trace_service_pb2.ExportTraceServiceRequest):
+                for resource_spans in request.resource_spans:
+                    for scope_spans in resource_spans.scope_spans:
+                        self.spans += len(scope_spans.spans)
+            elif isinstance(request, metrics_service_pb2.ExportMetricsServiceRequest):
+                for resource_metrics in request.resource_metrics:
+                    for scope_metrics in resource_metrics.scope_metrics:
+                        self.metrics += len(scope_metrics.metrics)
+            else:
+                for resource_logs in request.resource_logs:
+                    for scope_logs in resource_logs.scope_logs:
+                        self.log_records += len(scope_logs.log_records)
+
+
+class OtlpSink(
+    _Counts,
+    trace_service_pb2_grpc.TraceServiceServicer,
+    logs_service_pb2_grpc.LogsServiceServicer,
+    metrics_service_pb2_grpc.MetricsServiceServicer,
+):
+    """OTLP/gRPC collector, `bytes` counts the decoded request size."""
+
+    def __init__(self):
+        super().__init__()
+        self._server = None
+
+    def Export(self, request, context):
+        self.count(request)
+        if isinstance(request, trace_service_pb2.ExportTraceServiceRequest):
+            return trace_service_pb2.ExportTraceServiceResponse()
+        if isinstance(request, metrics_service_pb2.ExportMetricsServiceRequest):
+            return metrics_service_pb2.ExportMetricsServiceResponse()
+        return logs_service_pb2.ExportLogsServiceResponse()
+
+    def start(self):
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        trace_service_pb2_grpc.add_TraceServiceServicer_to_server(self, self._server)
+        logs_service_pb2_grpc.add_LogsServiceServicer_to_server(self, self._server)
+        metrics_service_pb2_grpc.add_MetricsServiceServicer_to_server(self, self._server)
+        port = self._server.add_insecure_port("127.0.0.1:0")
+        self._server.start()
+        self.endpoint = "http://127.0.0.1:{}".format(port)
+        return self
+
+    def stop(self):
+        self._server.stop(grace=None)
+
+
+HTTP_REQUESTS = {
+    "/v1/traces": (
+        trace_service_pb2.ExportTraceServiceRequest,
+        trace_service_pb2.ExportTraceServiceResponse,
+    ),
+    "/v1/logs": (
+        logs_service_pb2.ExportLogsServiceRequest,
+        logs_service_pb2.ExportLogsServiceResponse,
+    ),
+    "/v1/metrics": (
+        metrics_service_pb2.ExportMetricsServiceRequest,
+        metrics_service_pb2.ExportMetricsServiceResponse,
+    ),
+}
+
+
+class OtlpHttpSink(_Counts):
+    """OTLP/HTTP-protobuf collector, `bytes` counts the decoded request size."""
+
+    def __init__(self):
+        super().__init__()
+        self._server = None
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                messages = HTTP_REQUESTS.get(self.path)
+                if messages is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                encoding = self.headers.get("Content-Encoding")
+                if encoding == "gzip":
+                    body = gzip.decompress(body)
+                elif encoding == "deflate":
+                    body = zlib.decompress(body)
+                sink.count(messages[0].FromString(body))
+                payload = messages[1]().SerializeToString()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-protobuf")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.endpoint = "http://127.0.0.1:{}".format(self._server.server_port)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class ByteCountingProxy:
+    """TCP proxy in front of a sink, counts the bytes the exporter puts on the wire."""
+
+    def __init__(self, target_endpoint):
+        self._target = ("127.0.0.1", int(target_endpoint.rsplit(":", 1)[1]))
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self.endpoint = None
+
+    def start(self):
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.endpoint = "http://127.0.0.1:{}".format(self._listener.getsockname()[1])
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self._target)
+            threading.Thread(
+                target=self._pump, args=(client, upstream, "bytes_sent"), daemon=True
+            ).start()
+            threading.Thread(
+                target=self._pump, args=(upstream, client, "bytes_received"), daemon=True
+            ).start()
+
+    def _pump(self, source, destination, counter):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                with self._lock:
+                    setattr(self, counter, getattr(self, counter) + len(data))
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, destination):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self._listener.close()
@@ -0,0 +1,194 @@
+"""Synthetic workflow runs and an offline stand-in for the GitHub REST API."""
+import io
+import json
+import re
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+START = datetime(2024, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+PREVIOUS_SHA = "fedcba9876543210fedcba9876543210fedcba98"
+
+LOG_MESSAGES = (
+    "npm WARN deprecated inflight@1.0.6: This module is not supported",
+    "added 1342 packages, and audited 1343 packages in 21s",
+    "PASS src/components/__tests__/Button.test.tsx (5.123 s)",
+    "##[group]Run actions/setup-node@v4",
+    "##[endgroup]",
+    "##[warning]Node.js 16 actions are deprecated.",
+    "##[notice]Cache restored from key: node-cache-Linux-npm",
+    "##[debug]Evaluating condition for step: 'Run tests'",
+)
+
+
+def api_time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def log_time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f") + "0Z"
+
+
+class SyntheticRun:
+    """A completed workflow run with jobs x steps and lines_per_step log lines."""
+
+    def __init__(self, jobs=10, steps=10, lines_per_step=100, run_id=1000, error_every=0):
+        self.run_id = run_id
+        self.jobs = []
+        self.log_lines = 0
+        self.log_groups = 0
+        moment = START
+        for job_index in range(jobs):
+            job_start = moment
+            steps_payload = []
+            for step_index in range(steps):
+                step_start = moment
+                moment += timedelta(seconds=5)
+                steps_payload.append(
+                    {
+                        "name": "Step {}".format(step_index + 1),
+                        "status": "completed",
+                        "conclusion": "success",
+                        "number": step_index + 1,
+                        "started_at": api_time(step_start),
+                        "completed_at": api_time(moment),
+                    }
+                )
+            self.jobs.append(
+                {
+                    "id": run_id * 1000 + job_index,
+                    "run_id": run_id,
+                    "workflow_name": "CI",
+                    "head_branch": "main",
+                    "run_attempt": 1,
+                    "head_sha": "0123456789abcdef0123456789abcdef01234567",
+                    "status": "completed",
+                    "conclusion": "success",
+                    "created_at": api_time(job_start),
+                    "started_at": api_time(job_start),
+                    "completed_at": api_time(moment),
+                    "name": "job-{}".format(job_index),
+                    "labels": ["ubuntu-latest"],
+                    "runner_name": "GitHub Actions {}".format(job_index),
+                    "runner_group_name": "GitHub Actions",
+                    "steps": steps_payload,
+                }
+            )
+        self.lines_per_step = lines_per_step
+        self.error_every = error_every
+        self.workflow_run = {
+            "id": run_id,
+            "name": "CI",
+            "head_branch": "main",
+            "head_sha": "0123456789abcdef0123456789abcdef01234567",
+            "run_number": 1,
+            "run_attempt": 1,
+            "event": "push",
+            "status": "completed",
+            "conclusion": "success",
+            "created_at": api_time(START),
+            "run_started_at": api_time(START),
+            "updated_at": api_time(moment),
+            "actor": {"login": "dev", "id": 3, "type": "User"},
+            "head_commit": {"id": "0123456789abcdef", "message": "Benchmark"},
+            "repository": {"id": 1, "full_name": "o/r", "private": True},
+        }
+        self._log_zip = None
+
+    def step_log(self, job, step):
+        # Lines start a second into the step, as they do on a runner, so a job
+        # log can be split into steps by timestamp
+        moment = datetime.strptime(step["started_at"], "%Y-%m-%dT%H:%M:%SZ")
+        moment += timedelta(seconds=1)
+        lines = []
+        for index in range(self.lines_per_step):
+            if self.error_every and index % self.error_every == self.error_every - 1:
+                message = "##[error]Process completed with exit code 1."
+            else:
+                message = LOG_MESSAGES[index % len(LOG_MESSAGES)]
+            moment += timedelta(microseconds=min(1500, 3000000 // max(self.lines_per_step, 1)))
+            lines.append(log_time(moment) + " " + message + "\n")
+        return "".join(lines)
+
+    def job_log(self, job_id):
+        """The plain text log of one job, as served by /actions/jobs/{id}/logs."""
+        job = next(job for job in self.jobs if job["id"] == job_id)
+        return "".join(self.step_log(job, step) for step in job["steps"])
+
+    def log_zip(self):
+        """The run log archive in GitHub's "<job>/<number>_<step>.txt" layout."""
+        if self._log_zip is None:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+                for job in self.jobs:
+                    for step in job["steps"]:
+                        zf.writestr(
+                            "{}/{}_{}.txt".format(job["name"], step["number"], step["name"]),
+                            self.step_log(job, step),
+                        )
+                        self.log_lines += self.lines_per_step
+                        self.log_groups += sum(
+                            1
+                            for index in range(self.lines_per_step)
+                            if LOG_MESSAGES[index % len(LOG_MESSAGES)].startswith("##[group]")
+                        )
+            self._log_zip = buffer.getvalue()
+        return self._log_zip
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = body
+        self.text = body.decode("utf-8", "replace")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError("HTTP {}".format(self.status_code))
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeGithubSession:
+    """Answers the GitHub REST calls the exporter makes from SyntheticRun data."""
+
+    def __init__(self, run):
+        self.run = run
+        self.calls = 0
+
+    def get(self, url, headers=None, params=None, timeout=None, stream=False):
+        self.calls += 1
+        params = params or {}
+        path = re.sub(r"^.*/repos/[^/]+/[^/]+", "", url)
+        if path.startswith("/actions/jobs/") and path.endswith("/logs"):
+            job_id = int(path.split("/")[3])
+            return FakeResponse(self.run.job_log(job_id).encode("utf-8"))
+        if path.endswith("/logs"):
+            return FakeResponse(self.run.log_zip())
+        if path.endswith("/jobs"):
+            per_page, page = params.get("per_page", 30), params.get("page", 1)
+            jobs = self.run.jobs[(page - 1) * per_page : page * per_page]
+            payload = {"total_count": len(self.run.jobs), "jobs": jobs}
+        elif path == "":
+            payload = {"full_name": "o/r", "default_branch": "main"}
+        elif path == "/actions/runs":
+            previous = dict(self.run.workflow_run, id=self.run.run_id - 1, head_sha=PREVIOUS_SHA)
+            payload = {"total_count": 2, "workflow_runs": [self.run.workflow_run, previous]}
+        elif path.startswith("/actions/runs/"):
+            payload = self.run.workflow_run
+        elif path.startswith("/compare/"):
+            payload = {"total_commits": 1, "commits": [{"sha": self.run.workflow_run["head_sha"]}]}
+        else:
+            return FakeResponse(b"{}", status_code=404)
+        return FakeResponse(json.dumps(payload).encode("utf-8"))
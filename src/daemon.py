@@ -0,0 +1,246 @@
+"""Long running exporter that exports many workflow runs per process.
+
+Completed workflow runs arrive as workflow_run webhooks on a local HTTP
+endpoint, or as lines appended to a queue file, and are exported by a pool
+of workers that share the GitHub client, HTTP sessions and OTLP pipelines.
+"""
+import argparse
+import collections
+import hashlib
+import hmac
+import json
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from exporter import configure_debug, export_and_flush
+from lib.config import Config
+from lib.github_api import GithubApi
+from lib.otel import shutdown_providers
+from lib.rate_limit import get_scheduler
+
+
+class RunQueue:
+    """FIFO of (run id, run name, offset) that ignores runs already waiting.
+
+    The offset is that of the end of the queue file line the run was read
+    from, None for webhooks.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def put(self, run_id, run_name=None, offset=None):
+        with self._lock:
+            if run_id in self._pending:
+                return False
+            self._pending.add(run_id)
+        self._queue.put((run_id, run_name, offset))
+        return True
+
+    def get(self, timeout=None):
+        run_id, run_name, offset = self._queue.get(timeout=timeout)
+        with self._lock:
+            self._pending.discard(run_id)
+        return run_id, run_name, offset
+
+
+def parse_webhook(headers, body):
+    """Return (run id, run name) for a completed workflow_run webhook.
+
+    Returns None for other events. Raises PermissionError when a webhook
+    secret is configured and the signature does not match, and ValueError
+    for payloads that are not JSON.
+    """
+    if Config.GHA_WEBHOOK_SECRET:
+        expected = "sha256=" + hmac.new(
+            Config.GHA_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256
+        ).hexdigest()
+        if not hmac.compare_digest(expected, headers.get("X-Hub-Signature-256", "")):
+            raise PermissionError("Invalid webhook signature")
+
+    if headers.get("X-GitHub-Event") != "workflow_run":
+        return None
+    payload = json.loads(body)
+    if payload.get("action") != "completed":
+        return None
+    repository = payload.get("repository", {}).get("full_name")
+    if repository != Config.GHA_SERVICE_NAME:
+        print("Ignoring workflow run from repository ->", repository)
+        return None
+
+    workflow_run = payload["workflow_run"]
+    return str(workflow_run["id"]), workflow_run.get("name")
+
+
+def make_webhook_handler(run_queue):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                run = parse_webhook(self.headers, body)
+            except PermissionError:
+                self.send_response(401)
+                self.end_headers()
+                return
+            except (ValueError, KeyError):
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            if run is not None and run_queue.put(*run):
+                print("Queued workflow run ->", run[1], "run id ->", run[0])
+                self.send_response(202)
+            else:
+                self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+class QueueFileProgress:
+    """Offset of a queue file up to which every run read was exported.
+
+    The offset is kept in path + ".offset". Runs are exported concurrently
+    and out of order, so the offset only moves past a line once the runs of
+    that line and of every line before it are done. Runs still queued or
+    being exported when the daemon stops are read again after a restart.
+    """
+
+    def __init__(self, path):
+        self.path = path + ".offset"
+        self.offset = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.offset = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            pass
+        # End offsets of the lines read and not done yet, in file order
+        self._reading = collections.deque()
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def read(self, offset):
+        with self._lock:
+            self._reading.append(offset)
+
+    def done(self, offset):
+        with self._lock:
+            self._done.add(offset)
+            moved = False
+            while self._reading and self._reading[0] in self._done:
+                self._done.discard(self._reading[0])
+                self.offset = self._reading.popleft()
+                moved = True
+            if moved:
+                with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(str(self.offset))
+                os.replace(self.path + ".tmp", self.path)
+
+
+def follow_queue_file(path, run_queue, stop, progress):
+    """Queue runs from lines "<run id> [run name]" appended to path.
+
+    Reading starts at the offset saved by progress, so a restarted daemon
+    only queues the lines whose runs were not exported yet.
+    """
+    with open(path, "a+b") as f:
+        offset = progress.offset
+        if offset > f.seek(0, 2):
+            # The queue file was truncated or replaced, start over
+            offset = progress.offset = 0
+        f.seek(offset)
+        while not stop.is_set():
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # Wait for the rest of a line still being written
+                f.seek(offset)
+                time.sleep(1)
+                continue
+            offset += len(line)
+            progress.read(offset)
+            fields = line.decode("utf-8").strip().split(" ", 1)
+            run_name = fields[1] if len(fields) > 1 else None
+            # A blank line, or a run already queued by an earlier line, is done
+            if not (fields[0] and run_queue.put(fields[0], run_name, offset)):
+                progress.done(offset)
+
+
+def export_worker(api, run_queue, stop, progress=None):
+    while not stop.is_set():
+        try:
+            run_id, run_name, offset = run_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        # A fresh working directory per run keeps concurrent log files apart
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                export_and_flush(api, run_id, run_name, workdir)
+            except Exception as e:
+                print("Unable to export workflow run", run_id, "<- due to error", e)
+        if offset is not None:
+            progress.done(offset)
+        print("GitHub API usage ->", get_scheduler().stats())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default=Config.GHA_DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=Config.GHA_DAEMON_PORT)
+    parser.add_argument("--workers", type=int, default=Config.GHA_DAEMON_WORKERS)
+    parser.add_argument(
+        "--queue-file",
+        help="Read run ids from this file instead of listening for webhooks",
+    )
+    args = parser.parse_args(argv)
+
+    Config.check_env_vars(single_run=False)
+    configure_debug()
+
+    # docker stop sends SIGTERM, shut down as on Ctrl-C so queued data is flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    api = GithubApi()
+    run_queue = RunQueue()
+    stop = threading.Event()
+    progress = QueueFileProgress(args.queue_file) if args.queue_file else None
+    workers = [
+        threading.Thread(target=export_worker, args=(api, run_queue, stop, progress))
+        for _ in range(max(args.workers, 1))
+    ]
+    for worker in workers:
+        worker.start()
+
+    server = None
+    try:
+        if args.queue_file:
+            print("Reading workflow runs from ->", args.queue_file)
+            follow_queue_file(args.queue_file, run_queue, stop, progress)
+        else:
+            server = ThreadingHTTPServer(
+                (args.host, args.port), make_webhook_handler(run_queue)
+            )
+            print("Listening for workflow_run webhooks on", args.host, args.port)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.server_close()
+        stop.set()
+        for worker in workers:
+            worker.join()
+        print("Export summary ->", shutdown_providers())
+
+
+if __name__ == "__main__":
+    main()
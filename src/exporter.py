@@ -1,202 +1,451 @@
-import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-import dateutil.parser as dp
 from opentelemetry import trace
-from opentelemetry.instrumentation.logging import LoggingInstrumentor
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 
 from lib.config import Config
 from lib.custom_parser import do_time, parse_attributes
 from lib.github_api import GithubApi
-from lib.log_parser import download_log_files, parse_log_files
-from lib.otel import create_resource_attributes, get_logger, get_tracer
-
-# Check if compulsory env variables are configured
-Config.check_env_vars()
-api = GithubApi()
-
-# Configure env variables
-# Check if debug is set
-if Config.GHA_DEBUG:
-    print("Running on DEBUG mode")
-    import http.client as http_client
-
-    http_client.HTTPConnection.debuglevel = 1
-    LoggingInstrumentor().instrument(set_logging_format=True, log_level=logging.DEBUG)
-    logging.getLogger().setLevel(logging.DEBUG)
-else:
-    pass
-
-if Config.PARSE_LOGS:
-    download_log_files()
-
-endpoint = "{}".format(Config().OTEL_EXPORTER_ENDPOINT)
-headers = "api-key={}".format(Config.NEW_RELIC_LICENSE_KEY)
-
-# Set OTEL resources
-global_attributes = {
-    SERVICE_NAME: Config.GHA_SERVICE_NAME,
-    "workflow_run_id": Config.GHA_RUN_ID,
-    "github.source": "github-exporter",
-    "github.resource.type": "span",
-}
-
-
-# Ensure we don't export data for new relic exporters
-workflow_jobs = api.get_workflow_run_jobs_by_run_id()
-workflow_run_finish_time = None
-job_lst = []
-for job in workflow_jobs:
-    if str(job["name"]).lower() not in ["new-relic-exporter"]:
-        job_lst.append(job)
-
-if len(job_lst) == 0:
-    print(
-        "No data to export, assuming this github action workflow job is a new relic exporter"
-    )
-    exit(0)
-
-workflow_run_atts = json.loads(api.get_workflow_run_by_id())
-atts = parse_attributes(workflow_run_atts, "", "workflow")
-first_job = job_lst[0] if job_lst else {}
-global_attributes["head_branch"] = first_job.get("head_branch", "unknown")
-commits_included = api.get_commits_included_in_workflow_run(
-    workflow_run_atts, global_attributes["head_branch"]
+from lib.ledger import get_ledger
+from lib.log_policy import LogPolicy, name_matches, split_patterns
+from lib.otel import (
+    create_resource_attributes,
+    export_lost,
+    flush_providers,
+    get_logger,
+    get_meter,
+    get_tracer,
+    records_lost,
+    shutdown_providers,
 )
+from lib.profiler import profiler
+from lib.rate_limit import get_scheduler
 
-if commits_included:
-    global_attributes["commit_count"] = len(commits_included)
 
-print(
-    "Processing Workflow ->",
-    Config.GHA_RUN_NAME,
-    "run id ->",
-    Config.GHA_RUN_ID,
-)
+def configure_debug():
+    # Check if debug is set
+    if Config.GHA_DEBUG:
+        print("Running on DEBUG mode")
+        import http.client as http_client
 
-PARENT_SPAN_NAME = str(Config.GHA_RUN_NAME)
-if Config.INCLUDE_ID_IN_PARENT_SPAN_NAME:
-    PARENT_SPAN_NAME = PARENT_SPAN_NAME + " - run: " + str(Config.GHA_RUN_ID)
+        from opentelemetry.instrumentation.logging import LoggingInstrumentor
 
-# Set workflow level tracer and logger
-global_resource = Resource(attributes=global_attributes)
-tracer = get_tracer(endpoint, headers, global_resource, "tracer")
+        http_client.HTTPConnection.debuglevel = 1
+        LoggingInstrumentor().instrument(
+            set_logging_format=True, log_level=logging.DEBUG
+        )
+        logging.getLogger().setLevel(logging.DEBUG)
 
-# Trace parent
-p_parent = tracer.start_span(
-    name=PARENT_SPAN_NAME,
-    attributes=atts,
-    start_time=do_time(workflow_run_atts["run_started_at"]),
-    kind=trace.SpanKind.SERVER,
-)
 
-# Jobs trace span
-# Set Jobs tracer and logger
-pcontext = trace.set_span_in_context(p_parent)
-for job in job_lst:
-    try:
-        print("Processing job ->", job["name"])
-        child_0 = tracer.start_span(
-            name=str(job["name"]),
-            context=pcontext,
-            start_time=do_time(job["started_at"]),
-            kind=trace.SpanKind.CONSUMER,
+class RunExport:
+    """The jobs of a run export_workflow_run exported, and those it failed to."""
+
+    def __init__(self, run_id, jobs=(), exported=(), failed=(), run_attempt=None):
+        self.run_id = run_id
+        self.jobs = list(jobs)
+        self.exported = list(exported)
+        self.failed = list(failed)
+        self.run_attempt = run_attempt
+
+    @property
+    def complete(self):
+        return not self.failed
+
+
+def export_workflow_run(api, run_id, run_name, workdir="."):
+    """Export one workflow run as traces, with its step logs in context.
+
+    Log files are downloaded to workdir, so concurrent runs need their own.
+    Without a run_name the workflow name from the API is used. With
+    GHA_LEDGER set, jobs exported or claimed before are skipped and the jobs
+    exported stay claimed until record_export. Returns a RunExport, its
+    spans and logs may still be queued for export.
+    """
+    # Ensure we don't export data for new relic exporters
+    workflow_jobs = api.get_workflow_run_jobs_by_run_id(run_id)
+    excluded_jobs = split_patterns(Config.GHA_EXCLUDE_JOBS)
+    job_lst = []
+    for job in workflow_jobs:
+        if not name_matches(job.name, excluded_jobs):
+            job_lst.append(job)
+
+    if len(job_lst) == 0:
+        print(
+            "No data to export, assuming this github action workflow job is a new relic exporter"
         )
-        child_0.set_attributes(
-            create_resource_attributes(  # pyright: ignore
-                parse_attributes(job, "steps", "job"), Config.GHA_SERVICE_NAME
+        return RunExport(run_id)
+
+    ledger = get_ledger()
+    claimed = job_lst
+    if ledger is not None:
+        # Jobs exported before, by an earlier attempt or another exporter, are skipped
+        claimed = ledger.claim_jobs(run_id, job_lst)
+        if not claimed:
+            print("All jobs of workflow run already exported, run id ->", run_id)
+            return RunExport(run_id, job_lst)
+        print("Exporting", len(claimed), "of", len(job_lst), "jobs not exported before")
+
+    try:
+        workflow_run, exported = _export_jobs(api, run_id, run_name, workdir, claimed)
+    except BaseException:
+        if ledger is not None:
+            ledger.finish_jobs(run_id, [], claimed)
+        raise
+    return RunExport(
+        run_id,
+        job_lst,
+        exported,
+        [job for job in claimed if job not in exported],
+        workflow_run.run_attempt,
+    )
+
+
+def record_export(run_export, flushed):
+    """Record the jobs of run_export in the ledger once their data is flushed.
+
+    When it was not, the jobs are released so the next export sends them
+    again. Returns whether every job of the run was exported and flushed.
+    """
+    ledger = get_ledger()
+    run_id = run_export.run_id
+    if ledger is not None:
+        if flushed:
+            ledger.finish_jobs(run_id, run_export.exported, run_export.failed)
+        else:
+            ledger.finish_jobs(run_id, [], run_export.exported + run_export.failed)
+        if (
+            flushed
+            and run_export.run_attempt is not None
+            and ledger.finish_run(run_id, run_export.run_attempt, run_export.jobs)
+        ):
+            print("Recorded workflow run as exported, run id ->", run_id)
+    return run_export.complete and flushed
+
+
+def export_and_flush(api, run_id, run_name, workdir="."):
+    """Export a run in a process that keeps its pipelines, then flush them.
+
+    The run is recorded with record_export, whose result is returned.
+    Pipelines are shared by concurrent runs, a record lost meanwhile counts
+    against each of them.
+    """
+    lost = records_lost()
+    run_export = export_workflow_run(api, run_id, run_name, workdir)
+    flushed = flush_providers() and records_lost() == lost
+    if not flushed:
+        print("Not all data of workflow run was exported, run id ->", run_id)
+    return record_export(run_export, flushed)
+
+
+def _download_logs(run_id, workdir, job_lst, log_policy):
+    """The log archive of the jobs and steps selected by log_policy, or None."""
+    # Only load the log parser when logs are exported
+    from lib.log_parser import LogBatchPool, download_job_logs, download_log_files
+
+    log_jobs = [job for job in job_lst if log_policy.selects_job(job)]
+    log_archive = None
+    if len(log_jobs) == len(job_lst):
+        # One archive download beats a request per job
+        log_archive = download_log_files(run_id, workdir)
+    elif log_jobs:
+        log_archive = download_job_logs(log_jobs, workdir)
+    print("Exporting logs of", len(log_jobs), "of", len(job_lst), "jobs")
+    if log_archive is not None and Config.GHA_LOG_PROCESSES:
+        try:
+            log_archive = LogBatchPool(
+                log_archive,
+                [
+                    (job.name, step.number)
+                    for job in log_jobs
+                    for step in job.steps
+                    if log_policy.selects_step(job, step)
+                ],
+                Config.GHA_LOG_PROCESSES,
             )
+        except BaseException:
+            log_archive.close()
+            raise
+    return log_archive
+
+
+def _export_jobs(api, run_id, run_name, workdir, job_lst):
+    """Export the run span and job_lst, return the run and the jobs exported."""
+    log_policy = LogPolicy.from_config()
+    log_archive = None
+    if Config.PARSE_LOGS:
+        log_archive = _download_logs(run_id, workdir, job_lst, log_policy)
+    # Worker processes and open log files go away whatever happens to the run
+    try:
+        return _export_run(api, run_id, run_name, job_lst, log_archive, log_policy)
+    finally:
+        if log_archive is not None:
+            log_archive.close()
+
+
+def _export_run(api, run_id, run_name, job_lst, log_archive, log_policy):
+    """Export the run span and job_lst with their logs from log_archive."""
+    endpoint = "{}".format(Config().OTEL_EXPORTER_ENDPOINT)
+    headers = "api-key={}".format(Config.NEW_RELIC_LICENSE_KEY)
+
+    # Set OTEL resources
+    global_attributes = {
+        SERVICE_NAME: Config.GHA_SERVICE_NAME,
+        "workflow_run_id": run_id,
+        "github.source": "github-exporter",
+        "github.resource.type": "span",
+    }
+    workflow_run_finish_time = None
+    if log_archive is not None:
+        from lib.log_parser import parse_log_files
+
+    workflow_run = api.get_workflow_run_by_id(run_id)
+    if run_name is None:
+        run_name = workflow_run.name
+    atts = parse_attributes(workflow_run.raw, "", "workflow")
+    ci_metrics = None
+    if Config.GHA_EXPORT_METRICS:
+        from lib.ci_metrics import get_ci_metrics
+
+        metrics_resource = Resource(
+            attributes={
+                SERVICE_NAME: Config.GHA_SERVICE_NAME,
+                "github.source": "github-exporter",
+            }
         )
-        p_sub_context = trace.set_span_in_context(child_0)
-
-        # Steps trace span
-        for index, step in enumerate(job["steps"]):
-            try:
-                print("Processing step ->", step["name"], "from job", job["name"])
-                # Set steps tracer and logger
-                resource_attributes = {
-                    SERVICE_NAME: Config.GHA_SERVICE_NAME,
-                    "github.source": "github-exporter",
-                    "github.resource.type": "span",
-                    "workflow_run_id": Config.GHA_RUN_ID,
-                }
-                resource_log = Resource(attributes=resource_attributes)
-                step_tracer = get_tracer(endpoint, headers, resource_log, "step_tracer")
-
-                resource_attributes.update(
-                    create_resource_attributes(
-                        parse_attributes(step, "", "step"),
-                        Config.GHA_SERVICE_NAME,
-                    )
+        ci_metrics = get_ci_metrics(
+            get_meter(endpoint, headers, metrics_resource, "meter")
+        )
+    global_attributes["head_branch"] = job_lst[0].head_branch or "unknown"
+    commit_count = api.get_commit_count_of_workflow_run(
+        workflow_run, global_attributes["head_branch"]
+    )
+
+    if commit_count:
+        global_attributes["commit_count"] = commit_count
+
+    print(
+        "Processing Workflow ->",
+        run_name,
+        "run id ->",
+        run_id,
+    )
+
+    parent_span_name = str(run_name)
+    if Config.INCLUDE_ID_IN_PARENT_SPAN_NAME:
+        parent_span_name = parent_span_name + " - run: " + str(run_id)
+
+    # Set workflow level tracer and logger
+    global_resource = Resource(attributes=global_attributes)
+    tracer = get_tracer(endpoint, headers, global_resource, "tracer")
+
+    # Trace parent
+    p_parent = tracer.start_span(
+        name=parent_span_name,
+        attributes=atts,
+        start_time=do_time(workflow_run.run_started_at),
+        kind=trace.SpanKind.SERVER,
+    )
+
+    # Jobs trace span
+    # Set Jobs tracer and logger
+    pcontext = trace.set_span_in_context(p_parent)
+
+    def export_job(job):
+        with profiler.phase("export.job", items=len(job.steps)):
+            return _export_job(job)
+
+    def _export_job(job):
+        try:
+            print("Processing job ->", job.name)
+            child_0 = tracer.start_span(
+                name=str(job.name),
+                context=pcontext,
+                start_time=do_time(job.started_at),
+                kind=trace.SpanKind.CONSUMER,
+            )
+            child_0.set_attributes(
+                create_resource_attributes(  # pyright: ignore
+                    parse_attributes(job.raw, "steps", "job"), Config.GHA_SERVICE_NAME
                 )
-                resource_log = Resource(attributes=resource_attributes)
-                job_logger = get_logger(endpoint, headers, resource_log, "job_logger")
+            )
+            p_sub_context = trace.set_span_in_context(child_0)
+
+            # Steps trace span
+            for index, step in enumerate(job.steps):
+                try:
+                    print("Processing step ->", step.name, "from job", job.name)
+                    # Set steps tracer and logger
+                    resource_attributes = {
+                        SERVICE_NAME: Config.GHA_SERVICE_NAME,
+                        "github.source": "github-exporter",
+                        "github.resource.type": "span",
+                        "workflow_run_id": run_id,
+                    }
+                    resource_log = Resource(attributes=resource_attributes)
+                    step_tracer = get_tracer(
+                        endpoint, headers, resource_log, "step_tracer"
+                    )
 
-                if step["conclusion"] == "skipped" or step["conclusion"] == "cancelled":
-                    if index >= 1:
-                        # Start time should be the previous step end time
-                        step_started_at = job["steps"][index - 1]["completed_at"]
+                    step_attributes = create_resource_attributes(
+                        parse_attributes(step.raw, "", "step"), Config.GHA_SERVICE_NAME
+                    )
+                    resource_attributes.update(step_attributes)
+                    resource_log = Resource(attributes=resource_attributes)
+                    job_logger = get_logger(
+                        endpoint, headers, resource_log, "job_logger"
+                    )
+
+                    if (
+                        step.conclusion == "skipped"
+                        or step.conclusion == "cancelled"
+                    ):
+                        if index >= 1:
+                            # Start time should be the previous step end time
+                            step_started_at = job.steps[index - 1].completed_at
+                        else:
+                            step_started_at = job.started_at
                     else:
-                        step_started_at = job["started_at"]
-                else:
-                    step_started_at = step["started_at"]
-
-                child_1 = step_tracer.start_span(
-                    name=str(step["name"]),
-                    start_time=do_time(step_started_at),
-                    context=p_sub_context,
-                    kind=trace.SpanKind.CONSUMER,
-                )
-                child_1.set_attributes(
-                    create_resource_attributes(  # pyright: ignore
-                        parse_attributes(step, "", "job"),
-                        Config.GHA_SERVICE_NAME,
+                        step_started_at = step.started_at
+
+                    child_1 = step_tracer.start_span(
+                        name=str(step.name),
+                        start_time=do_time(step_started_at),
+                        context=p_sub_context,
+                        kind=trace.SpanKind.CONSUMER,
                     )
-                )
-                with trace.use_span(child_1, end_on_exit=False):
-                    # Parse logs
-                    if Config.PARSE_LOGS:
-                        parse_log_files(
-                            job, step, child_0, child_1, job_logger, logging, dp
-                        )
-
-                if step["conclusion"] == "skipped" or step["conclusion"] == "cancelled":
-                    child_1.update_name(name=str(step["name"] + "-SKIPPED"))
-                    if index >= 1:
-                        # End time should be the previous step end time
-                        step_completed_at = job["steps"][index - 1]["completed_at"]
+                    child_1.set_attributes(step_attributes)  # pyright: ignore
+                    with trace.use_span(child_1, end_on_exit=False):
+                        # Parse logs
+                        if log_archive is not None and log_policy.selects_step(
+                            job, step
+                        ):
+                            parse_log_files(
+                                job,
+                                step,
+                                child_0,
+                                child_1,
+                                job_logger,
+                                logging,
+                                log_archive,
+                                step_tracer,
+                            )
+
+                    if (
+                        step.conclusion == "skipped"
+                        or step.conclusion == "cancelled"
+                    ):
+                        child_1.update_name(name=str(step.name) + "-SKIPPED")
+                        if index >= 1:
+                            # End time should be the previous step end time
+                            step_completed_at = job.steps[index - 1].completed_at
+                        else:
+                            step_completed_at = job.started_at
                     else:
-                        step_completed_at = job["started_at"]
-                else:
-                    step_completed_at = step["completed_at"]
+                        step_completed_at = step.completed_at
 
-                child_1.end(end_time=do_time(step_completed_at))
-                print(
-                    "Finished processing step ->", step["name"], "from job", job["name"]
-                )
-            except Exception as e:
-                print("Unable to process step ->", step["name"], "<- due to error", e)
+                    child_1.end(end_time=do_time(step_completed_at))
+                    if ci_metrics is not None:
+                        ci_metrics.record_step(step, job, workflow_run.name)
+                    print(
+                        "Finished processing step ->",
+                        step.name,
+                        "from job",
+                        job.name,
+                    )
+                except Exception as e:
+                    print(
+                        "Unable to process step ->", step.name, "<- due to error", e
+                    )
+
+            child_0.end(end_time=do_time(job.completed_at))
+            if ci_metrics is not None:
+                ci_metrics.record_job(job, workflow_run.name)
 
-        child_0.end(end_time=do_time(job.get("completed_at")))
+            print("Finished processing job ->", job.name)
+            return do_time(job.completed_at)
+        except Exception as e:
+            print("Unable to process job:", job.name, "<- due to error", e)
+        return None
 
-        workflow_run_finish_time = do_time(job.get("completed_at"))
+    # Each job is exported start to finish by a single worker, so the order of
+    # its steps and log lines does not depend on the number of workers
+    if Config.GHA_EXPORT_WORKERS > 1:
+        with ThreadPoolExecutor(max_workers=Config.GHA_EXPORT_WORKERS) as executor:
+            job_finish_times = list(executor.map(export_job, job_lst))
+    else:
+        job_finish_times = [export_job(job) for job in job_lst]
 
-        print("Finished processing job ->", job.get("name"))
-    except Exception as e:
-        print("Unable to process job:", job["name"], "<- due to error", e)
+    for job_finish_time in job_finish_times:
+        if job_finish_time:
+            workflow_run_finish_time = job_finish_time
 
-p_parent.end(
-    end_time=(
+    workflow_run_end_time = (
         workflow_run_finish_time
         if workflow_run_finish_time
-        else do_time(workflow_run_atts["updated_at"])
+        else do_time(workflow_run.updated_at)
     )
-)
-print(
-    "Finished processing Workflow ->",
-    Config.GHA_RUN_NAME,
-    "run id ->",
-    Config.GHA_RUN_ID,
-)
-print("All data exported to New Relic")
+    p_parent.end(end_time=workflow_run_end_time)
+    if ci_metrics is not None:
+        ci_metrics.record_run(
+            workflow_run,
+            do_time(workflow_run.run_started_at),
+            workflow_run_end_time,
+            api.get_default_branch(),
+        )
+    print(
+        "Finished processing Workflow ->",
+        run_name,
+        "run id ->",
+        run_id,
+    )
+    return workflow_run, [
+        job for job, finish_time in zip(job_lst, job_finish_times) if finish_time
+    ]
+
+
+def main():
+    # Check if compulsory env variables are configured
+    Config.check_env_vars()
+    configure_debug()
+    ledger = get_ledger()
+    if (
+        ledger is not None
+        and Config.GHA_RUN_ATTEMPT
+        and ledger.run_exported(Config.GHA_RUN_ID, Config.GHA_RUN_ATTEMPT)
+    ):
+        print(
+            "Workflow run",
+            Config.GHA_RUN_ID,
+            "attempt",
+            Config.GHA_RUN_ATTEMPT,
+            "already exported, nothing to do",
+        )
+        return
+    profiler.start()
+
+    api = GithubApi()
+    with profiler.phase("export.run"):
+        run_export = export_workflow_run(api, Config.GHA_RUN_ID, Config.GHA_RUN_NAME)
+    profiler.export_spans(
+        Config().OTEL_EXPORTER_ENDPOINT,
+        "api-key={}".format(Config.NEW_RELIC_LICENSE_KEY),
+        Config.GHA_RUN_ID,
+    )
+
+    with profiler.phase("otlp.flush"):
+        report = shutdown_providers()
+    profiler.stop()
+    print("GitHub API usage ->", get_scheduler().stats())
+    print("Export summary ->", report)
+    lost = export_lost(report)
+    # Jobs are only recorded in the ledger once their data reached New Relic
+    record_export(run_export, not lost)
+    if lost:
+        print("Not all data was exported to New Relic")
+        exit(1)
+    print("All data exported to New Relic")
+
+
+if __name__ == "__main__":
+    main()
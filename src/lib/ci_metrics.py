@@ -0,0 +1,101 @@
+import threading
+from weakref import WeakKeyDictionary
+
+from .custom_parser import do_time
+
+# Attributes are limited to values bounded by the workflow definitions, never
+# run ids, shas, actors or branch names, to keep the metric cardinality low
+SKIPPED = ("skipped", "cancelled")
+
+_lock = threading.Lock()
+_instruments = WeakKeyDictionary()
+
+
+def _seconds(start, end):
+    if not start or not end:
+        return None
+    seconds = (do_time(end) - do_time(start)) / 1e9
+    return seconds if seconds >= 0 else None
+
+
+class CiMetrics:
+    """Duration histograms and conclusion counters of workflow runs, jobs and steps."""
+
+    def __init__(self, meter):
+        self.run_duration = meter.create_histogram(
+            "github.workflow_run.duration",
+            unit="s",
+            description="Duration of completed workflow runs",
+        )
+        self.job_duration = meter.create_histogram(
+            "github.job.duration", unit="s", description="Duration of completed jobs"
+        )
+        self.job_queue_time = meter.create_histogram(
+            "github.job.queue_time",
+            unit="s",
+            description="Time jobs waited for a runner, started_at - created_at",
+        )
+        self.step_duration = meter.create_histogram(
+            "github.step.duration", unit="s", description="Duration of completed steps"
+        )
+        self.runs = meter.create_counter(
+            "github.workflow_run.count", description="Workflow runs by conclusion"
+        )
+        self.jobs = meter.create_counter(
+            "github.job.count", description="Jobs by conclusion"
+        )
+        self.steps = meter.create_counter(
+            "github.step.count", description="Steps by conclusion"
+        )
+
+    def record_run(self, workflow_run, start_ns, end_ns, default_branch):
+        attributes = {
+            "workflow": str(workflow_run.name),
+            "conclusion": str(workflow_run.conclusion),
+            "event": str(workflow_run.event),
+            "default_branch": default_branch is not None
+            and workflow_run.head_branch == default_branch,
+        }
+        self.runs.add(1, attributes)
+        if start_ns is not None and end_ns is not None and end_ns >= start_ns:
+            self.run_duration.record((end_ns - start_ns) / 1e9, attributes)
+
+    def record_job(self, job, workflow_name):
+        attributes = {
+            "workflow": str(workflow_name),
+            "job": str(job.name),
+            "conclusion": str(job.conclusion),
+            "runner": str(job.labels[0] if job.labels else job.runner_group_name),
+        }
+        self.jobs.add(1, attributes)
+        if job.conclusion in SKIPPED:
+            return
+        duration = _seconds(job.started_at, job.completed_at)
+        if duration is not None:
+            self.job_duration.record(duration, attributes)
+        queue_time = _seconds(job.created_at, job.started_at)
+        if queue_time is not None:
+            self.job_queue_time.record(queue_time, attributes)
+
+    def record_step(self, step, job, workflow_name):
+        attributes = {
+            "workflow": str(workflow_name),
+            "job": str(job.name),
+            "step": str(step.name),
+            "conclusion": str(step.conclusion),
+        }
+        self.steps.add(1, attributes)
+        if step.conclusion in SKIPPED:
+            return
+        duration = _seconds(step.started_at, step.completed_at)
+        if duration is not None:
+            self.step_duration.record(duration, attributes)
+
+
+def get_ci_metrics(meter):
+    """The CiMetrics of a meter, its instruments are created once."""
+    with _lock:
+        ci_metrics = _instruments.get(meter)
+        if ci_metrics is None:
+            ci_metrics = _instruments[meter] = CiMetrics(meter)
+    return ci_metrics
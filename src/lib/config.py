@@ -12,31 +12,86 @@ class Config:
     GHA_SERVICE_NAME = os.getenv("GITHUB_REPOSITORY", "")
     GITHUB_REPOSITORY_OWNER = os.getenv("GITHUB_REPOSITORY_OWNER", "")
     GHA_RUN_NAME = os.getenv("GHA_RUN_NAME")
+    GHA_RUN_ATTEMPT = os.getenv("GHA_RUN_ATTEMPT")
     GITHUB_API_URL = os.getenv("GITHUB_API_URL", "")
     PARSE_LOGS = os.getenv("PARSE_LOGS", "true").lower() == "true"
+    STREAM_LOGS = os.getenv("STREAM_LOGS", "false").lower() == "true"
+    GHA_LOG_GROUP_SPANS = os.getenv("GHA_LOG_GROUP_SPANS", "true").lower() == "true"
+    GHA_LOG_DEDUP = os.getenv("GHA_LOG_DEDUP", "false").lower() == "true"
+    GHA_LOG_MAX_LINES = int(os.getenv("GHA_LOG_MAX_LINES", "0"))
+    GHA_LOG_MAX_BYTES = int(os.getenv("GHA_LOG_MAX_BYTES", "0"))
+    GHA_LOG_CONTEXT_LINES = int(os.getenv("GHA_LOG_CONTEXT_LINES", "5"))
+    GHA_LOG_PROCESSES = max(int(os.getenv("GHA_LOG_PROCESSES", "0")), 0)
+    GHA_LOG_JOBS = os.getenv("GHA_LOG_JOBS", "*")
+    GHA_LOG_STEPS = os.getenv("GHA_LOG_STEPS", "*")
+    GHA_LOG_CONCLUSIONS = os.getenv("GHA_LOG_CONCLUSIONS", "")
+    GHA_EXCLUDE_JOBS = os.getenv("GHA_EXCLUDE_JOBS", "new-relic-exporter")
     INCLUDE_ID_IN_PARENT_SPAN_NAME = (
         os.getenv("INCLUDE_ID_IN_PARENT_SPAN_NAME", "true").lower() == "true"
     )
     GHA_DEBUG = os.getenv("GHA_DEBUG", "false").lower() == "true"
+    GHA_ATTRIBUTES_DROP = os.getenv("GHA_ATTRIBUTES_DROP", "")
+    GHA_ATTRIBUTES_MAX_DEPTH = int(os.getenv("GHA_ATTRIBUTES_MAX_DEPTH", "3"))
+    GHA_API_CONCURRENCY = max(int(os.getenv("GHA_API_CONCURRENCY", "4")), 1)
+    GHA_API_RATE = float(os.getenv("GHA_API_RATE", "10"))
+    GHA_API_RETRIES = max(int(os.getenv("GHA_API_RETRIES", "3")), 1)
+    GHA_CACHE_DIR = os.getenv("GHA_CACHE_DIR", "")
+    GHA_CACHE_MAX_BYTES = int(os.getenv("GHA_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+    GHA_EXPORT_WORKERS = max(int(os.getenv("GHA_EXPORT_WORKERS", "1")), 1)
+    OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+    OTEL_EXPORTER_FILE = os.getenv("OTEL_EXPORTER_FILE", "")
+    OTEL_EXPORTER_OTLP_PROTOCOL = os.getenv("OTEL_EXPORTER_OTLP_PROTOCOL", "grpc")
+    OTEL_EXPORTER_OTLP_COMPRESSION = os.getenv("OTEL_EXPORTER_OTLP_COMPRESSION", "gzip")
+    # Batch processor settings, under the names the OpenTelemetry SDK reads.
+    # The log queue is much larger than the SDK default of 2048, which a busy
+    # step fills faster than it is exported.
+    OTEL_BSP_MAX_QUEUE_SIZE = int(os.getenv("OTEL_BSP_MAX_QUEUE_SIZE", "2048"))
+    OTEL_BSP_MAX_EXPORT_BATCH_SIZE = int(os.getenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "512"))
+    OTEL_BSP_SCHEDULE_DELAY = int(os.getenv("OTEL_BSP_SCHEDULE_DELAY", "5000"))
+    OTEL_BLRP_MAX_QUEUE_SIZE = int(os.getenv("OTEL_BLRP_MAX_QUEUE_SIZE", "32768"))
+    OTEL_BLRP_MAX_EXPORT_BATCH_SIZE = int(
+        os.getenv("OTEL_BLRP_MAX_EXPORT_BATCH_SIZE", "1024")
+    )
+    OTEL_BLRP_SCHEDULE_DELAY = int(os.getenv("OTEL_BLRP_SCHEDULE_DELAY", "1000"))
+    GHA_EXPORT_METRICS = os.getenv("GHA_EXPORT_METRICS", "true").lower() == "true"
+    GHA_METRICS_INTERVAL = int(os.getenv("GHA_METRICS_INTERVAL", "60000"))
+    GHA_PROFILE = os.getenv("GHA_PROFILE", "")
+    GHA_PROFILE_OUTPUT = os.getenv("GHA_PROFILE_OUTPUT", "gha-profile")
+    GHA_FLUSH_TIMEOUT = float(os.getenv("GHA_FLUSH_TIMEOUT", "30"))
+    GHA_LEDGER = os.getenv("GHA_LEDGER", "")
+    GHA_DAEMON_HOST = os.getenv("GHA_DAEMON_HOST", "127.0.0.1")
+    GHA_DAEMON_PORT = int(os.getenv("GHA_DAEMON_PORT", "8080"))
+    GHA_DAEMON_WORKERS = max(int(os.getenv("GHA_DAEMON_WORKERS", "4")), 1)
+    GHA_WEBHOOK_SECRET = os.getenv("GHA_WEBHOOK_SECRET", "")
 
     @property
     def OTEL_EXPORTER_ENDPOINT(self):  # pylint: disable=invalid-name
+        if Config.OTEL_EXPORTER_FILE:
+            return "file://" + Config.OTEL_EXPORTER_FILE
+
+        return self.OTEL_COLLECTOR_ENDPOINT
+
+    @property
+    def OTEL_COLLECTOR_ENDPOINT(self):  # pylint: disable=invalid-name
+        if Config.OTEL_EXPORTER_OTLP_ENDPOINT:
+            return Config.OTEL_EXPORTER_OTLP_ENDPOINT
+
         if Config.NEW_RELIC_LICENSE_KEY.startswith("eu"):
-            return "https://otlp.eu01.nr-data.net:4318"
+            return "https://otlp.eu01.nr-data.net"
 
         return "https://otlp.nr-data.net"
 
     @staticmethod
-    def check_env_vars():
+    def check_env_vars(single_run=True):
         required_env_vars = (
             "NEW_RELIC_LICENSE_KEY",
             "GHA_TOKEN",
-            "GHA_RUN_ID",
             "GHA_SERVICE_NAME",
             "GITHUB_REPOSITORY_OWNER",
-            "GHA_RUN_NAME",
             "GITHUB_API_URL",
         )
+        if single_run:
+            required_env_vars += ("GHA_RUN_ID", "GHA_RUN_NAME")
 
         keys_not_set = []
 
@@ -1,22 +1,17 @@
-import json
 import os
-import time
+from functools import lru_cache
 
-from fastcore.xtras import obj2dict
-from pyrfc3339 import parse
-
-
-def do_fastcore_decode(obj):
-    newobj = obj2dict(obj)
-    return json.dumps(newobj)
+from .config import Config
+from .profiler import profiler
+from .timestamps import parse_timestamp_ns
 
 
 def do_time(string):
-    return int(round(time.mktime(parse(string).timetuple())) * 1000000000)
+    return parse_timestamp_ns(string)
 
 
 def do_time_ms(string):
-    return int(round(time.mktime(parse(string).timetuple())) * 1000)
+    return parse_timestamp_ns(string) // 1000000
 
 
 def do_string(string):
@@ -43,168 +38,75 @@ def check_env_vars():
         exit(1)
 
 
+# Normalized attribute name for every (parent path, key) pair seen so far.
+# Workflow, job and step payloads share one small schema, so after the first
+# object this turns every do_string call into a dict lookup.
+_key_paths = {}
+
+
+def _key_path(prefix, key):
+    path = _key_paths.get((prefix, key))
+    if path is None:
+        path = prefix + "." + do_string(key) if prefix else do_string(key)
+        _key_paths[(prefix, key)] = path
+    return path
+
+
+@lru_cache(maxsize=None)
+def _drop_set(att_to_drop):
+    drop = set()
+    for attribute in (Config.GHA_ATTRIBUTES_DROP + "," + att_to_drop).split(","):
+        if do_string(attribute):
+            drop.add(do_string(attribute))
+    return frozenset(drop)
+
+
+def _add_leaf(obj_atts, path, value, add_ms):
+    if do_parse(value):
+        obj_atts[path] = str(value)
+        if add_ms and path.endswith("_at") and isinstance(value, str):
+            obj_atts[path + "_ms"] = do_time_ms(value)
+
+
+def _walk_dict(obj, prefix, depth, ctx):
+    obj_atts, drop, max_depth, add_ms = ctx
+    for key, value in obj.items():
+        path = _key_path(prefix, key)
+        # Dropped paths prune their whole subtree
+        if path in drop:
+            continue
+        walker = _WALKERS.get(type(value)) if depth < max_depth else None
+        if walker is None:
+            _add_leaf(obj_atts, path, value, add_ms)
+        else:
+            walker(value, path, depth + 1, ctx)
+
+
+def _walk_list(items, prefix, depth, ctx):
+    # List items are flattened under the list's own name, later items win
+    for item in items:
+        if type(item) is dict:
+            _walk_dict(item, prefix, depth, ctx)
+        else:
+            _add_leaf(ctx[0], prefix, item, ctx[3])
+
+
+# Nested value types that are walked rather than stored as a string
+_WALKERS = {dict: _walk_dict, list: _walk_list}
+
+
+@profiler.timed("attributes", count=len)
 def parse_attributes(obj, att_to_drop, otype):
+    """Flatten a GitHub API object into dotted, lower case span attributes.
+
+    Nested dicts and lists are walked up to GHA_ATTRIBUTES_MAX_DEPTH levels,
+    deeper values are stored as strings. Paths in att_to_drop and
+    GHA_ATTRIBUTES_DROP (comma separated) are skipped with their subtrees.
+    Every "_at" timestamp also gets an "_at_ms" epoch milliseconds copy
+    unless the object was skipped or cancelled.
+    """
     obj_atts = {}
-    attributes_to_drop = []
-    # todo
-    # if "GHA_ATTRIBUTES_DROP" in os.environ:
-    #     try:
-    #         if os.getenv("GHA_ATTRIBUTES_DROP") != "":
-    #             user_attributes_to_drop =str(os.getenv("GHA_ATTRIBUTES_DROP")).lower().split(",")
-    #             for attribute in user_attributes_to_drop:
-    #                 attributes_to_drop.append(attribute)
-    #     except:
-    #         print("Unable to parse GHA_ATTRIBUTES_DROP, check your configuration")
-    for attribute in list(obj):
-        attribute_name = str(attribute).lower()
-        if attribute_name.endswith("_at"):
-            if obj["conclusion"] == "skipped" or obj["conclusion"] == "cancelled":
-                pass
-            else:
-                new_Att_name = attribute_name + "_ms"
-                obj_atts[new_Att_name] = do_time_ms(obj[attribute])
-
-        if attribute_name not in attributes_to_drop:
-            if do_parse(obj[attribute]):
-                if type(obj[attribute]) is dict:
-                    for sub_att in obj[attribute]:
-                        attribute_name = do_string(attribute) + "." + do_string(sub_att)
-                        if attribute_name not in attributes_to_drop:
-                            if type(obj[attribute][sub_att]) is dict:
-                                for att in obj[attribute][sub_att]:
-                                    attribute_name = (
-                                        do_string(attribute)
-                                        + "."
-                                        + do_string(sub_att)
-                                        + "."
-                                        + do_string(att)
-                                    )
-                                    if attribute_name not in attributes_to_drop:
-                                        obj_atts[attribute_name] = str(
-                                            obj[attribute][sub_att][att]
-                                        )
-                                        if attribute_name.endswith("_at"):
-                                            if (
-                                                obj["conclusion"] == "skipped"
-                                                or obj["conclusion"] == "cancelled"
-                                            ):
-                                                pass
-                                            else:
-                                                new_Att_name = attribute_name + "_ms"
-                                                obj_atts[new_Att_name] = do_time_ms(
-                                                    obj[attribute][sub_att][att]
-                                                )
-
-                            elif type(obj[attribute][sub_att]) is list:
-                                for key in obj[attribute][sub_att]:
-                                    if type(key) is dict:
-                                        for att in key:
-                                            if do_parse(key[att]):
-                                                attribute_name = (
-                                                    do_string(attribute)
-                                                    + "."
-                                                    + do_string(sub_att)
-                                                    + "."
-                                                    + do_string(att)
-                                                )
-                                                if (
-                                                    attribute_name
-                                                    not in attributes_to_drop
-                                                ):
-                                                    obj_atts[attribute_name] = str(
-                                                        key[att]
-                                                    )
-                                                    if attribute_name.endswith("_at"):
-                                                        if (
-                                                            obj["conclusion"]
-                                                            == "skipped"
-                                                            or obj["conclusion"]
-                                                            == "cancelled"
-                                                        ):
-                                                            pass
-                                                        else:
-                                                            new_Att_name = (
-                                                                attribute_name + "_ms"
-                                                            )
-                                                            obj_atts[new_Att_name] = (
-                                                                do_time_ms(key[att])
-                                                            )
-
-                                    else:
-                                        attribute_name = (
-                                            do_string(attribute)
-                                            + "."
-                                            + do_string(sub_att)
-                                        )
-                                        if attribute_name not in attributes_to_drop:
-                                            obj_atts[attribute_name] = str(key)
-                                            if attribute_name.endswith("_at"):
-                                                if (
-                                                    obj["conclusion"] == "skipped"
-                                                    or obj["conclusion"] == "cancelled"
-                                                ):
-                                                    pass
-                                                else:
-                                                    new_Att_name = (
-                                                        attribute_name + "_ms"
-                                                    )
-                                                    obj_atts[new_Att_name] = do_time_ms(
-                                                        key
-                                                    )
-
-                            else:
-                                attribute_name = (
-                                    do_string(attribute) + "." + do_string(sub_att)
-                                )
-                                if attribute_name not in attributes_to_drop:
-                                    obj_atts[attribute_name] = str(
-                                        obj[attribute][sub_att]
-                                    )
-                                    if attribute_name.endswith("_at"):
-                                        if (
-                                            obj["conclusion"] == "skipped"
-                                            or obj["conclusion"] == "cancelled"
-                                        ):
-                                            pass
-                                        else:
-                                            new_Att_name = attribute_name + "_ms"
-                                            obj_atts[new_Att_name] = do_time_ms(
-                                                obj[attribute][sub_att]
-                                            )
-
-                elif type(obj[attribute]) is list:
-                    for key in obj[attribute]:
-                        if type(key) is dict:
-                            for att in key:
-                                if do_parse(key[att]):
-                                    attribute_name = (
-                                        do_string(attribute) + "." + do_string(att)
-                                    )
-                                    if attribute_name not in attributes_to_drop:
-                                        obj_atts[attribute_name] = str(key[att])
-                                        if attribute_name.endswith("_at"):
-                                            if (
-                                                obj["conclusion"] == "skipped"
-                                                or obj["conclusion"] == "cancelled"
-                                            ):
-                                                pass
-                                            else:
-                                                new_Att_name = attribute_name + "_ms"
-                                                obj_atts[new_Att_name] = do_time_ms(
-                                                    key[att]
-                                                )
-                else:
-                    if do_parse(obj[attribute]):
-                        attribute_name = do_string(attribute)
-                        if attribute_name not in attributes_to_drop:
-                            obj_atts[attribute_name] = str(obj[attribute])
-                            if attribute_name.endswith("_at"):
-                                if (
-                                    obj["conclusion"] == "skipped"
-                                    or obj["conclusion"] == "cancelled"
-                                ):
-                                    pass
-                                else:
-                                    new_Att_name = attribute_name + "_ms"
-                                    obj_atts[new_Att_name] = do_time_ms(obj[attribute])
+    add_ms = obj.get("conclusion") not in ("skipped", "cancelled")
+    ctx = (obj_atts, _drop_set(att_to_drop), Config.GHA_ATTRIBUTES_MAX_DEPTH, add_ms)
+    _walk_dict(obj, "", 1, ctx)
     return obj_atts
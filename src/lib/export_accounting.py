@@ -0,0 +1,129 @@
+import threading
+
+from opentelemetry.sdk._logs.export import (
+    BatchLogRecordProcessor,
+    LogRecordExporter,
+    LogRecordExportResult,
+)
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+# Batch processors and exporters that record what goes through them in an
+# ExportStats (lib.otel). What was submitted to a processor but never reached
+# its exporter was dropped: by a full queue, or left queued at shutdown. Only
+# the public processor API is used, the SDK's queue is not looked at.
+
+
+class QueueCount:
+    """Records a processor holds, queued or being exported.
+
+    A record submitted while max_queue_size are held finds the queue full and
+    the SDK drops one. Records of the batch being exported still count, so a
+    drop may be counted that the SDK did not make, never the other way round.
+    """
+
+    def __init__(self, max_queue_size):
+        self.max_queue_size = max_queue_size
+        self.held = 0
+        self._lock = threading.Lock()
+
+    def put(self):
+        """Count a record in, return whether one was dropped for it."""
+        with self._lock:
+            if self.held >= self.max_queue_size:
+                return True
+            self.held += 1
+            return False
+
+    def done(self, count):
+        with self._lock:
+            self.held = max(self.held - count, 0)
+
+
+class CountingBatchSpanProcessor(BatchSpanProcessor):
+    def __init__(self, stats, exporter, max_queue_size, **kwargs):
+        self._queue_count = QueueCount(max_queue_size)
+        super().__init__(
+            AccountingSpanExporter(stats, exporter, self._queue_count),
+            max_queue_size=max_queue_size,
+            **kwargs,
+        )
+        self._stats = stats
+
+    def on_end(self, span):
+        self._stats.add(submitted=1, overflowed=self._queue_count.put())
+        super().on_end(span)
+
+
+class CountingBatchLogRecordProcessor(BatchLogRecordProcessor):
+    def __init__(self, stats, exporter, max_queue_size, **kwargs):
+        self._queue_count = QueueCount(max_queue_size)
+        super().__init__(
+            AccountingLogExporter(stats, exporter, self._queue_count),
+            max_queue_size=max_queue_size,
+            **kwargs,
+        )
+        self._stats = stats
+
+    def on_emit(self, log_record):
+        self._stats.add(submitted=1, overflowed=self._queue_count.put())
+        super().on_emit(log_record)
+
+
+class AccountingSpanExporter(SpanExporter):
+    def __init__(self, stats, exporter, queue_count=None):
+        self._stats = stats
+        self._exporter = exporter
+        self._queue_count = queue_count
+
+    def export(self, spans):
+        try:
+            result = self._exporter.export(spans)
+        except Exception:
+            self._stats.add(failed=len(spans))
+            raise
+        finally:
+            if self._queue_count is not None:
+                self._queue_count.done(len(spans))
+        if result == SpanExportResult.SUCCESS:
+            self._stats.add(exported=len(spans))
+        else:
+            self._stats.add(failed=len(spans))
+        return result
+
+    def force_flush(self, timeout_millis=30000):
+        return self._exporter.force_flush(timeout_millis)
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+
+class AccountingLogExporter(LogRecordExporter):
+    def __init__(self, stats, exporter, queue_count=None):
+        self._stats = stats
+        self._exporter = exporter
+        self._queue_count = queue_count
+
+    def export(self, batch):
+        try:
+            result = self._exporter.export(batch)
+        except Exception:
+            self._stats.add(failed=len(batch))
+            raise
+        finally:
+            if self._queue_count is not None:
+                self._queue_count.done(len(batch))
+        if result == LogRecordExportResult.SUCCESS:
+            self._stats.add(exported=len(batch))
+        else:
+            self._stats.add(failed=len(batch))
+        return result
+
+    def force_flush(self, timeout_millis=30000):
+        return self._exporter.force_flush(timeout_millis)
+
+    def shutdown(self):
+        self._exporter.shutdown()
@@ -1,77 +1,225 @@
+import itertools
 import json
-
-from ghapi.all import GhApi
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
 from .config import Config
-from .custom_parser import do_fastcore_decode, do_time, parse_attributes
+from .custom_parser import do_time, parse_attributes
+from .http_cache import ResponseCache
+from .http_client import TIMEOUT, get_session
+from .models import Job, WorkflowRun
+from .profiler import profiler
+from .rate_limit import get_scheduler
+
+# Maximum page size GitHub allows for list endpoints
+PER_PAGE = 100
+# The previous run is nearly always on the first page of runs created before
+# the current one, small pages keep the lookup cheap
+PREVIOUS_RUN_PER_PAGE = 10
+PREVIOUS_RUN_MAX_RUNS = 1000
+PREVIOUS_RUN_MEMO_SIZE = 10000
 
 
 class GithubApi:
     def __init__(self):
-        self.api = GhApi(
-            owner=Config.GITHUB_REPOSITORY_OWNER,
-            repo=Config.GHA_SERVICE_NAME.split("/")[1],
-            token=Config.GHA_TOKEN,
+        self.repo_url = "{}/repos/{}/{}".format(
+            Config.GITHUB_API_URL,
+            Config.GITHUB_REPOSITORY_OWNER,
+            Config.GHA_SERVICE_NAME.split("/")[1],
         )
+        self.headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": "Bearer " + Config.GHA_TOKEN,
+            "X-GitHub-Api-Version": "2022-11-28",
+        }
+        self.cache = None
+        if Config.GHA_CACHE_DIR:
+            self.cache = ResponseCache(Config.GHA_CACHE_DIR, Config.GHA_CACHE_MAX_BYTES)
+        # (branch, head_sha) -> head_sha of the previous run on the branch
+        self._previous_head_sha = {}
+        self._default_branch = None
 
-    def get_workflow_run_by_id(self):
-        return do_fastcore_decode(self.api.actions.get_workflow_run(Config.GHA_RUN_ID))
+    def _get(self, path, cached=False, **params):
+        """GET a repository API path and return the response body as bytes.
 
-    def get_workflow_run_jobs_by_run_id(self, page=1, jobs=None):
-        if jobs is None:
-            jobs = []
+        With cached=True and GHA_CACHE_DIR set the request is made conditional
+        on the stored ETag, and a 304 is answered from the on-disk cache.
+        """
+        url = self.repo_url + path
+        headers = self.headers
+        cache_key = None
+        entry = None
+        if cached and self.cache is not None:
+            cache_key = url + "?" + urlencode(sorted(params.items()))
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                headers = dict(headers, **{"If-None-Match": entry[0]})
 
-        try:
-            response = do_fastcore_decode(
-                self.api.actions.list_jobs_for_workflow_run(
-                    Config.GHA_RUN_ID, page=page
-                )
+        response = get_scheduler().call(
+            lambda: get_session().get(
+                url, headers=headers, params=params, timeout=TIMEOUT
             )
-            workflow_run = json.loads(response)
-            jobs.extend(workflow_run["jobs"])
+        )
+        if response.status_code == 304 and entry is not None:
+            return entry[1]
+        response.raise_for_status()
 
-            if workflow_run["total_count"] > len(jobs):
-                return self.get_workflow_run_jobs_by_run_id(page + 1, jobs)
-        except Exception as e:
-            print("Error getting workflow run jobs", e)
+        etag = response.headers.get("ETag")
+        if cache_key is not None and etag:
+            self.cache.put(cache_key, etag, response.content)
+        return response.content
+
+    @profiler.timed("github.workflow_run")
+    def get_workflow_run_by_id(self, run_id=None):
+        if run_id is None:
+            run_id = Config.GHA_RUN_ID
+        return WorkflowRun.from_json(
+            self._get("/actions/runs/{}".format(run_id), cached=True)
+        )
+
+    @profiler.timed("github.repository")
+    def get_default_branch(self):
+        """Default branch of the repository, looked up once, None if it fails.
+
+        The repository embedded in workflow run payloads leaves it out.
+        """
+        if self._default_branch is None:
+            try:
+                repository = json.loads(self._get("", cached=True))
+                self._default_branch = repository["default_branch"]
+            except Exception as e:
+                print("Error getting the default branch", e)
+        return self._default_branch
+
+    def _get_workflow_run_jobs_page(self, run_id, page):
+        for attempt in range(1, Config.GHA_API_RETRIES + 1):
+            try:
+                response = self._get(
+                    "/actions/runs/{}/jobs".format(run_id),
+                    per_page=PER_PAGE,
+                    page=page,
+                )
+                return Job.from_page(response)
+            except Exception as e:
+                print("Error getting workflow run jobs page", page, e)
+                if attempt == Config.GHA_API_RETRIES:
+                    raise e
+                time.sleep(2**attempt)
+
+    @profiler.timed("github.jobs", count=len)
+    def get_workflow_run_jobs_by_run_id(self, run_id=None):
+        if run_id is None:
+            run_id = Config.GHA_RUN_ID
+        jobs, total_count = self._get_workflow_run_jobs_page(run_id, 1)
+        pages = -(-total_count // PER_PAGE)
+
+        if pages > 1:
+            # Remaining pages are fetched concurrently, map keeps them in order
+            with ThreadPoolExecutor(
+                max_workers=min(Config.GHA_API_CONCURRENCY, pages - 1)
+            ) as executor:
+                for page_jobs, _ in executor.map(
+                    lambda page: self._get_workflow_run_jobs_page(run_id, page),
+                    range(2, pages + 1),
+                ):
+                    jobs.extend(page_jobs)
 
         return jobs
 
-    def get_commits_included_in_workflow_run(self, workflow_run_atts, branch):
-        commits = []
-        try:
-            workflow_runs = do_fastcore_decode(
-                self.api.actions.list_workflow_runs_for_repo(
-                    branch=branch, event="push", status="completed"
+    def get_workflow_runs(self, per_page=PER_PAGE, cached=False, **filters):
+        """Yield the repository's workflow runs matching filters, newest first.
+
+        Pages are fetched lazily, so callers can stop early. With cached=True
+        pages are conditional requests, for listings that rarely change.
+        """
+        page = 1
+        while True:
+            runs, total_count = WorkflowRun.from_page(
+                self._get(
+                    "/actions/runs",
+                    cached=cached,
+                    per_page=per_page,
+                    page=page,
+                    **filters,
                 )
             )
-            workflow_runs = json.loads(workflow_runs)["workflow_runs"]
-
-            previous_run_head_sha = next(
-                (
-                    workflow_runs[index + 1]["head_sha"]
-                    for index, run in enumerate(workflow_runs)
-                    if run["id"] == workflow_run_atts["id"]
-                ),
-                None,
+            yield from runs
+            if not runs or page * per_page >= total_count:
+                return
+            page += 1
+
+    def count_workflow_runs(self, cached=False, **filters):
+        """Number of the repository's workflow runs matching filters."""
+        _, total_count = WorkflowRun.from_page(
+            self._get("/actions/runs", cached=cached, per_page=1, **filters)
+        )
+        return total_count
+
+    def get_previous_run_head_sha(self, workflow_run, branch):
+        """head_sha of the last completed push run on branch before this run.
+
+        Only runs created before this one are listed and pages are fetched
+        until one on another commit is found, runs on the same head_sha add
+        no commits. Answers are memoized per (branch, head_sha).
+        """
+        head_sha = workflow_run.head_sha
+        key = (branch, head_sha)
+        if key in self._previous_head_sha:
+            return self._previous_head_sha[key]
+
+        filters = {"branch": branch, "event": "push", "status": "completed"}
+        created_at = workflow_run.created_at
+        if created_at:
+            filters["created"] = "<" + created_at
+        # Without created_at the run itself has to be found in the listing first
+        found_run = bool(created_at)
+        previous_head_sha = None
+        for run in itertools.islice(
+            # Runs created before this one only change when they are deleted
+            self.get_workflow_runs(
+                per_page=PREVIOUS_RUN_PER_PAGE, cached=True, **filters
+            ),
+            PREVIOUS_RUN_MAX_RUNS,
+        ):
+            if not found_run:
+                found_run = run.id == workflow_run.id
+            elif run.head_sha != head_sha:
+                previous_head_sha = run.head_sha
+                break
+
+        if found_run:
+            if len(self._previous_head_sha) >= PREVIOUS_RUN_MEMO_SIZE:
+                self._previous_head_sha.pop(next(iter(self._previous_head_sha)))
+            self._previous_head_sha[key] = previous_head_sha
+        return previous_head_sha
+
+    @profiler.timed("github.commits", count=lambda count: count or 0)
+    def get_commit_count_of_workflow_run(self, workflow_run, branch):
+        """Number of commits since the previous run on branch, None if there is none."""
+        try:
+            previous_run_head_sha = self.get_previous_run_head_sha(
+                workflow_run, branch
             )
+            if not previous_run_head_sha:
+                return None
 
-            if previous_run_head_sha:
-                print(
-                    f"Comparing commits between {previous_run_head_sha} and {workflow_run_atts['head_sha']}"
-                )
-                raw_response = do_fastcore_decode(
-                    self.api.repos.compare_commits(
-                        owner=Config.GITHUB_REPOSITORY_OWNER,
-                        repo=Config.GHA_SERVICE_NAME.split("/")[1],
-                        basehead=previous_run_head_sha
-                        + "..."
-                        + workflow_run_atts["head_sha"],
-                    )
-                )
-                commits = json.loads(raw_response)["commits"]
+            print(
+                f"Comparing commits between {previous_run_head_sha} and {workflow_run.head_sha}"
+            )
+            # Only total_commits is used. Pages after the first leave out the
+            # changed files and their patches, so ask for the second page of
+            # one commit each
+            raw_response = self._get(
+                "/compare/"
+                + previous_run_head_sha
+                + "..."
+                + workflow_run.head_sha,
+                cached=True,
+                per_page=1,
+                page=2,
+            )
+            return json.loads(raw_response)["total_commits"]
         except Exception as e:
             print("Error getting commits", e)
             raise e
-
-        return commits
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import tempfile
+
+
+class ResponseCache:
+    """On-disk cache of ETag tagged response bodies, evicted LRU by total size.
+
+    Each entry is a single file named after the hash of the request key,
+    holding the ETag on the first line followed by the raw body. Entries are
+    written atomically so several exporter processes can share a directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+
+    def get(self, key):
+        """Return (etag, body) for key, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                etag = f.readline()[:-1].decode("utf-8")
+                body = f.read()
+            # Reads count as use for LRU eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return etag, body
+
+    def put(self, key, etag, body):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(etag.encode("utf-8") + b"\n")
+            f.write(body)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
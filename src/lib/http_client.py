@@ -0,0 +1,83 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limit import get_scheduler
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RETRIES = 5
+POOL_SIZE = 16
+TIMEOUT = (10, 60)
+
+_session = None
+
+
+def get_session():
+    """Return the process wide requests session so connections are pooled."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def download_file(url, headers, path, chunk_size=CHUNK_SIZE, max_retries=MAX_RETRIES):
+    """Stream url to path in chunks, resuming with a Range request if cut off.
+
+    Returns the number of bytes written.
+    """
+    session = get_session()
+    written = 0
+    attempt = 0
+    started = time.monotonic()
+    with open(path, "wb") as output_file:
+        while True:
+            req_headers = dict(headers)
+            if written:
+                req_headers["Range"] = "bytes={}-".format(written)
+            try:
+                with get_scheduler().call(
+                    lambda: session.get(
+                        url, headers=req_headers, stream=True, timeout=TIMEOUT
+                    )
+                ) as r:
+                    r.raise_for_status()
+                    if written and r.status_code != 206:
+                        # Server ignored the Range header, start over
+                        output_file.seek(0)
+                        output_file.truncate()
+                        written = 0
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        output_file.write(chunk)
+                        written += len(chunk)
+                break
+            except (
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                print(
+                    "Download interrupted after",
+                    written,
+                    "bytes, resuming (attempt",
+                    attempt,
+                    "of",
+                    str(max_retries) + ") due to error",
+                    e,
+                )
+                time.sleep(min(2**attempt, 30))
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(
+        "Downloaded {} bytes in {:.2f}s ({:.0f} bytes/s)".format(
+            written, elapsed, written / elapsed
+        )
+    )
+    return written
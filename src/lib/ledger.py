@@ -0,0 +1,165 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import Config
+
+CLAIMED = "claimed"
+EXPORTED = "exported"
+# A claim older than this is taken to belong to an exporter that died
+CLAIM_TTL = 3600
+BUSY_TIMEOUT = 30
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS exported_jobs (
+        run_id INTEGER NOT NULL,
+        run_attempt INTEGER NOT NULL,
+        job_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (run_id, run_attempt, job_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS exported_runs (
+        run_id INTEGER NOT NULL,
+        run_attempt INTEGER NOT NULL,
+        exported_at REAL NOT NULL,
+        PRIMARY KEY (run_id, run_attempt)
+    )
+    """,
+)
+
+
+def _job_key(run_id, job):
+    return int(run_id), int(job.run_attempt or 1), int(job.id)
+
+
+class ExportLedger:
+    """SQLite record of the workflow run attempts and jobs already exported.
+
+    Jobs are claimed before they are exported and marked exported after, in
+    write transactions that lock the database, so exporters sharing the file,
+    in threads or processes, never claim the same job. A failed job's claim
+    is released so the next export retries it. A run attempt is recorded
+    once all its jobs are exported.
+    """
+
+    def __init__(self, path, claim_ttl=CLAIM_TTL):
+        self.path = path
+        self.claim_ttl = claim_ttl
+        with self._transaction() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT, isolation_level=None
+        )
+        # WAL lets readers go on while another exporter writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def run_exported(self, run_id, run_attempt):
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT 1 FROM exported_runs WHERE run_id = ? AND run_attempt = ?",
+                (int(run_id), int(run_attempt)),
+            ).fetchone()
+        finally:
+            connection.close()
+        return row is not None
+
+    def claim_jobs(self, run_id, jobs):
+        """Claim the jobs not exported or claimed yet, return the claimed ones."""
+        now = time.time()
+        claimed = []
+        with self._transaction() as connection:
+            for job in jobs:
+                key = _job_key(run_id, job)
+                row = connection.execute(
+                    "SELECT state, updated_at FROM exported_jobs"
+                    " WHERE run_id = ? AND run_attempt = ? AND job_id = ?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    connection.execute(
+                        "INSERT INTO exported_jobs VALUES (?, ?, ?, ?, ?)",
+                        key + (CLAIMED, now),
+                    )
+                elif row[0] == CLAIMED and row[1] < now - self.claim_ttl:
+                    connection.execute(
+                        "UPDATE exported_jobs SET updated_at = ?"
+                        " WHERE run_id = ? AND run_attempt = ? AND job_id = ?",
+                        (now,) + key,
+                    )
+                else:
+                    continue
+                claimed.append(job)
+        return claimed
+
+    def finish_jobs(self, run_id, exported, failed):
+        """Mark the exported jobs and release the claims of the failed ones."""
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE exported_jobs SET state = ?, updated_at = ?"
+                " WHERE run_id = ? AND run_attempt = ? AND job_id = ?",
+                [(EXPORTED, now) + _job_key(run_id, job) for job in exported],
+            )
+            connection.executemany(
+                "DELETE FROM exported_jobs"
+                " WHERE run_id = ? AND run_attempt = ? AND job_id = ? AND state = ?",
+                [_job_key(run_id, job) + (CLAIMED,) for job in failed],
+            )
+
+    def finish_run(self, run_id, run_attempt, jobs):
+        """Record the run attempt if all its jobs are exported, return whether it was."""
+        with self._transaction() as connection:
+            exported = set(
+                connection.execute(
+                    "SELECT run_attempt, job_id FROM exported_jobs"
+                    " WHERE run_id = ? AND state = ?",
+                    (int(run_id), EXPORTED),
+                )
+            )
+            if any(_job_key(run_id, job)[1:] not in exported for job in jobs):
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO exported_runs VALUES (?, ?, ?)",
+                (int(run_id), int(run_attempt or 1), time.time()),
+            )
+        return True
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """Return the process wide ExportLedger at GHA_LEDGER, None when not set."""
+    global _ledger
+    if not Config.GHA_LEDGER:
+        return None
+    with _ledger_lock:
+        if _ledger is None or _ledger.path != Config.GHA_LEDGER:
+            _ledger = ExportLedger(Config.GHA_LEDGER)
+    return _ledger
@@ -1,144 +1,618 @@
+import io
+import logging
+import multiprocessing
 import os
+import threading
 import zipfile
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
-import requests
+from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 
 from .config import Config
+from .http_client import download_file
+from .log_reducer import LogReducer
+from .profiler import profiler
+from .timestamps import parse_timestamp_ns
 
 
-def download_log_files():
-    bearer = "Bearer " + Config.GHA_TOKEN
-    req_headers = {
+def _api_headers():
+    return {
         "Accept": "application/vnd.github+json",
         "Authorization": "Bearer " + Config.GHA_TOKEN,
         "X-GitHub-Api-Version": "2022-11-28",
     }
-    url1 = (
+
+
+def _repo_url():
+    return (
         Config.GITHUB_API_URL
         + "/repos/"
         + Config.GHA_SERVICE_NAME.split("/")[0]
         + "/"
         + Config.GHA_SERVICE_NAME.split("/")[1]
-        + "/actions/runs/"
-        + str(Config.GHA_RUN_ID)
-        + "/logs"
     )
-    r1 = requests.get(url1, headers=req_headers)
-    with open("log.zip", "wb") as output_file:
-        output_file.write(r1.content)
 
-    with zipfile.ZipFile("log.zip", "r") as zip_ref:
-        zip_ref.extractall("./logs")
 
+@profiler.timed("logs.download")
+def download_log_files(run_id=None, workdir="."):
+    """Download the run log archive into workdir and return a step log reader.
+
+    With STREAM_LOGS the archive is read in place, otherwise it is extracted
+    to workdir/logs first.
+    """
+    if run_id is None:
+        run_id = Config.GHA_RUN_ID
+    url1 = _repo_url() + "/actions/runs/" + str(run_id) + "/logs"
+    zip_path = os.path.join(workdir, "log.zip")
+    download_file(url1, _api_headers(), zip_path)
+
+    if Config.STREAM_LOGS:
+        return LogArchive(zip_path)
+
+    logs_path = os.path.join(workdir, "logs")
+    with profiler.phase("logs.extract"), zipfile.ZipFile(zip_path, "r") as zip_ref:
+        zip_ref.extractall(logs_path)
+    return LogDirectory(logs_path)
+
+
+@profiler.timed("logs.download")
+def download_job_logs(jobs, workdir="."):
+    """Download the logs of the given jobs concurrently and return a step log reader.
+
+    Each job log comes from the per-job endpoint and is split into step logs
+    under workdir/job-logs. A job whose log cannot be downloaded is left out
+    and reported, the other jobs are still exported.
+    """
+    logs_path = os.path.join(workdir, "job-logs")
+
+    def download(job):
+        job_path = os.path.join(logs_path, str(job.id))
+        try:
+            os.makedirs(job_path, exist_ok=True)
+            url = _repo_url() + "/actions/jobs/" + str(job.id) + "/logs"
+            download_file(url, _api_headers(), job_path + ".txt")
+            steps = split_job_log(job, job_path + ".txt", job_path)
+            os.remove(job_path + ".txt")
+            return job, steps
+        except Exception as e:
+            print("Unable to download logs of job ->", job.name, "<- due to error", e)
+            return job, {}
+
+    index = {}
+    if jobs:
+        with ThreadPoolExecutor(
+            max_workers=min(Config.GHA_API_CONCURRENCY, len(jobs))
+        ) as executor:
+            for job, steps in executor.map(download, jobs):
+                for step_number, path in steps.items():
+                    index[(str(job.name), step_number)] = path
+    return JobLogs(index)
+
+
+def split_job_log(job, source, job_path):
+    """Split a job log into one file per step, return {step number: path}.
 
-def parse_log_files(job, step, child_0, child_1, job_logger, logging, dp):
+    The job log has no step markers, so a line goes to the step whose time
+    span holds its timestamp. Step times are whole seconds and a step mostly
+    starts in the second the previous one ends, so a line in that second stays
+    with the earlier step unless it is the "##[group]Run" line opening the
+    next one.
+    """
+    steps = [
+        (
+            step.number,
+            parse_timestamp_ns(step.started_at) // 10**9,
+            parse_timestamp_ns(step.completed_at) // 10**9,
+        )
+        for step in job.steps
+        if step.started_at
+        and step.completed_at
+        and step.conclusion != "skipped"
+    ]
+    paths = {}
+    if not steps:
+        return paths
+    current = 0
+    output = None
     try:
-        with open(
-            "./logs/"
-            + str(job["name"])
-            + "/"
-            + str(step["number"])
-            + "_"
-            + str(step["name"].replace("/", ""))
-            + ".txt"
-        ) as f:
-            for line in f.readlines():
+        with open(source, encoding="utf-8-sig", newline="") as lines:
+            for line in lines:
                 try:
-                    line_to_add = line[29:-1].strip()
-                    len_line_to_add = len(line_to_add)
-                    timestamp_to_add = line[0:23]
-                    if len_line_to_add > 0:
-                        # Convert ISO 8601 to timestamp
-                        try:
-                            parsed_t = dp.isoparse(timestamp_to_add)
-                        except ValueError as e:
-                            print("Line does not start with a date. Skip for now")
-                            continue
-                        unix_timestamp = parsed_t.timestamp() * 1000
-                        if line_to_add.lower().startswith("##[error]"):
-                            child_1.set_status(
-                                Status(
-                                    StatusCode.ERROR,
-                                    line_to_add[9:],
-                                )
-                            )
-                            child_0.set_status(
-                                Status(
-                                    StatusCode.ERROR,
-                                    "STEP: " + str(step["name"]) + " failed",
-                                )
-                            )
-                            job_logger._log(
-                                level=logging.ERROR,
-                                msg=line_to_add,
-                                extra={
-                                    "log.timestamp": unix_timestamp,
-                                    "log.time": timestamp_to_add,
-                                },
-                                args="",
-                            )
-                        elif line_to_add.lower().startswith("##[warning]"):
-                            job_logger._log(
-                                level=logging.WARNING,
-                                msg=line_to_add,
-                                extra={
-                                    "log.timestamp": unix_timestamp,
-                                    "log.time": timestamp_to_add,
-                                },
-                                args="",
-                            )
-                        elif line_to_add.lower().startswith("##[notice]"):
-                            # Notice (notice): applies to normal but significant conditions that may require monitoring.
-                            # Applying INFO4 aka 12 -> https://opentelemetry.io/docs/specs/otel/logs/data-model/#displaying-severity
-                            job_logger._log(
-                                level=12,
-                                msg=line_to_add,
-                                extra={
-                                    "log.timestamp": unix_timestamp,
-                                    "log.time": timestamp_to_add,
-                                },
-                                args="",
-                            )
-                        elif line_to_add.lower().startswith("##[debug]"):
-                            job_logger._log(
-                                level=logging.DEBUG,
-                                msg=line_to_add,
-                                extra={
-                                    "log.timestamp": unix_timestamp,
-                                    "log.time": timestamp_to_add,
-                                },
-                                args="",
-                            )
-                        else:
-                            job_logger._log(
-                                level=logging.INFO,
-                                msg=line_to_add,
-                                extra={
-                                    "log.timestamp": unix_timestamp,
-                                    "log.time": timestamp_to_add,
-                                },
-                                args="",
-                            )
+                    second = parse_timestamp_ns(line[0:28]) // 10**9
+                except ValueError:
+                    second = None
+                if second is not None and current + 1 < len(steps):
+                    moved = current
+                    while current + 1 < len(steps) and second > steps[current][2]:
+                        current += 1
+                    if (
+                        current == moved
+                        and second >= steps[current + 1][1]
+                        and line[29:].startswith("##[group]Run ")
+                    ):
+                        current += 1
+                    if current != moved and output is not None:
+                        output.close()
+                        output = None
+                if output is None:
+                    path = os.path.join(job_path, "{}.txt".format(steps[current][0]))
+                    paths[steps[current][0]] = path
+                    output = open(path, "w", encoding="utf-8", newline="")
+                output.write(line)
+    finally:
+        if output is not None:
+            output.close()
+    return paths
+
+
+def _step_number(file_name):
+    step_number = file_name.split("_", 1)[0]
+    return int(step_number) if step_number.isdigit() else None
+
+
+class LogArchive:
+    """Read step logs straight out of the run log zip without extracting it.
+
+    Members are indexed once by (job name, step number) and each step log is
+    decoded lazily line by line, so memory use does not depend on log size.
+    """
+
+    def __init__(self, path):
+        self._path = str(path)
+        self._zip = zipfile.ZipFile(path, "r")
+        self._index = {}
+        for info in self._zip.infolist():
+            if info.is_dir() or "/" not in info.filename:
+                continue
+            job_name, file_name = info.filename.rsplit("/", 1)
+            step_number = _step_number(file_name)
+            if step_number is not None:
+                self._index[(job_name, step_number)] = info
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open_step(self, job_name, step_number):
+        info = self._index.get((str(job_name), int(step_number)))
+        if info is None:
+            raise FileNotFoundError(
+                "No log member for job {} step {}".format(job_name, step_number)
+            )
+        return io.TextIOWrapper(self._zip.open(info), encoding="utf-8")
+
+    def locate_step(self, job_name, step_number):
+        """(archive path, member name) of a step log, for read_log_batch."""
+        info = self._index.get((str(job_name), int(step_number)))
+        if info is None:
+            raise FileNotFoundError(
+                "No log member for job {} step {}".format(job_name, step_number)
+            )
+        return self._path, info.filename
+
+    def close(self):
+        self._zip.close()
+
+
+class LogDirectory:
+    """Read step logs from an extracted run log archive.
+
+    Same interface as LogArchive, step files are indexed by (job name, step
+    number) from the "<job>/<number>_<step>.txt" layout of the archive.
+    """
+
+    def __init__(self, path):
+        self._index = {}
+        with os.scandir(path) as jobs:
+            for job_dir in jobs:
+                if not job_dir.is_dir():
+                    continue
+                with os.scandir(job_dir.path) as steps:
+                    for step_file in steps:
+                        step_number = _step_number(step_file.name)
+                        if step_number is not None:
+                            self._index[(job_dir.name, step_number)] = step_file.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open_step(self, job_name, step_number):
+        path = self._index.get((str(job_name), int(step_number)))
+        if path is None:
+            raise FileNotFoundError(
+                "No log file for job {} step {}".format(job_name, step_number)
+            )
+        return open(path, encoding="utf-8")
+
+    def locate_step(self, job_name, step_number):
+        """(file path, None) of a step log, for read_log_batch."""
+        path = self._index.get((str(job_name), int(step_number)))
+        if path is None:
+            raise FileNotFoundError(
+                "No log file for job {} step {}".format(job_name, step_number)
+            )
+        return path, None
+
+    def close(self):
+        pass
+
+
+class JobLogs(LogDirectory):
+    """Read the step logs split out of per-job logs by download_job_logs."""
+
+    def __init__(self, index):
+        self._index = index
+
+
+# Workflow command prefixes the runner writes at the start of a message,
+# mapped to (log level, command, prefix length). Matched case-insensitively.
+ERROR = "error"
+GROUP = "group"
+ENDGROUP = "endgroup"
+LINE_COMMANDS = {
+    "##[error]": (logging.ERROR, ERROR, len("##[error]")),
+    "##[warning]": (logging.WARNING, None, len("##[warning]")),
+    # Notice (notice): applies to normal but significant conditions that may require monitoring.
+    # Applying INFO4 aka 12 -> https://opentelemetry.io/docs/specs/otel/logs/data-model/#displaying-severity
+    "##[notice]": (12, None, len("##[notice]")),
+    "##[debug]": (logging.DEBUG, None, len("##[debug]")),
+    "##[group]": (logging.INFO, GROUP, len("##[group]")),
+    "##[endgroup]": (logging.INFO, ENDGROUP, len("##[endgroup]")),
+}
+_PLAIN_LINE = (logging.INFO, None, 0)
+_LONGEST_COMMAND = max(len(prefix) for prefix in LINE_COMMANDS)
 
+
+def classify_line(message):
+    """Return (level, command, prefix length) for a log message."""
+    if message.startswith("##["):
+        end = message.find("]", 3, _LONGEST_COMMAND)
+        if end > 0:
+            return LINE_COMMANDS.get(message[: end + 1].lower(), _PLAIN_LINE)
+    return _PLAIN_LINE
+
+
+class GroupSpans:
+    """Turn the ##[group] ... ##[endgroup] blocks of a step log into spans.
+
+    Each block becomes a child span of the step span (or of the enclosing
+    block) from the timestamp of its ##[group] line to that of its
+    ##[endgroup] line. Blocks still open at the end of the log end with its
+    last line.
+    """
+
+    def __init__(self, tracer, step_span):
+        self.tracer = tracer
+        self.step_span = step_span
+        self._open = []
+        self._last_ns = None
+
+    def line(self, timestamp_ns):
+        self._last_ns = timestamp_ns
+        for group in self._open:
+            group[1] += 1
+
+    def start(self, name, timestamp_ns):
+        parent = self._open[-1][0] if self._open else self.step_span
+        span = self.tracer.start_span(
+            name=name or "group",
+            context=trace.set_span_in_context(parent),
+            start_time=timestamp_ns,
+            kind=trace.SpanKind.CONSUMER,
+        )
+        self._open.append([span, 0])
+
+    def end(self, timestamp_ns):
+        if self._open:
+            span, lines = self._open.pop()
+            span.set_attribute("log.lines", lines)
+            span.end(end_time=timestamp_ns)
+
+    def fail(self, message):
+        if self._open:
+            self._open[-1][0].set_status(Status(StatusCode.ERROR, message))
+
+    def finish(self):
+        while self._open:
+            self.end(self._last_ns)
+
+
+class _StepLog:
+    """Export the parsed lines of one step as log records, group spans and statuses."""
+
+    def __init__(self, job, step, child_0, child_1, job_logger, step_tracer):
+        self.step = step
+        self.child_0 = child_0
+        self.child_1 = child_1
+        self.job_logger = job_logger
+        self.reducer = LogReducer.from_config()
+        self.groups = None
+        if step_tracer is not None and Config.GHA_LOG_GROUP_SPANS:
+            self.groups = GroupSpans(step_tracer, child_1)
+
+    def add(self, timestamp_ns, level, command, prefix_length, line_to_add, log_time):
+        groups = self.groups
+        if groups is not None:
+            groups.line(timestamp_ns)
+        if command is not None:
+            if command == ERROR:
+                self.child_1.set_status(
+                    Status(
+                        StatusCode.ERROR,
+                        line_to_add[prefix_length:],
+                    )
+                )
+                self.child_0.set_status(
+                    Status(
+                        StatusCode.ERROR,
+                        "STEP: " + str(self.step.name) + " failed",
+                    )
+                )
+                if groups is not None:
+                    groups.fail(line_to_add[prefix_length:])
+            elif groups is None:
+                pass
+            elif command == GROUP:
+                groups.start(line_to_add[prefix_length:], timestamp_ns)
+            else:
+                groups.end(timestamp_ns)
+        extra = {
+            "log.timestamp": timestamp_ns / 1000000,
+            "log.time": log_time,
+        }
+        if self.reducer is None:
+            self.job_logger._log(level=level, msg=line_to_add, extra=extra, args="")
+        else:
+            for level, msg, extra in self.reducer.add(level, line_to_add, extra):
+                self.job_logger._log(level=level, msg=msg, extra=extra, args="")
+
+    def finish(self):
+        if self.groups is not None:
+            self.groups.finish()
+        reducer = self.reducer
+        if reducer is not None:
+            for level, msg, extra in reducer.finish():
+                self.job_logger._log(level=level, msg=msg, extra=extra, args="")
+            if reducer.collapsed or reducer.omitted:
+                print(
+                    "Reduced logs of step ->",
+                    self.step.name,
+                    "<-",
+                    reducer.collapsed,
+                    "repeated lines collapsed,",
+                    reducer.omitted,
+                    "lines omitted",
+                )
+
+
+@profiler.timed("logs.parse", count=lambda lines: lines)
+def parse_log_files(
+    job, step, child_0, child_1, job_logger, logging, log_archive, step_tracer=None
+):
+    """Export the log lines of a step, return the number of lines read.
+
+    log_archive is a step log reader, or a LogBatchPool whose worker
+    processes have already parsed the step.
+    """
+    step_log = _StepLog(job, step, child_0, child_1, job_logger, step_tracer)
+    lines = 0
+    try:
+        if isinstance(log_archive, LogBatchPool):
+            batch = log_archive.take(job.name, step.number)
+            lines = len(batch.timestamps) + batch.skipped
+            if batch.skipped:
+                print(batch.skipped, "lines do not start with a date. Skip for now")
+            for record in batch.records():
+                try:
+                    step_log.add(*record)
                 except Exception as e:
                     print("Error exporting log line ERROR: ", e)
+        else:
+            with log_archive.open_step(job.name, step.number) as f:
+                for line in f:
+                    try:
+                        line_to_add = line[29:-1].strip()
+                        if line_to_add:
+                            lines += 1
+                            # Convert ISO 8601 to timestamp
+                            try:
+                                timestamp_ns = parse_timestamp_ns(line[0:28])
+                            except ValueError as e:
+                                print("Line does not start with a date. Skip for now")
+                                continue
+                            level, command, prefix_length = classify_line(line_to_add)
+                            step_log.add(
+                                timestamp_ns,
+                                level,
+                                command,
+                                prefix_length,
+                                line_to_add,
+                                line[0:23],
+                            )
+                    except Exception as e:
+                        print("Error exporting log line ERROR: ", e)
+        step_log.finish()
     except IOError as e:
-        if step["conclusion"] == "skipped" or step["conclusion"] == "cancelled":
+        if step.conclusion == "skipped" or step.conclusion == "cancelled":
             print(
                 "Log file not expected for this step ->",
-                step["name"],
+                step.name,
                 "<- because its status is ->",
-                step["conclusion"],
+                step.conclusion,
             )
             pass  # We don't expect log file to exist
         else:
             print(
                 "ERROR: Log file does not exist: "
-                + str(job["name"])
+                + str(job.name)
                 + "/"
-                + str(step["number"])
+                + str(step.number)
                 + "_"
-                + str(step["name"].replace("/", ""))
+                + str(step.name).replace("/", "")
                 + ".txt"
             )
+    return lines
+
+
+# Commands are stored as one byte per line in a LogBatch
+_COMMANDS = (None, ERROR, GROUP, ENDGROUP)
+_COMMAND_CODES = {command: code for code, command in enumerate(_COMMANDS)}
+# Length of the "log.time" prefix of a line, "2024-01-01T10:00:00.123"
+_LOG_TIME_WIDTH = 23
+
+
+class LogBatch:
+    """The parsed lines of one step log, in parallel arrays.
+
+    Compact to pickle between processes: the messages are one string split
+    at `ends`, the "log.time" prefixes one string of fixed width entries.
+    """
+
+    __slots__ = (
+        "timestamps",
+        "levels",
+        "commands",
+        "prefixes",
+        "ends",
+        "text",
+        "times",
+        "skipped",
+    )
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.levels = array("b")
+        self.commands = bytearray()
+        self.prefixes = bytearray()
+        self.ends = array("Q")
+        self.text = ""
+        self.times = ""
+        self.skipped = 0
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def records(self):
+        """Yield (timestamp_ns, level, command, prefix length, message, log time)."""
+        text = self.text
+        times = self.times
+        start = 0
+        for index, end in enumerate(self.ends):
+            offset = index * _LOG_TIME_WIDTH
+            yield (
+                self.timestamps[index],
+                self.levels[index],
+                _COMMANDS[self.commands[index]],
+                self.prefixes[index],
+                text[start:end],
+                times[offset : offset + _LOG_TIME_WIDTH],
+            )
+            start = end
+
+
+# Run log archives opened by this worker process, by path
+_worker_archives = {}
+
+
+def read_log_batch(path, member=None):
+    """Parse a step log file, or a member of the zip at path, into a LogBatch.
+
+    Runs in the LogBatchPool worker processes.
+    """
+    if member is None:
+        log_file = open(path, encoding="utf-8")
+    else:
+        archive = _worker_archives.get(path)
+        if archive is None:
+            archive = _worker_archives[path] = zipfile.ZipFile(path, "r")
+        log_file = io.TextIOWrapper(archive.open(member), encoding="utf-8")
+
+    batch = LogBatch()
+    messages = []
+    times = []
+    end = 0
+    with log_file:
+        for line in log_file:
+            line_to_add = line[29:-1].strip()
+            if not line_to_add:
+                continue
+            try:
+                timestamp_ns = parse_timestamp_ns(line[0:28])
+            except ValueError:
+                batch.skipped += 1
+                continue
+            level, command, prefix_length = classify_line(line_to_add)
+            batch.timestamps.append(timestamp_ns)
+            batch.levels.append(level)
+            batch.commands.append(_COMMAND_CODES[command])
+            batch.prefixes.append(prefix_length)
+            end += len(line_to_add)
+            batch.ends.append(end)
+            messages.append(line_to_add)
+            times.append(line[0:_LOG_TIME_WIDTH])
+    batch.text = "".join(messages)
+    batch.times = "".join(times)
+    return batch
+
+
+class LogBatchPool:
+    """Parse step logs into LogBatches in worker processes, ahead of the export.
+
+    `steps` lists the (job name, step number) pairs in the order they are
+    exported. They are submitted in that order, up to `ahead` steps past the
+    last one taken, so parsed batches waiting for the export stay bounded.
+    Closing the pool closes log_archive.
+    """
+
+    def __init__(self, log_archive, steps, workers, ahead=None):
+        self.log_archive = log_archive
+        self._steps = [(str(job_name), int(number)) for job_name, number in steps]
+        self._positions = {step: index for index, step in enumerate(self._steps)}
+        self._ahead = ahead or workers * 4
+        self._futures = {}
+        self._submitted = 0
+        self._lock = threading.Lock()
+        # Spawned rather than forked, forking a process with live gRPC
+        # channels and exporter threads is not safe
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _submit_until(self, position):
+        while self._submitted < min(position, len(self._steps)):
+            step = self._steps[self._submitted]
+            self._submitted += 1
+            try:
+                source = self.log_archive.locate_step(*step)
+            except FileNotFoundError as e:
+                future = Future()
+                future.set_exception(e)
+            else:
+                future = self._executor.submit(read_log_batch, *source)
+            self._futures[step] = future
+
+    def take(self, job_name, step_number):
+        """The LogBatch of a step, raises FileNotFoundError if it has no log."""
+        step = (str(job_name), int(step_number))
+        with self._lock:
+            position = self._positions.get(step)
+            if position is None:
+                return read_log_batch(*self.log_archive.locate_step(*step))
+            self._submit_until(position + self._ahead)
+            future = self._futures.pop(step)
+        return future.result()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+        self.log_archive.close()
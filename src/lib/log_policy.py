@@ -0,0 +1,44 @@
+import fnmatch
+
+from .config import Config
+
+
+def split_patterns(value):
+    """Comma separated globs, lowercased."""
+    return [pattern.strip().lower() for pattern in value.split(",") if pattern.strip()]
+
+
+def name_matches(name, patterns):
+    name = str(name).lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+class LogPolicy:
+    """Choose the jobs and steps whose logs are exported.
+
+    A job is selected when its conclusion is one of `conclusions` (any
+    conclusion when empty) and its name matches one of the `jobs` globs. A
+    step is selected when its job is and its name matches one of the `steps`
+    globs. Globs are matched case-insensitively.
+    """
+
+    def __init__(self, jobs=("*",), steps=("*",), conclusions=()):
+        self.jobs = [pattern.lower() for pattern in jobs]
+        self.steps = [pattern.lower() for pattern in steps]
+        self.conclusions = {conclusion.lower() for conclusion in conclusions}
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            split_patterns(Config.GHA_LOG_JOBS),
+            split_patterns(Config.GHA_LOG_STEPS),
+            split_patterns(Config.GHA_LOG_CONCLUSIONS),
+        )
+
+    def selects_job(self, job):
+        if self.conclusions and str(job.conclusion).lower() not in self.conclusions:
+            return False
+        return name_matches(job.name, self.jobs)
+
+    def selects_step(self, job, step):
+        return self.selects_job(job) and name_matches(step.name, self.steps)
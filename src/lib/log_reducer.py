@@ -0,0 +1,170 @@
+import logging
+from collections import deque
+from itertools import islice
+
+from .config import Config
+
+# Lines at these levels (##[error] and ##[warning]) are never dropped
+KEEP_LEVELS = (logging.ERROR, logging.WARNING)
+UNLIMITED = float("inf")
+
+
+class LogReducer:
+    """Reduce the log records of one step before they are exported.
+
+    Records go in with add() and come out, in order, from add() and finish().
+    Runs of identical consecutive lines are collapsed into their first record
+    with a log.repeat_count attribute. Past a budget of max_lines or max_bytes
+    (0 for no limit) only the first and the last half of the budget are kept,
+    plus error and warning lines with `context` lines on either side, whatever
+    the budget. Each gap is marked by a record with the number of lines
+    omitted.
+    """
+
+    def __init__(self, dedup=False, max_lines=0, max_bytes=0, context=5):
+        self.dedup = dedup
+        self.context = context
+        self.count_bytes = max_bytes > 0
+        self.head_lines = (max_lines + 1) // 2 if max_lines else UNLIMITED
+        self.tail_lines = max_lines // 2 if max_lines else UNLIMITED
+        self.head_bytes = (max_bytes + 1) // 2 if max_bytes else UNLIMITED
+        self.tail_bytes = max_bytes // 2 if max_bytes else UNLIMITED
+        self.collapsed = 0
+        self.omitted = 0
+        self._last = None
+        self._in_head = True
+        self._used_lines = 0
+        self._used_bytes = 0
+        self._tail = deque()
+        self._tail_size = 0
+        # The last `context` lines dropped from the tail, in case an error follows
+        self._before = deque()
+        self._after = 0
+        self._gap = 0
+        self._gap_extra = None
+
+    @classmethod
+    def from_config(cls):
+        """The reducer configured by the GHA_LOG_* settings, None when disabled."""
+        if not (
+            Config.GHA_LOG_DEDUP or Config.GHA_LOG_MAX_LINES or Config.GHA_LOG_MAX_BYTES
+        ):
+            return None
+        return cls(
+            Config.GHA_LOG_DEDUP,
+            Config.GHA_LOG_MAX_LINES,
+            Config.GHA_LOG_MAX_BYTES,
+            Config.GHA_LOG_CONTEXT_LINES,
+        )
+
+    def add(self, level, msg, extra):
+        """Take one record, return the (level, msg, extra) records now final."""
+        if not self.dedup:
+            return self._budget(level, msg, extra)
+        last = self._last
+        if last is not None and last[1] == msg and last[0] == level:
+            last[3] += 1
+            self.collapsed += 1
+            return ()
+        self._last = [level, msg, extra, 1]
+        if last is None:
+            return ()
+        return self._budget(*self._collapse(last))
+
+    def finish(self):
+        """Return the records still held back at the end of the step."""
+        records = []
+        if self._last is not None:
+            records.extend(self._budget(*self._collapse(self._last)))
+            self._last = None
+        while self._tail:
+            records.extend(self._emit(self._tail.popleft()))
+        self._tail_size = 0
+        while self._before:
+            self._drop(self._before.popleft())
+        if self._gap:
+            records.append(self._marker())
+        return records
+
+    @staticmethod
+    def _collapse(last):
+        level, msg, extra, count = last
+        if count > 1:
+            extra = dict(extra, **{"log.repeat_count": count})
+        return level, msg, extra
+
+    def _budget(self, level, msg, extra):
+        size = len(msg.encode("utf-8")) if self.count_bytes else 0
+        if self._in_head:
+            if (
+                self._used_lines < self.head_lines
+                and self._used_bytes + size <= self.head_bytes
+            ):
+                self._used_lines += 1
+                self._used_bytes += size
+                return ((level, msg, extra),)
+            self._in_head = False
+
+        records = []
+        if level in KEEP_LEVELS:
+            keep = True
+            for entry in islice(reversed(self._tail), self.context):
+                entry[3] = True
+            # Context the tail is too short for comes from the lines it dropped
+            records.extend(self._recall(self.context - len(self._tail)))
+            self._after = self.context
+        elif self._after:
+            keep = True
+            self._after -= 1
+        else:
+            keep = False
+        self._tail.append([level, msg, extra, keep, size])
+        self._tail_size += size
+
+        while self._tail and (
+            len(self._tail) > self.tail_lines or self._tail_size > self.tail_bytes
+        ):
+            entry = self._tail.popleft()
+            self._tail_size -= entry[4]
+            if entry[3]:
+                records.extend(self._emit(entry))
+            else:
+                self._before.append(entry)
+                if len(self._before) > self.context:
+                    self._drop(self._before.popleft())
+        return records
+
+    def _drop(self, entry):
+        self._gap += entry[2].get("log.repeat_count", 1)
+        self._gap_extra = entry[2]
+
+    def _recall(self, count):
+        """Emit the last count lines dropped from the tail, drop the others."""
+        while len(self._before) > max(count, 0):
+            self._drop(self._before.popleft())
+        records = []
+        while self._before:
+            records.extend(self._record(self._before.popleft()))
+        return records
+
+    def _emit(self, entry):
+        # Lines held back before entry are older, they are dropped for good
+        while self._before:
+            self._drop(self._before.popleft())
+        return self._record(entry)
+
+    def _record(self, entry):
+        record = (entry[0], entry[1], entry[2])
+        if not self._gap:
+            return (record,)
+        return (self._marker(), record)
+
+    def _marker(self):
+        marker = (
+            logging.INFO,
+            "... {} log lines omitted ...".format(self._gap),
+            dict(self._gap_extra, **{"log.omitted_count": self._gap}),
+        )
+        self.omitted += self._gap
+        self._gap = 0
+        return marker
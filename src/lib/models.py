@@ -0,0 +1,98 @@
+"""Workflow run, job and step payloads of the GitHub Actions REST API.
+
+The fields the exporter reads are slots, the rest of a payload is kept as
+decoded and only merged back in when `raw` is read for span attributes.
+"""
+import json
+
+
+class _Payload:
+    __slots__ = ("_rest",)
+    FIELDS = ()
+    # Payload keys not kept in _rest
+    _KEPT = frozenset()
+
+    def __init__(self, raw):
+        for name in self.FIELDS:
+            setattr(self, name, raw.get(name))
+        kept = self._KEPT
+        rest = {key: value for key, value in raw.items() if key not in kept}
+        self._rest = rest or None
+
+    @property
+    def raw(self):
+        """The payload as a dict, fields that are null are left out."""
+        raw = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                raw[name] = value
+        if self._rest:
+            raw.update(self._rest)
+        return raw
+
+
+class Step(_Payload):
+    FIELDS = ("number", "name", "status", "conclusion", "started_at", "completed_at")
+    _KEPT = frozenset(FIELDS)
+    __slots__ = FIELDS
+
+
+class Job(_Payload):
+    """A job of a run, its steps are Steps and left out of `raw`."""
+
+    FIELDS = (
+        "id",
+        "run_id",
+        "run_attempt",
+        "name",
+        "status",
+        "conclusion",
+        "head_branch",
+        "created_at",
+        "started_at",
+        "completed_at",
+        "labels",
+        "runner_group_name",
+    )
+    _KEPT = frozenset(FIELDS + ("steps",))
+    __slots__ = FIELDS + ("steps",)
+
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.steps = [Step(step) for step in raw.get("steps") or []]
+
+    @classmethod
+    def from_page(cls, content):
+        """(jobs, total_count) of a page of /actions/runs/{id}/jobs."""
+        page = json.loads(content)
+        return [cls(job) for job in page["jobs"]], page["total_count"]
+
+
+class WorkflowRun(_Payload):
+    FIELDS = (
+        "id",
+        "name",
+        "head_branch",
+        "head_sha",
+        "run_attempt",
+        "event",
+        "status",
+        "conclusion",
+        "created_at",
+        "run_started_at",
+        "updated_at",
+    )
+    _KEPT = frozenset(FIELDS)
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_json(cls, content):
+        """The WorkflowRun of a response body, bytes or text."""
+        return cls(json.loads(content))
+
+    @classmethod
+    def from_page(cls, content):
+        """(runs, total_count) of a page of /actions/runs."""
+        page = json.loads(content)
+        return [cls(run) for run in page["workflow_runs"]], page["total_count"]
@@ -1,19 +1,18 @@
+import atexit
+import functools
 import logging
+import threading
+import time
+from collections import OrderedDict
 
-from opentelemetry import metrics, trace
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import \
-    OTLPLogExporter
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import \
-    OTLPMetricExporter
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import \
-    OTLPSpanExporter
-from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry import trace
 from opentelemetry.sdk.resources import SERVICE_NAME
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+from lib.config import Config
+
+# The SDK pipelines and OTLP or file exporters are imported when the first
+# tracer or logger is created, keeping them off the start-up path and the log
+# stack out of runs that don't parse logs
 
 
 def create_resource_attributes(atts, GLAB_SERVICE_NAME):
@@ -23,29 +22,375 @@ def create_resource_attributes(atts, GLAB_SERVICE_NAME):
     return attributes
 
 
+# Providers are cheap, the OTLP exporters (one gRPC channel each) and batch
+# processors (one worker thread each) are not. Keep a single batch pipeline
+# per endpoint and attach it to a provider per distinct Resource, so step
+# identity stays on the Resource without a new channel and thread per step.
+MAX_CACHED_PROVIDERS = 256
+
+_lock = threading.Lock()
+_span_processors = {}
+_log_processors = {}
+_tracer_providers = OrderedDict()
+_logger_providers = OrderedDict()
+_meter_providers = {}
+_file_writers = {}
+
+
+class ExportStats:
+    """Thread-safe counts of the records submitted, exported and failed."""
+
+    def __init__(self):
+        self.submitted = 0
+        self.exported = 0
+        self.failed = 0
+        # Submitted to a full queue, dropped by the SDK
+        self.overflowed = 0
+        self._lock = threading.Lock()
+
+    def add(self, submitted=0, exported=0, failed=0, overflowed=0):
+        with self._lock:
+            self.submitted += submitted
+            self.exported += exported
+            self.failed += failed
+            self.overflowed += overflowed
+
+    def lost(self):
+        """Records failed or dropped from a full queue, these counts only grow."""
+        with self._lock:
+            return self.failed + self.overflowed
+
+    def take(self):
+        """Return the counts, with the records dropped, and reset them."""
+        with self._lock:
+            counts = {
+                "exported": self.exported,
+                "failed": self.failed,
+                "dropped": max(self.submitted - self.exported - self.failed, 0),
+            }
+            self.submitted = self.exported = self.failed = self.overflowed = 0
+        return counts
+
+
+_span_stats = ExportStats()
+_log_stats = ExportStats()
+
+FILE_SCHEME = "file://"
+
+
+def _file_writer(endpoint):
+    from lib.otlp_file import OtlpFileWriter
+
+    path = endpoint[len(FILE_SCHEME) :]
+    if path not in _file_writers:
+        _file_writers[path] = OtlpFileWriter(path)
+    return _file_writers[path]
+
+
+def _http_url(endpoint, signal):
+    return endpoint.rstrip("/") + "/v1/" + signal
+
+
+def _log_exporter(endpoint, headers):
+    if endpoint.startswith(FILE_SCHEME):
+        from lib.otlp_file import FileLogExporter
+
+        return FileLogExporter(_file_writer(endpoint))
+
+    if Config.OTEL_EXPORTER_OTLP_PROTOCOL == "http/protobuf":
+        from opentelemetry.exporter.otlp.proto.http import Compression
+        from opentelemetry.exporter.otlp.proto.http._log_exporter import (
+            OTLPLogExporter,
+        )
+        from opentelemetry.util.re import parse_env_headers
+
+        return OTLPLogExporter(
+            endpoint=_http_url(endpoint, "logs"),
+            headers=parse_env_headers(headers),
+            compression=Compression(Config.OTEL_EXPORTER_OTLP_COMPRESSION),
+        )
+
+    from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
+
+    return OTLPLogExporter(
+        endpoint=endpoint, headers=headers, compression=_grpc_compression()
+    )
+
+
+def _span_exporter(endpoint, headers):
+    if endpoint.startswith(FILE_SCHEME):
+        from lib.otlp_file import FileSpanExporter
+
+        return FileSpanExporter(_file_writer(endpoint))
+
+    if Config.OTEL_EXPORTER_OTLP_PROTOCOL == "http/protobuf":
+        from opentelemetry.exporter.otlp.proto.http import Compression
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.util.re import parse_env_headers
+
+        return OTLPSpanExporter(
+            endpoint=_http_url(endpoint, "traces"),
+            headers=parse_env_headers(headers),
+            compression=Compression(Config.OTEL_EXPORTER_OTLP_COMPRESSION),
+        )
+
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+        OTLPSpanExporter,
+    )
+
+    return OTLPSpanExporter(
+        endpoint=endpoint, headers=headers, compression=_grpc_compression()
+    )
+
+
+def _metric_exporter(endpoint, headers):
+    from opentelemetry.sdk.metrics import Counter, Histogram
+    from opentelemetry.sdk.metrics.export import AggregationTemporality
+
+    # New Relic stores delta sums and histograms natively
+    temporality = {
+        Counter: AggregationTemporality.DELTA,
+        Histogram: AggregationTemporality.DELTA,
+    }
+    if endpoint.startswith(FILE_SCHEME):
+        from lib.otlp_file import FileMetricExporter
+
+        return FileMetricExporter(
+            _file_writer(endpoint), preferred_temporality=temporality
+        )
+
+    if Config.OTEL_EXPORTER_OTLP_PROTOCOL == "http/protobuf":
+        from opentelemetry.exporter.otlp.proto.http import Compression
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+            OTLPMetricExporter,
+        )
+        from opentelemetry.util.re import parse_env_headers
+
+        return OTLPMetricExporter(
+            endpoint=_http_url(endpoint, "metrics"),
+            headers=parse_env_headers(headers),
+            compression=Compression(Config.OTEL_EXPORTER_OTLP_COMPRESSION),
+            preferred_temporality=temporality,
+        )
+
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+        OTLPMetricExporter,
+    )
+
+    return OTLPMetricExporter(
+        endpoint=endpoint,
+        headers=headers,
+        compression=_grpc_compression(),
+        preferred_temporality=temporality,
+    )
+
+
+def _grpc_compression():
+    from grpc import Compression
+
+    if Config.OTEL_EXPORTER_OTLP_COMPRESSION == "gzip":
+        return Compression.Gzip
+    return Compression.NoCompression
+
+
+def _cache_key(endpoint, headers, resource):
+    return (endpoint, headers, frozenset(resource.attributes.items()))
+
+
+def _cache_put(cache, key, value):
+    cache[key] = value
+    # Evicted providers own no threads, the shared pipeline is shut down once
+    # in shutdown_providers
+    while len(cache) > MAX_CACHED_PROVIDERS:
+        cache.popitem(last=False)
+
+
 def get_logger(endpoint, headers, resource, name):
-    exporter = OTLPLogExporter(endpoint=endpoint, headers=headers)
-    logger = logging.getLogger(str(name))
-    logger.handlers.clear()
-    logger_provider = LoggerProvider(resource=resource)
-    logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
-    handler = LoggingHandler(level=logging.NOTSET, logger_provider=logger_provider)
-    logger.addHandler(handler)
+    from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+
+    from lib.export_accounting import CountingBatchLogRecordProcessor
+
+    key = _cache_key(endpoint, headers, resource)
+    with _lock:
+        if key in _logger_providers:
+            _logger_providers.move_to_end(key)
+            return _logger_providers[key]
+
+        processor = _log_processors.get((endpoint, headers))
+        if processor is None:
+            processor = CountingBatchLogRecordProcessor(
+                _log_stats,
+                _log_exporter(endpoint, headers),
+                max_queue_size=Config.OTEL_BLRP_MAX_QUEUE_SIZE,
+                max_export_batch_size=Config.OTEL_BLRP_MAX_EXPORT_BATCH_SIZE,
+                schedule_delay_millis=Config.OTEL_BLRP_SCHEDULE_DELAY,
+            )
+            _log_processors[(endpoint, headers)] = processor
+        logger_provider = LoggerProvider(resource=resource, shutdown_on_exit=False)
+        logger_provider.add_log_record_processor(processor)
+
+        # Not registered with logging.getLogger so loggers for different
+        # resources never share handlers and are freed on eviction
+        logger = logging.Logger(str(name))
+        logger.parent = logging.getLogger()
+        handler = LoggingHandler(level=logging.NOTSET, logger_provider=logger_provider)
+        logger.addHandler(handler)
+        _cache_put(_logger_providers, key, logger)
     return logger
 
 
 def get_tracer(endpoint, headers, resource, tracer):
-    processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, headers=headers))
-    tracer = TracerProvider(resource=resource)
-    tracer.add_span_processor(processor)
-    tracer = trace.get_tracer(__name__, tracer_provider=tracer)
+    from opentelemetry.sdk.trace import TracerProvider
+
+    from lib.export_accounting import CountingBatchSpanProcessor
+
+    key = _cache_key(endpoint, headers, resource)
+    with _lock:
+        provider = _tracer_providers.get(key)
+        if provider is None:
+            processor = _span_processors.get((endpoint, headers))
+            if processor is None:
+                processor = CountingBatchSpanProcessor(
+                    _span_stats,
+                    _span_exporter(endpoint, headers),
+                    max_queue_size=Config.OTEL_BSP_MAX_QUEUE_SIZE,
+                    max_export_batch_size=Config.OTEL_BSP_MAX_EXPORT_BATCH_SIZE,
+                    schedule_delay_millis=Config.OTEL_BSP_SCHEDULE_DELAY,
+                )
+                _span_processors[(endpoint, headers)] = processor
+            provider = TracerProvider(resource=resource, shutdown_on_exit=False)
+            provider.add_span_processor(processor)
+            _cache_put(_tracer_providers, key, provider)
+        else:
+            _tracer_providers.move_to_end(key)
+    tracer = trace.get_tracer(__name__, tracer_provider=provider)
 
     return tracer
 
 
-# todo
-# def get_meter(endpoint, headers, resource, meter):
-#     reader = PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=endpoint,headers=headers))
-#     provider = MeterProvider(resource=resource, metric_readers=[reader])
-#     meter = metrics.get_meter(__name__,meter_provider=provider)
-#     return meter
+def get_meter(endpoint, headers, resource, meter):
+    """Meter of a MeterProvider per endpoint and Resource.
+
+    Metrics are exported every GHA_METRICS_INTERVAL milliseconds and when the
+    provider is shut down by shutdown_providers.
+    """
+    from opentelemetry import metrics
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+    key = _cache_key(endpoint, headers, resource)
+    with _lock:
+        provider = _meter_providers.get(key)
+        if provider is None:
+            reader = PeriodicExportingMetricReader(
+                _metric_exporter(endpoint, headers),
+                export_interval_millis=Config.GHA_METRICS_INTERVAL,
+            )
+            provider = MeterProvider(
+                resource=resource, metric_readers=[reader], shutdown_on_exit=False
+            )
+            _meter_providers[key] = provider
+    return metrics.get_meter(__name__, meter_provider=provider)
+
+
+def records_lost():
+    """Spans and log records lost by the current pipelines so far."""
+    with _lock:
+        return _span_stats.lost() + _log_stats.lost()
+
+
+def flush_providers(timeout=None):
+    """Export what every span, log and metric pipeline has queued so far.
+
+    For processes that keep their pipelines between runs. Returns whether
+    every pipeline was flushed within timeout seconds (GHA_FLUSH_TIMEOUT by
+    default), records_lost() tells whether records failed meanwhile.
+    """
+    if timeout is None:
+        timeout = Config.GHA_FLUSH_TIMEOUT
+    with _lock:
+        processors = list(_span_processors.values()) + list(_log_processors.values())
+        processors.extend(_meter_providers.values())
+
+    started = time.perf_counter()
+    results = []
+    threads = []
+    for processor in processors:
+        # The SDK's force_flush blocks until exported, whatever the timeout
+        thread = threading.Thread(
+            target=lambda processor=processor: results.append(
+                processor.force_flush(timeout * 1000)
+            ),
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join(max(started + timeout - time.perf_counter(), 0))
+    return len(results) == len(processors) and all(results)
+
+
+def shutdown_providers(timeout=None):
+    """Flush and shut down every shared span, log and metric pipeline.
+
+    Pipelines are flushed concurrently and abandoned after timeout seconds
+    (GHA_FLUSH_TIMEOUT by default). Returns the spans and log records
+    exported, failed and dropped by these pipelines, and the flush time.
+    """
+    global _span_stats, _log_stats
+    if timeout is None:
+        timeout = Config.GHA_FLUSH_TIMEOUT
+    with _lock:
+        # The batch processors' shutdown takes no timeout, the join below
+        # abandons them at the deadline
+        shutdowns = [
+            processor.shutdown
+            for processor in list(_span_processors.values())
+            + list(_log_processors.values())
+        ]
+        shutdowns.extend(
+            functools.partial(provider.shutdown, timeout_millis=timeout * 1000)
+            for provider in _meter_providers.values()
+        )
+        _span_processors.clear()
+        _log_processors.clear()
+        _meter_providers.clear()
+        _tracer_providers.clear()
+        _logger_providers.clear()
+        writers = list(_file_writers.values())
+        _file_writers.clear()
+        # Exports abandoned at the deadline may still finish, they count
+        # against these pipelines' stats, not the next ones'
+        span_stats, log_stats = _span_stats, _log_stats
+        _span_stats, _log_stats = ExportStats(), ExportStats()
+
+    started = time.perf_counter()
+    threads = []
+    for shutdown in shutdowns:
+        thread = threading.Thread(target=shutdown, daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join(max(started + timeout - time.perf_counter(), 0))
+    flush_seconds = time.perf_counter() - started
+    for writer in writers:
+        writer.close()
+
+    return {
+        "spans": span_stats.take(),
+        "logs": log_stats.take(),
+        "flush_seconds": round(flush_seconds, 3),
+    }
+
+
+def export_lost(report):
+    """Whether a shutdown_providers report shows records that were not exported."""
+    return any(
+        report[signal]["failed"] or report[signal]["dropped"]
+        for signal in ("spans", "logs")
+    )
+
+
+atexit.register(shutdown_providers)
@@ -0,0 +1,141 @@
+import gzip
+import struct
+import threading
+
+from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk._logs.export import LogRecordExporter, LogRecordExportResult
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+# A capture file is a sequence of records, each a kind byte, the payload length
+# as a 4 byte big-endian integer and a serialized ExportTraceServiceRequest,
+# ExportLogsServiceRequest or ExportMetricsServiceRequest. Files ending in .gz
+# are gzip compressed.
+SPANS = b"S"
+LOGS = b"L"
+METRICS = b"M"
+KINDS = (SPANS, LOGS, METRICS)
+_HEADER = struct.Struct(">cI")
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+
+class OtlpFileWriter:
+    """Appends OTLP export requests to a capture file, shared by both exporters."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, kind, payload):
+        with self._lock:
+            if self._file is None:
+                self._file = _open(self.path, "ab")
+            self._file.write(_HEADER.pack(kind, len(payload)))
+            self._file.write(payload)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class FileSpanExporter(SpanExporter):
+    def __init__(self, writer):
+        self._writer = writer
+
+    def export(self, spans):
+        self._writer.write(SPANS, encode_spans(spans).SerializeToString())
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=30000):
+        self._writer.flush()
+        return True
+
+    def shutdown(self):
+        self._writer.flush()
+
+
+class FileLogExporter(LogRecordExporter):
+    def __init__(self, writer):
+        self._writer = writer
+
+    def export(self, batch):
+        self._writer.write(LOGS, encode_logs(batch).SerializeToString())
+        return LogRecordExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=30000):
+        self._writer.flush()
+        return True
+
+    def shutdown(self):
+        self._writer.flush()
+
+
+class FileMetricExporter(MetricExporter):
+    def __init__(self, writer, preferred_temporality=None):
+        super().__init__(preferred_temporality=preferred_temporality)
+        self._writer = writer
+
+    def export(self, metrics_data, timeout_millis=10000, **kwargs):
+        self._writer.write(METRICS, encode_metrics(metrics_data).SerializeToString())
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10000):
+        self._writer.flush()
+        return True
+
+    def shutdown(self, timeout_millis=30000, **kwargs):
+        self._writer.flush()
+
+
+def read_records(path):
+    """Yield (kind, payload) for every record in a capture file."""
+    with _open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) < _HEADER.size:
+                raise ValueError("Truncated record header in {}".format(path))
+            kind, length = _HEADER.unpack(header)
+            if kind not in KINDS:
+                raise ValueError("Unknown record kind {!r} in {}".format(kind, path))
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError("Truncated record in {}".format(path))
+            yield kind, payload
+
+
+def read_batches(path, max_bytes):
+    """Yield (kind, payload) with consecutive records coalesced up to max_bytes.
+
+    Serialized protobuf messages of the same type merge by concatenation, the
+    repeated resource_spans / resource_logs / resource_metrics fields are
+    appended, so records are batched without decoding them. A single record
+    over max_bytes is yielded on its own.
+    """
+    pending = {kind: [] for kind in KINDS}
+    sizes = dict.fromkeys(KINDS, 0)
+    for kind, payload in read_records(path):
+        if pending[kind] and sizes[kind] + len(payload) > max_bytes:
+            yield kind, b"".join(pending[kind])
+            pending[kind], sizes[kind] = [], 0
+        pending[kind].append(payload)
+        sizes[kind] += len(payload)
+    for kind in KINDS:
+        if pending[kind]:
+            yield kind, b"".join(pending[kind])
@@ -0,0 +1,226 @@
+import functools
+import itertools
+import threading
+import time
+
+from .config import Config
+
+# GHA_PROFILE is a comma separated list of:
+#   phases  time and count every phase, print a summary table at the end
+#   cpu     cProfile the main thread, dumped to GHA_PROFILE_OUTPUT.prof
+#   memory  tracemalloc, snapshot dumped to GHA_PROFILE_OUTPUT.tracemalloc
+#   spans   export the phases as a span tree of the exporter's own run
+# Any of them turns on phase timing.
+MODES = ("phases", "cpu", "memory", "spans")
+MAX_SPANS = 5000
+
+
+class _NoPhase:
+    items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "items", "seq", "parent", "start_ns", "_started")
+
+    def __init__(self, profiler, name, items):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+        self.seq = next(self.profiler._seq)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._started
+        self.profiler._stack().pop()
+        self.profiler._record(self, seconds, time.time_ns())
+        return False
+
+
+class Profiler:
+    """Phase timer with optional cProfile, tracemalloc and self-telemetry spans.
+
+    Phases nest, a phase entered while another one is running on the same
+    thread is its child in the span tree. Totals in the summary include the
+    time of nested phases.
+    """
+
+    def __init__(self, modes=(), output="gha-profile"):
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise ValueError("Unknown GHA_PROFILE modes: {}".format(sorted(unknown)))
+        self.modes = set(modes)
+        self.enabled = bool(self.modes)
+        self.output = output
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seq = itertools.count()
+        self._stats = {}
+        self._records = []
+        self._cpu = None
+        self._started_ns = None
+
+    @classmethod
+    def from_config(cls):
+        modes = [m.strip().lower() for m in Config.GHA_PROFILE.split(",") if m.strip()]
+        if modes in (["true"], ["1"]):
+            modes = ["phases"]
+        return cls(modes, Config.GHA_PROFILE_OUTPUT)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, phase, seconds, end_ns):
+        with self._lock:
+            stats = self._stats.get(phase.name)
+            if stats is None:
+                stats = self._stats[phase.name] = [0, 0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += phase.items
+            stats[2] += seconds
+            stats[3] = max(stats[3], seconds)
+            if "spans" in self.modes and len(self._records) < MAX_SPANS:
+                self._records.append((phase, end_ns))
+
+    def phase(self, name, items=0):
+        """Context manager timing one phase, add processed items to .items."""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name, items)
+
+    def timed(self, name, count=None):
+        """Decorator timing every call as a phase, count(result) gives the items.
+
+        Decided when the function is defined, a disabled profiler returns it
+        unchanged.
+        """
+
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.phase(name) as phase:
+                    result = fn(*args, **kwargs)
+                    if count is not None:
+                        phase.items = count(result)
+                    return result
+
+            return wrapper
+
+        return decorate
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._started_ns = time.time_ns()
+        if "memory" in self.modes:
+            import tracemalloc
+
+            tracemalloc.start(25)
+        if "cpu" in self.modes:
+            import cProfile
+
+            self._cpu = cProfile.Profile()
+            self._cpu.enable()
+
+    def export_spans(self, endpoint, headers, run_id=None):
+        """Send the recorded phases as a span tree under one exporter span."""
+        if "spans" not in self.modes:
+            return
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+
+        from .otel import get_tracer
+
+        resource = Resource(
+            attributes={
+                SERVICE_NAME: "gha-new-relic-exporter",
+                "github.repository": Config.GHA_SERVICE_NAME,
+                "workflow_run_id": str(run_id),
+            }
+        )
+        tracer = get_tracer(endpoint, headers, resource, "profiler")
+        root = tracer.start_span("gha-exporter", start_time=self._started_ns)
+        with self._lock:
+            records = sorted(self._records, key=lambda record: record[0].seq)
+        spans = {}
+        for phase, end_ns in records:
+            parent = spans.get(id(phase.parent), root)
+            span = tracer.start_span(
+                phase.name,
+                context=trace.set_span_in_context(parent),
+                start_time=phase.start_ns,
+                attributes={"items": phase.items},
+            )
+            span.end(end_time=end_ns)
+            spans[id(phase)] = span
+        root.end()
+
+    def stop(self):
+        """Stop the profilers, write their dumps and print the summary table."""
+        if not self.enabled:
+            return
+        if self._cpu is not None:
+            self._cpu.disable()
+            self._cpu.dump_stats(self.output + ".prof")
+            print("cProfile stats written to", self.output + ".prof")
+        if "memory" in self.modes:
+            import tracemalloc
+
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(self.output + ".tracemalloc")
+            print(
+                "tracemalloc snapshot written to",
+                self.output + ".tracemalloc",
+                "- peak traced memory {:.1f} MiB".format(peak / 1024 / 1024),
+            )
+            for stat in snapshot.statistics("lineno")[:10]:
+                print("  ", stat)
+        print(self.summary())
+
+    def summary(self):
+        with self._lock:
+            rows = sorted(self._stats.items(), key=lambda item: -item[1][2])
+        lines = [
+            "{:<24}{:>8}{:>10}{:>12}{:>12}{:>12}{:>12}".format(
+                "phase", "calls", "items", "total s", "mean ms", "max ms", "items/s"
+            )
+        ]
+        for name, (calls, items, total, longest) in rows:
+            lines.append(
+                "{:<24}{:>8d}{:>10d}{:>12.3f}{:>12.2f}{:>12.2f}{:>12.0f}".format(
+                    name,
+                    calls,
+                    items,
+                    total,
+                    total / calls * 1000,
+                    longest * 1000,
+                    items / total if total else 0,
+                )
+            )
+        return "\n".join(lines)
+
+
+profiler = Profiler.from_config()
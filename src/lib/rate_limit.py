@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+
+from .config import Config
+
+# Below this many remaining requests the pace is spread over the time left
+# until the primary rate limit resets
+LOW_BUDGET = 100
+MAX_BACKOFF = 120
+
+
+class RateLimitScheduler:
+    """Paces every GitHub request against GitHub's rate limits.
+
+    Requests are admitted by a token bucket of GHA_API_RATE requests per
+    second, a rate of 0 or less leaves requests unpaced. X-RateLimit-Remaining and X-RateLimit-Reset from each response
+    slow the pace down as the primary budget runs out and hold all requests
+    until the reset once it is exhausted. Rate limited responses (403/429
+    with Retry-After, an exhausted budget or a secondary rate limit message)
+    are retried after Retry-After, the reset time or a jittered exponential
+    backoff, and hold back every other request meanwhile.
+    """
+
+    def __init__(self, rate, max_retries):
+        self.rate = rate
+        self.max_retries = max_retries
+        self.remaining = None
+        self.reset_at = None
+        self._capacity = max(float(rate), 1.0)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.throttled_calls = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+
+    def _reserve(self):
+        """Take a token and return how long the caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate
+            if self.reset_at is not None and self.reset_at <= time.time():
+                # The window has reset, the next response tells the new budget
+                self.remaining = None
+                self.reset_at = None
+            if self.remaining is not None and self.reset_at is not None:
+                seconds_to_reset = max(self.reset_at - time.time(), 1.0)
+                if self.remaining <= 0:
+                    self._blocked_until = max(
+                        self._blocked_until, now + seconds_to_reset
+                    )
+                elif self.remaining < LOW_BUDGET:
+                    budget_rate = self.remaining / seconds_to_reset
+                    rate = min(rate, budget_rate) if rate > 0 else budget_rate
+
+            wait = max(self._blocked_until - now, 0.0)
+            if rate > 0:
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._last_refill) * rate
+                )
+                self._tokens -= 1
+                wait = max(-self._tokens / rate, wait)
+            self._last_refill = now
+            if self.remaining is not None and self.remaining > 0:
+                self.remaining -= 1
+
+            self.calls += 1
+            if wait > 0:
+                self.throttled_calls += 1
+                self.wait_seconds += wait
+        return wait
+
+    def _update(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        with self._lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset is not None:
+                self.reset_at = int(reset)
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying a rate limited response, else None."""
+        headers = response.headers
+        retry_after = headers.get("Retry-After")
+        if response.status_code not in (403, 429):
+            return None
+        if retry_after is not None:
+            return float(retry_after)
+        if (
+            headers.get("X-RateLimit-Remaining") == "0"
+            and "X-RateLimit-Reset" in headers
+        ):
+            return max(int(headers["X-RateLimit-Reset"]) - time.time(), 1.0)
+        if response.status_code == 429 or "rate limit" in response.text.lower():
+            # Secondary rate limit without a hint, back off with jitter
+            return min(2**attempt, MAX_BACKOFF) * random.uniform(0.5, 1.5)
+        return None
+
+    def call(self, send):
+        """Run send(), which makes one request, under the rate limits."""
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait > 0:
+                time.sleep(wait)
+            response = send()
+            self._update(response.headers)
+
+            delay = self._retry_delay(response, attempt)
+            if delay is None or attempt >= self.max_retries:
+                return response
+
+            attempt += 1
+            with self._lock:
+                self.rate_limited += 1
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + delay
+                )
+            print(
+                "GitHub API rate limited, retrying in",
+                "{:.1f}s (attempt {} of {})".format(delay, attempt, self.max_retries),
+            )
+            response.close()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "throttled_calls": self.throttled_calls,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "rate_limited": self.rate_limited,
+            "remaining": self.remaining,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process wide scheduler every GitHub request goes through."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler(
+                Config.GHA_API_RATE, Config.GHA_API_RETRIES
+            )
+    return _scheduler
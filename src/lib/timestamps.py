@@ -0,0 +1,59 @@
+import calendar
+from datetime import datetime, timezone
+
+# Last "YYYY-MM-DDTHH:MM:SS" prefix seen and its epoch seconds. Consecutive
+# log lines mostly share a second, so they only parse the fraction. Stored as
+# one tuple so concurrent readers never see a torn update.
+_second_memo = (None, 0)
+
+
+def _epoch_seconds(prefix):
+    global _second_memo
+    memo_prefix, seconds = _second_memo
+    if prefix != memo_prefix:
+        seconds = calendar.timegm(
+            (
+                int(prefix[0:4]),
+                int(prefix[5:7]),
+                int(prefix[8:10]),
+                int(prefix[11:13]),
+                int(prefix[14:16]),
+                int(prefix[17:19]),
+                0,
+                0,
+                0,
+            )
+        )
+        _second_memo = (prefix, seconds)
+    return seconds
+
+
+def parse_timestamp_ns(value):
+    """Return exact UTC epoch nanoseconds for a GitHub timestamp.
+
+    Fast path for the fixed layouts GitHub uses, "2024-01-01T10:00:00Z" in
+    API payloads and "2024-01-01T10:00:00.1234567Z" in step logs. Anything
+    else goes through datetime.fromisoformat, naive values are taken as UTC.
+    Raises ValueError if value is not a timestamp.
+    """
+    if (
+        len(value) >= 20
+        and value[-1] == "Z"
+        and value[4] == "-"
+        and value[7] == "-"
+        and value[10] == "T"
+        and value[13] == ":"
+        and value[16] == ":"
+    ):
+        fraction = value[20:-1]
+        if len(value) == 20 or (value[19] == "." and fraction.isdigit()):
+            nanos = int(fraction[:9].ljust(9, "0")) if fraction else 0
+            return _epoch_seconds(value[:19]) * 1000000000 + nanos
+
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    delta = parsed - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (
+        delta.days * 86400 + delta.seconds
+    ) * 1000000000 + delta.microseconds * 1000
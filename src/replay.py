@@ -0,0 +1,136 @@
+"""Ship an OTLP capture file written with OTEL_EXPORTER_FILE to an OTLP endpoint.
+
+Records are coalesced into requests of up to --batch-bytes and sent as they
+are read, without decoding them, so large captures stream in constant memory.
+Sent over OTLP/gRPC, or OTLP/HTTP when OTEL_EXPORTER_OTLP_PROTOCOL is
+http/protobuf.
+"""
+import argparse
+import gzip
+import time
+from urllib.parse import urlparse
+
+import grpc
+import requests
+
+from lib.config import Config
+from lib.http_client import get_session
+from lib.otlp_file import LOGS, METRICS, SPANS, read_batches
+
+METHODS = {
+    SPANS: "/opentelemetry.proto.collector.trace.v1.TraceService/Export",
+    LOGS: "/opentelemetry.proto.collector.logs.v1.LogsService/Export",
+    METRICS: "/opentelemetry.proto.collector.metrics.v1.MetricsService/Export",
+}
+MAX_RETRIES = 5
+RETRYABLE = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+)
+RETRYABLE_STATUS = (429, 502, 503, 504)
+TIMEOUT = 30
+HTTP_PATHS = {SPANS: "/v1/traces", LOGS: "/v1/logs", METRICS: "/v1/metrics"}
+
+
+def parse_headers(headers):
+    """"k1=v1,k2=v2" as gRPC metadata, the format OTEL headers are given in."""
+    metadata = []
+    for pair in filter(None, headers.split(",")):
+        key, _, value = pair.partition("=")
+        metadata.append((key.strip().lower(), value.strip()))
+    return metadata
+
+
+def open_channel(endpoint):
+    url = urlparse(endpoint if "://" in endpoint else "https://" + endpoint)
+    if url.scheme == "http":
+        return grpc.insecure_channel(url.netloc, compression=grpc.Compression.Gzip)
+    return grpc.secure_channel(
+        url.netloc, grpc.ssl_channel_credentials(), compression=grpc.Compression.Gzip
+    )
+
+
+def replay(path, endpoint, headers, batch_bytes):
+    """Send every record of the capture file, return (requests, bytes) sent."""
+    if Config.OTEL_EXPORTER_OTLP_PROTOCOL == "http/protobuf":
+        return replay_http(path, endpoint, headers, batch_bytes)
+    metadata = parse_headers(headers)
+    requests_sent = bytes_sent = 0
+    with open_channel(endpoint) as channel:
+        # No serializers: the payloads already are serialized export requests
+        calls = {kind: channel.unary_unary(method) for kind, method in METHODS.items()}
+        for kind, payload in read_batches(path, batch_bytes):
+            for attempt in range(MAX_RETRIES):
+                try:
+                    calls[kind](payload, metadata=metadata, timeout=TIMEOUT)
+                    break
+                except grpc.RpcError as e:
+                    if e.code() not in RETRYABLE or attempt == MAX_RETRIES - 1:
+                        raise
+                    time.sleep(min(2**attempt, 30))
+            requests_sent += 1
+            bytes_sent += len(payload)
+    return requests_sent, bytes_sent
+
+
+def replay_http(path, endpoint, headers, batch_bytes):
+    """replay() over OTLP/HTTP, POSTing gzipped payloads to <endpoint>/v1/<signal>."""
+    http_headers = dict(parse_headers(headers))
+    http_headers["Content-Type"] = "application/x-protobuf"
+    http_headers["Content-Encoding"] = "gzip"
+    session = get_session()
+    requests_sent = bytes_sent = 0
+    for kind, payload in read_batches(path, batch_bytes):
+        url = endpoint.rstrip("/") + HTTP_PATHS[kind]
+        body = gzip.compress(payload)
+        for attempt in range(MAX_RETRIES):
+            try:
+                response = session.post(
+                    url, data=body, headers=http_headers, timeout=TIMEOUT
+                )
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES - 1:
+                    raise
+            else:
+                if attempt == MAX_RETRIES - 1:
+                    response.raise_for_status()
+            time.sleep(min(2**attempt, 30))
+        requests_sent += 1
+        bytes_sent += len(payload)
+    return requests_sent, bytes_sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--endpoint", default=Config().OTEL_COLLECTOR_ENDPOINT)
+    parser.add_argument(
+        "--headers", default="api-key={}".format(Config.NEW_RELIC_LICENSE_KEY)
+    )
+    parser.add_argument("--batch-bytes", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        requests_sent, bytes_sent = replay(
+            args.path, args.endpoint, args.headers, args.batch_bytes
+        )
+    except grpc.RpcError as e:
+        print("Replay to", args.endpoint, "failed ->", e.code(), e.details())
+        exit(1)
+    except requests.RequestException as e:
+        print("Replay to", args.endpoint, "failed ->", e)
+        exit(1)
+    print(
+        "Replayed {} -> {} requests, {} bytes in {:.2f}s".format(
+            args.path, requests_sent, bytes_sent, time.perf_counter() - started
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
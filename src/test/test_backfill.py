@@ -0,0 +1,58 @@
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from backfill import Checkpoint, export_run, list_runs
+from lib.models import WorkflowRun
+
+
+class TestBackfill:
+    def test_checkpoint_survives_restart(self, tmp_path):
+        path = str(tmp_path / "backfill.checkpoint")
+        checkpoint = Checkpoint(path)
+        checkpoint.add(1)
+        checkpoint.add(2)
+        restarted = Checkpoint(path)
+        assert 1 in restarted and 2 in restarted and 3 not in restarted
+
+    def test_list_runs_skips_exported_runs_day_by_day(self, tmp_path):
+        checkpoint = Checkpoint(str(tmp_path / "backfill.checkpoint"))
+        checkpoint.add(1)
+        api = MagicMock()
+        api.count_workflow_runs.return_value = 2
+        api.get_workflow_runs.side_effect = lambda created, status, cached: iter(
+            [WorkflowRun({"id": 1}), WorkflowRun({"id": 2})]
+            if created == "2024-01-01"
+            else [WorkflowRun({"id": 3})]
+        )
+        runs = list(
+            list_runs(api, date(2024, 1, 1), date(2024, 1, 2), checkpoint)
+        )
+        assert [run.id for run in runs] == [2, 3]
+        assert [c.kwargs["created"] for c in api.get_workflow_runs.call_args_list] == [
+            "2024-01-01",
+            "2024-01-02",
+        ]
+
+    def test_days_over_the_listing_limit_are_split(self, tmp_path):
+        checkpoint = Checkpoint(str(tmp_path / "backfill.checkpoint"))
+        api = MagicMock()
+        api.count_workflow_runs.side_effect = lambda created, status, cached: (
+            1500 if created == "2024-01-01" else 1001 if "T05:" in created else 10
+        )
+        api.get_workflow_runs.return_value = iter([])
+        list(list_runs(api, date(2024, 1, 1), date(2024, 1, 1), checkpoint))
+        listed = [c.kwargs["created"] for c in api.get_workflow_runs.call_args_list]
+        assert len(listed) == 23 + 60
+        assert listed[0] == "2024-01-01T00:00:00Z..2024-01-01T00:59:59Z"
+        assert listed[5] == "2024-01-01T05:00:00Z..2024-01-01T05:00:59Z"
+        assert listed[-1] == "2024-01-01T23:00:00Z..2024-01-01T23:59:59Z"
+
+    def test_only_fully_exported_runs_are_checkpointed(self, tmp_path):
+        checkpoint = Checkpoint(str(tmp_path / "backfill.checkpoint"))
+        run = WorkflowRun({"id": 1, "name": "CI"})
+        with patch("backfill.export_and_flush", return_value=False):
+            assert not export_run(MagicMock(), run, checkpoint)
+        assert 1 not in checkpoint
+        with patch("backfill.export_and_flush", return_value=True):
+            assert export_run(MagicMock(), run, checkpoint)
+        assert 1 in checkpoint
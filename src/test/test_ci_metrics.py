@@ -0,0 +1,99 @@
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.resources import Resource
+
+from lib import otel
+from lib.ci_metrics import get_ci_metrics
+from lib.models import Job, Step, WorkflowRun
+from lib.otlp_file import METRICS, read_records
+
+
+def collected(reader):
+    points = {}
+    for resource_metrics in reader.get_metrics_data().resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                points[metric.name] = list(metric.data.data_points)
+    return points
+
+
+JOB = Job(
+    {
+        "name": "build",
+        "conclusion": "success",
+        "labels": ["ubuntu-latest"],
+        "created_at": "2024-01-01T10:00:00Z",
+        "started_at": "2024-01-01T10:00:30Z",
+        "completed_at": "2024-01-01T10:02:30Z",
+    }
+)
+
+
+class TestCiMetrics:
+    def setup_method(self):
+        self.reader = InMemoryMetricReader()
+        provider = MeterProvider(metric_readers=[self.reader])
+        self.ci_metrics = get_ci_metrics(provider.get_meter("test"))
+
+    def test_job_duration_and_queue_time(self):
+        self.ci_metrics.record_job(JOB, "CI")
+        points = collected(self.reader)
+        (duration,) = points["github.job.duration"]
+        assert duration.sum == 120
+        assert dict(duration.attributes) == {
+            "workflow": "CI",
+            "job": "build",
+            "conclusion": "success",
+            "runner": "ubuntu-latest",
+        }
+        assert points["github.job.queue_time"][0].sum == 30
+        assert points["github.job.count"][0].value == 1
+
+    def test_skipped_steps_are_counted_without_duration(self):
+        step = Step({"name": "Deploy", "conclusion": "skipped"})
+        self.ci_metrics.record_step(step, JOB, "CI")
+        points = collected(self.reader)
+        assert points["github.step.count"][0].attributes["conclusion"] == "skipped"
+        assert "github.step.duration" not in points
+
+    def test_run_attributes_are_low_cardinality(self):
+        run = WorkflowRun(
+            {
+                "id": 1,
+                "name": "CI",
+                "head_branch": "feature/x",
+                "head_sha": "abc",
+                "conclusion": "failure",
+                "event": "push",
+            }
+        )
+        self.ci_metrics.record_run(run, 0, 90 * 10**9, "main")
+        (duration,) = collected(self.reader)["github.workflow_run.duration"]
+        assert duration.sum == 90
+        assert dict(duration.attributes) == {
+            "workflow": "CI",
+            "conclusion": "failure",
+            "event": "push",
+            "default_branch": False,
+        }
+
+    def test_run_on_the_default_branch(self):
+        run = WorkflowRun({"id": 1, "name": "CI", "head_branch": "main"})
+        self.ci_metrics.record_run(run, 0, 10**9, "main")
+        (count,) = collected(self.reader)["github.workflow_run.count"]
+        assert count.attributes["default_branch"] is True
+
+    def test_instruments_created_once_per_meter(self):
+        meter = MeterProvider().get_meter("test")
+        assert get_ci_metrics(meter) is get_ci_metrics(meter)
+
+
+class TestGetMeter:
+    def test_metrics_exported_on_shutdown(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        meter = otel.get_meter(
+            "file://" + str(path), "", Resource(attributes={}), "meter"
+        )
+        get_ci_metrics(meter).record_job(JOB, "CI")
+        otel.shutdown_providers()
+        assert METRICS in [kind for kind, _ in read_records(str(path))]
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+from lib import custom_parser
+from lib.config import Config
+from lib.custom_parser import parse_attributes
+
+
+class TestParseAttributes:
+    def test_flattens_nested_objects_and_lists(self):
+        obj = {
+            "Name": "build",
+            "conclusion": "success",
+            "head_commit": {"author": {"name": "Dev", "email": "dev@example.com"}},
+            "pull_requests": [{"number": 7, "url": None}],
+            "empty": None,
+        }
+        assert parse_attributes(obj, "", "job") == {
+            "name": "build",
+            "conclusion": "success",
+            "head_commit.author.name": "Dev",
+            "head_commit.author.email": "dev@example.com",
+            "pull_requests.number": "7",
+        }
+
+    def test_adds_epoch_ms_unless_skipped(self):
+        obj = {"conclusion": "success", "started_at": "2024-01-01T00:00:01Z"}
+        assert "started_at_ms" in parse_attributes(obj, "", "step")
+        obj["conclusion"] = "skipped"
+        assert "started_at_ms" not in parse_attributes(obj, "", "step")
+
+    def test_values_past_max_depth_are_strings(self):
+        obj = {"a": {"b": {"c": {"d": 1}}}}
+        assert parse_attributes(obj, "", "job") == {"a.b.c": "{'d': 1}"}
+        with patch.object(Config, "GHA_ATTRIBUTES_MAX_DEPTH", 4):
+            assert parse_attributes(obj, "", "job") == {"a.b.c.d": "1"}
+
+    def test_dropped_paths_prune_subtrees(self):
+        custom_parser._drop_set.cache_clear()
+        obj = {
+            "steps": [{"name": "s1"}],
+            "repository": {"owner": {"login": "o"}, "name": "r"},
+        }
+        with patch.object(Config, "GHA_ATTRIBUTES_DROP", "Repository.Owner"):
+            assert parse_attributes(obj, "steps", "job") == {"repository.name": "r"}
+        custom_parser._drop_set.cache_clear()
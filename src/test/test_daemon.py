@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from daemon import QueueFileProgress, RunQueue, follow_queue_file, parse_webhook
+from lib.config import Config
+
+
+def webhook(action="completed", repository="o/r"):
+    return json.dumps(
+        {
+            "action": action,
+            "repository": {"full_name": repository},
+            "workflow_run": {"id": 42, "name": "CI"},
+        }
+    ).encode("utf-8")
+
+
+@patch.object(Config, "GHA_SERVICE_NAME", "o/r")
+class TestParseWebhook:
+    def test_completed_workflow_run(self):
+        headers = {"X-GitHub-Event": "workflow_run"}
+        assert parse_webhook(headers, webhook()) == ("42", "CI")
+
+    def test_ignores_other_events_and_repositories(self):
+        assert parse_webhook({"X-GitHub-Event": "push"}, webhook()) is None
+        headers = {"X-GitHub-Event": "workflow_run"}
+        assert parse_webhook(headers, webhook(action="requested")) is None
+        assert parse_webhook(headers, webhook(repository="o/other")) is None
+
+    def test_checks_signature_when_secret_is_set(self):
+        body = webhook()
+        signature = "sha256=" + hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+        with patch.object(Config, "GHA_WEBHOOK_SECRET", "s3cret"):
+            headers = {"X-GitHub-Event": "workflow_run"}
+            with pytest.raises(PermissionError):
+                parse_webhook(headers, body)
+            headers["X-Hub-Signature-256"] = signature
+            assert parse_webhook(headers, body) == ("42", "CI")
+
+
+class TestRunQueue:
+    def test_ignores_runs_already_waiting(self):
+        run_queue = RunQueue()
+        assert run_queue.put("1", "CI")
+        assert not run_queue.put("1", "CI")
+        assert run_queue.get(timeout=1) == ("1", "CI", None)
+        assert run_queue.put("1", "CI")
+
+
+def drain(run_queue):
+    runs = []
+    while not run_queue._queue.empty():
+        runs.append(run_queue.get())
+    return runs
+
+
+class TestFollowQueueFile:
+    def follow(self, path):
+        """Read path as a restarted daemon, return its progress and queued runs."""
+        run_queue = RunQueue()
+        progress = QueueFileProgress(str(path))
+        stop = threading.Event()
+        # Stop at the end of the file instead of waiting for more lines
+        with patch("daemon.time.sleep", lambda seconds: stop.set()):
+            follow_queue_file(str(path), run_queue, stop, progress)
+        return progress, drain(run_queue)
+
+    def test_runs_not_exported_are_queued_again_after_restart(self, tmp_path):
+        path = tmp_path / "runs.queue"
+        path.write_text("".join("{}\n".format(run_id) for run_id in range(1, 11)))
+        progress, runs = self.follow(path)
+        assert [run[0] for run in runs] == [str(run_id) for run_id in range(1, 11)]
+        # Stopped after exporting run 1, and run 3 out of order
+        progress.done(runs[0][2])
+        progress.done(runs[2][2])
+        assert progress.offset == 2
+
+        progress, runs = self.follow(path)
+        assert [run[0] for run in runs] == [str(run_id) for run_id in range(2, 11)]
+        for run in runs:
+            progress.done(run[2])
+        assert self.follow(path)[1] == []
+
+    def test_only_lines_appended_are_read(self, tmp_path):
+        path = tmp_path / "runs.queue"
+        path.write_text("1 CI\n\n1 CI\n3 Dep")
+        progress, runs = self.follow(path)
+        assert [run[:2] for run in runs] == [("1", "CI")]
+        progress.done(runs[0][2])
+        # The blank line and the repeated run are done along with run 1
+        assert progress.offset == 11
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("loy\n")
+        assert [run[:2] for run in self.follow(path)[1]] == [("3", "Deploy")]
+
+    def test_truncated_file_is_read_from_the_start(self, tmp_path):
+        path = tmp_path / "runs.queue"
+        path.write_text("1\n2\n")
+        progress, runs = self.follow(path)
+        for run in runs:
+            progress.done(run[2])
+        path.write_text("3\n")
+        assert [run[0] for run in self.follow(path)[1]] == ["3"]
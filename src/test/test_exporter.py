@@ -0,0 +1,199 @@
+import zipfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from opentelemetry.sdk._logs.export import InMemoryLogRecordExporter
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from exporter import export_and_flush, export_workflow_run, record_export
+from lib import otel
+from lib.config import Config
+from lib.ledger import get_ledger
+from lib.log_parser import LogArchive
+from lib.models import Job, WorkflowRun
+
+JOBS = 4
+STEPS = 3
+LINES = 20
+
+
+def synthetic_run(tmp_path):
+    jobs = []
+    path = tmp_path / "logs.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for j in range(JOBS):
+            steps = []
+            for number in range(1, STEPS + 1):
+                second = "2024-01-01T10:{:02d}:{:02d}".format(j, number * 10)
+                steps.append(
+                    {
+                        "number": number,
+                        "name": "step {}".format(number),
+                        "status": "completed",
+                        "conclusion": "success",
+                        "started_at": second + "Z",
+                        "completed_at": second[:-1] + "9Z",
+                    }
+                )
+                zf.writestr(
+                    "job {}/{}_step {}.txt".format(j, number, number),
+                    "".join(
+                        "{}.{:07d}Z job {} step {} line {}\n".format(
+                            second, i, j, number, i
+                        )
+                        for i in range(LINES)
+                    ),
+                )
+            jobs.append(
+                Job(
+                    {
+                        "id": j,
+                        "run_id": 1,
+                        "name": "job {}".format(j),
+                        "status": "completed",
+                        "conclusion": "success",
+                        "started_at": "2024-01-01T10:{:02d}:00Z".format(j),
+                        "completed_at": "2024-01-01T10:{:02d}:59Z".format(j),
+                        "steps": steps,
+                    }
+                )
+            )
+    api = MagicMock()
+    api.get_workflow_run_jobs_by_run_id.return_value = jobs
+    api.get_workflow_run_by_id.return_value = WorkflowRun(
+        {
+            "id": 1,
+            "name": "CI",
+            "run_attempt": 1,
+            "run_started_at": "2024-01-01T10:00:00Z",
+            "updated_at": "2024-01-01T11:00:00Z",
+        }
+    )
+    api.get_commit_count_of_workflow_run.return_value = None
+    return api, path
+
+
+class FailingSpanExporter(InMemorySpanExporter):
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        return SpanExportResult.FAILURE
+
+
+def exporting_to(span_exporter):
+    return patch.object(otel, "_span_exporter", lambda endpoint, headers: span_exporter)
+
+
+class TestExportWorkflowRun:
+    def teardown_method(self):
+        otel.shutdown_providers()
+
+    def test_parallel_jobs_keep_span_parents_and_log_order(self, tmp_path):
+        api, log_zip = synthetic_run(tmp_path)
+        span_exporter = InMemorySpanExporter()
+        log_exporter = InMemoryLogRecordExporter()
+        with patch.object(Config, "GHA_EXPORT_WORKERS", 4), patch.object(
+            Config, "GHA_EXPORT_METRICS", False
+        ), patch.object(Config, "PARSE_LOGS", True), patch.object(
+            otel, "_span_exporter", lambda endpoint, headers: span_exporter
+        ), patch.object(
+            otel, "_log_exporter", lambda endpoint, headers: log_exporter
+        ), patch(
+            "lib.log_parser.download_log_files",
+            lambda run_id, workdir: LogArchive(log_zip),
+        ):
+            export_workflow_run(api, "1", "CI", str(tmp_path))
+            otel.shutdown_providers()
+
+        spans = span_exporter.get_finished_spans()
+        (workflow,) = [span for span in spans if span.parent is None]
+        jobs = {span.name: span for span in spans if span.name.startswith("job ")}
+        assert len(jobs) == JOBS
+        for job in jobs.values():
+            assert job.parent.span_id == workflow.context.span_id
+        job_names = {span.context.span_id: name for name, span in jobs.items()}
+        steps = {
+            span.context.span_id: span
+            for span in spans
+            if span.name.startswith("step ")
+        }
+        assert len(steps) == JOBS * STEPS
+        for step in steps.values():
+            assert step.parent.span_id in job_names
+
+        lines = {}
+        for log in log_exporter.get_finished_logs():
+            record = log.log_record
+            step = steps[record.span_id]
+            # The step's log file is named after its job, so a step under the
+            # wrong job shows in its lines
+            assert record.body.startswith(
+                "{} {} ".format(job_names[step.parent.span_id], step.name)
+            )
+            lines.setdefault(record.span_id, []).append(record.body)
+        assert len(lines) == JOBS * STEPS
+        for body in lines.values():
+            assert [int(line.rsplit(" ", 1)[1]) for line in body] == list(range(LINES))
+
+    def test_log_archive_closed_when_export_fails(self, tmp_path):
+        api, log_zip = synthetic_run(tmp_path)
+        api.get_workflow_run_by_id.side_effect = RuntimeError("GitHub is down")
+        log_archive = MagicMock()
+        with patch.object(Config, "PARSE_LOGS", True), patch(
+            "lib.log_parser.download_log_files", lambda run_id, workdir: log_archive
+        ), pytest.raises(RuntimeError):
+            export_workflow_run(api, "1", "CI", str(tmp_path))
+        log_archive.close.assert_called_once()
+
+    @patch.object(Config, "PARSE_LOGS", False)
+    @patch.object(Config, "GHA_EXPORT_METRICS", False)
+    def test_failed_jobs_are_reported(self, tmp_path):
+        api, _ = synthetic_run(tmp_path)
+        jobs = api.get_workflow_run_jobs_by_run_id.return_value
+        jobs[1].started_at = "not a time"
+        with exporting_to(InMemorySpanExporter()):
+            run_export = export_workflow_run(api, "1", "CI", str(tmp_path))
+        assert run_export.failed == [jobs[1]]
+        assert len(run_export.exported) == JOBS - 1
+        assert not run_export.complete
+
+    @patch.object(Config, "PARSE_LOGS", False)
+    @patch.object(Config, "GHA_EXPORT_METRICS", False)
+    def test_export_and_flush(self, tmp_path):
+        api, _ = synthetic_run(tmp_path)
+        with exporting_to(InMemorySpanExporter()):
+            assert export_and_flush(api, "1", "CI", str(tmp_path))
+        otel.shutdown_providers()
+        with exporting_to(FailingSpanExporter()):
+            assert not export_and_flush(api, "1", "CI", str(tmp_path))
+
+    @patch.object(Config, "PARSE_LOGS", False)
+    @patch.object(Config, "GHA_EXPORT_METRICS", False)
+    def test_ledger_records_jobs_once_flushed(self, tmp_path):
+        api, _ = synthetic_run(tmp_path)
+        jobs = api.get_workflow_run_jobs_by_run_id.return_value
+        with patch.object(Config, "GHA_LEDGER", str(tmp_path / "ledger.db")):
+            ledger = get_ledger()
+            with exporting_to(InMemorySpanExporter()):
+                run_export = export_workflow_run(api, "1", "CI", str(tmp_path))
+                # Claimed until flushed, another exporter skips them meanwhile
+                assert ledger.claim_jobs("1", jobs) == []
+                assert not record_export(run_export, flushed=False)
+                assert not ledger.run_exported("1", 1)
+
+                run_export = export_workflow_run(api, "1", "CI", str(tmp_path))
+                assert len(run_export.exported) == JOBS
+                assert record_export(run_export, flushed=True)
+            assert ledger.run_exported("1", 1)
+            assert ledger.claim_jobs("1", jobs) == []
+
+    @patch.object(Config, "PARSE_LOGS", False)
+    @patch.object(Config, "GHA_EXPORT_METRICS", False)
+    def test_ledger_releases_jobs_lost_at_flush(self, tmp_path):
+        api, _ = synthetic_run(tmp_path)
+        jobs = api.get_workflow_run_jobs_by_run_id.return_value
+        with patch.object(Config, "GHA_LEDGER", str(tmp_path / "ledger.db")):
+            with exporting_to(FailingSpanExporter()):
+                assert not export_and_flush(api, "1", "CI", str(tmp_path))
+            assert len(get_ledger().claim_jobs("1", jobs)) == JOBS
@@ -1,58 +1,248 @@
 import json
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from lib.config import Config
 from lib.github_api import GithubApi
+from lib.models import WorkflowRun
 
 
-## We're going to mock the requests that are made to the github api that
-## are used by GhApi in the GithubApi class
+def fake_response(payload, status_code=200, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.text = json.dumps(payload)
+    response.content = response.text.encode("utf-8")
+    return response
+
+
+def api_path(api, mock_get, index=0):
+    call = mock_get.call_args_list[index]
+    return call.args[0][len(api.repo_url) :], call.kwargs["params"]
+
+
+## We're going to mock the requests that are made to the github api through
+## the shared requests session used by the GithubApi class
 class TestGithubApi:
-    @patch("lib.github_api.GhApi")
-    def test_get_workflow_run_by_id(self, mock_GhApi):
+    @patch("lib.github_api.get_session")
+    def test_get_workflow_run_by_id(self, mock_get_session):
         Config.GHA_RUN_ID = 123  # pyright: ignore
-        mock_GhApi.return_value.actions.get_workflow_run.return_value = {
-            "id": "some_workflow"
-        }
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value = fake_response(
+            {"id": 123, "name": "CI", "repository": {"full_name": "o/r"}}
+        )
         api = GithubApi()
-        assert api.get_workflow_run_by_id() == json.dumps({"id": "some_workflow"})
-        mock_GhApi.return_value.actions.get_workflow_run.assert_called_once_with(123)
+        workflow_run = api.get_workflow_run_by_id()
+        assert (workflow_run.id, workflow_run.name) == (123, "CI")
+        assert workflow_run.raw["repository"] == {"full_name": "o/r"}
+        mock_get.assert_called_once()
+        assert api_path(api, mock_get) == ("/actions/runs/123", {})
 
-    @patch("lib.github_api.GhApi")
-    def test_get_workflow_run_jobs_by_run_id(self, mock_GhApi):
+    @patch("lib.github_api.get_session")
+    def test_get_default_branch_once(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value = fake_response(
+            {"full_name": "o/r", "default_branch": "main"}
+        )
+        api = GithubApi()
+        assert api.get_default_branch() == "main"
+        assert api.get_default_branch() == "main"
+        mock_get.assert_called_once()
+        assert api_path(api, mock_get) == ("", {})
+
+    @patch("lib.github_api.get_session")
+    def test_get_workflow_run_jobs_by_run_id(self, mock_get_session):
         Config.GHA_RUN_ID = 123  # pyright: ignore
-        mock_GhApi.return_value.actions.list_jobs_for_workflow_run.return_value = {
-            "jobs": ["job1", "job2"],
-            "total_count": 2,
-        }
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value = fake_response(
+            {
+                "jobs": [
+                    {"name": "job1", "steps": [{"number": 1, "name": "Set up job"}]},
+                    {"name": "job2"},
+                ],
+                "total_count": 2,
+            }
+        )
         api = GithubApi()
         res = api.get_workflow_run_jobs_by_run_id()
-        assert res == ["job1", "job2"]
-        mock_GhApi.return_value.actions.list_jobs_for_workflow_run.assert_called_once_with(
-            123, page=1
+        assert [job.name for job in res] == ["job1", "job2"]
+        assert res[0].steps[0].name == "Set up job"
+        assert "steps" not in res[0].raw
+        mock_get.assert_called_once()
+        assert api_path(api, mock_get) == (
+            "/actions/runs/123/jobs",
+            {"per_page": 100, "page": 1},
         )
 
-    @patch("lib.github_api.GhApi")
-    def test_get_commits_included_in_workflow_run(self, mock_GhApi):
-        mock_GhApi.return_value.actions.list_workflow_runs_for_repo.return_value = {
-            "workflow_runs": [
-                {"head_sha": "sha1", "id": 1},
-                {"head_sha": "sha2", "id": 2},
-            ]
-        }
-        mock_GhApi.return_value.repos.compare_commits.return_value = {
-            "commits": ["sha2"]
-        }
+    @patch("lib.github_api.get_session")
+    def test_get_workflow_run_jobs_by_run_id_fetches_remaining_pages(
+        self, mock_get_session
+    ):
+        Config.GHA_RUN_ID = 123  # pyright: ignore
+
+        def list_jobs(url, headers, params, timeout):
+            first = (params["page"] - 1) * params["per_page"]
+            return fake_response(
+                {
+                    "jobs": [{"name": "job{}".format(first + i)} for i in range(2)],
+                    "total_count": 250,
+                }
+            )
+
+        mock_get = mock_get_session.return_value.get
+        mock_get.side_effect = list_jobs
+        api = GithubApi()
+        res = api.get_workflow_run_jobs_by_run_id()
+        assert [job.name for job in res] == [
+            "job0",
+            "job1",
+            "job100",
+            "job101",
+            "job200",
+            "job201",
+        ]
+        assert mock_get.call_count == 3
+
+    @patch("lib.github_api.time.sleep")
+    @patch("lib.github_api.get_session")
+    def test_get_workflow_run_jobs_by_run_id_retries_page(
+        self, mock_get_session, mock_sleep
+    ):
+        Config.GHA_RUN_ID = 123  # pyright: ignore
+        mock_get_session.return_value.get.side_effect = [
+            Exception("502 Bad Gateway"),
+            fake_response({"jobs": [{"name": "job1"}], "total_count": 1}),
+        ]
+        api = GithubApi()
+        assert [job.name for job in api.get_workflow_run_jobs_by_run_id()] == ["job1"]
+
+    @patch("lib.github_api.get_session")
+    def test_get_workflow_runs_pages_lazily(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.side_effect = [
+            fake_response(
+                {"workflow_runs": [{"id": i} for i in range(100)], "total_count": 150}
+            ),
+            fake_response(
+                {"workflow_runs": [{"id": i} for i in range(100, 150)], "total_count": 150}
+            ),
+        ]
+        api = GithubApi()
+        runs = api.get_workflow_runs(created="2024-01-01")
+        assert next(runs).id == 0
+        assert mock_get.call_count == 1
+        assert len(list(runs)) == 149
+        assert api_path(api, mock_get, 1) == (
+            "/actions/runs",
+            {"per_page": 100, "page": 2, "created": "2024-01-01"},
+        )
+
+    @patch("lib.github_api.get_session")
+    def test_count_workflow_runs(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value = fake_response(
+            {"workflow_runs": [{"id": 1}], "total_count": 1500}
+        )
         api = GithubApi()
-        res = api.get_commits_included_in_workflow_run(
-            {"id": 1, "head_sha": "sha1"}, "some_branch"
+        assert api.count_workflow_runs(created="2024-01-01") == 1500
+        assert api_path(api, mock_get) == (
+            "/actions/runs",
+            {"per_page": 1, "created": "2024-01-01"},
+        )
+
+    @patch("lib.github_api.get_session")
+    def test_get_commit_count_of_workflow_run(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.side_effect = [
+            fake_response(
+                {
+                    "workflow_runs": [
+                        {"head_sha": "sha1", "id": 0},
+                        {"head_sha": "sha2", "id": 2},
+                    ],
+                    "total_count": 2,
+                }
+            ),
+            fake_response({"total_commits": 300, "commits": ["sha2"]}),
+            fake_response({"total_commits": 300, "commits": ["sha2"]}),
+        ]
+        api = GithubApi()
+        run = {"id": 1, "head_sha": "sha1", "created_at": "2024-01-01T10:00:00Z"}
+        assert (
+            api.get_commit_count_of_workflow_run(WorkflowRun(run), "some_branch")
+            == 300
+        )
+        assert api_path(api, mock_get, 0) == (
+            "/actions/runs",
+            {
+                "per_page": 10,
+                "page": 1,
+                "branch": "some_branch",
+                "event": "push",
+                "status": "completed",
+                "created": "<2024-01-01T10:00:00Z",
+            },
         )
-        assert res == ["sha2"]
-        mock_GhApi.return_value.actions.list_workflow_runs_for_repo.assert_called_once_with(
-            branch="some_branch", event="push", status="completed"
+        assert api_path(api, mock_get, 1) == (
+            "/compare/sha2...sha1",
+            {"per_page": 1, "page": 2},
         )
-        mock_GhApi.return_value.repos.compare_commits.assert_called_once_with(
-            owner=Config.GITHUB_REPOSITORY_OWNER,
-            repo=Config.GHA_SERVICE_NAME.split("/")[1],
-            basehead="sha2...sha1",
+
+        # A re-run of the same commit does not list the runs again
+        assert api.get_commit_count_of_workflow_run(
+            WorkflowRun(dict(run, id=3)), "some_branch"
         )
+        assert mock_get.call_count == 3
+
+    @patch("lib.github_api.get_session")
+    def test_previous_run_on_next_page(self, mock_get_session):
+        def list_runs(url, headers, params, timeout):
+            first = (params["page"] - 1) * params["per_page"]
+            runs = [
+                {"id": first + i, "head_sha": "sha{}".format(first + i)}
+                for i in range(params["per_page"])
+            ]
+            return fake_response({"workflow_runs": runs, "total_count": 100})
+
+        mock_get_session.return_value.get.side_effect = list_runs
+        api = GithubApi()
+        # The run is the last one of the first page and has no created_at
+        run = WorkflowRun({"id": 9, "head_sha": "sha9"})
+        assert api.get_previous_run_head_sha(run, "main") == "sha10"
+        assert mock_get_session.return_value.get.call_count == 2
+
+        # A run missing from the listing has no previous run and is not memoized
+        missing = WorkflowRun({"id": 500, "head_sha": "x"})
+        assert api.get_previous_run_head_sha(missing, "main") is None
+        assert ("main", "x") not in api._previous_head_sha
+
+    @patch("lib.github_api.get_session")
+    def test_conditional_request_served_from_cache(self, mock_get_session, tmp_path):
+        Config.GHA_RUN_ID = 123  # pyright: ignore
+        mock_get = mock_get_session.return_value.get
+        mock_get.side_effect = [
+            fake_response({"id": 123}, headers={"ETag": '"abc"'}),
+            fake_response(None, status_code=304),
+        ]
+        with patch.object(Config, "GHA_CACHE_DIR", str(tmp_path)):
+            api = GithubApi()
+            assert api.get_workflow_run_by_id().id == 123
+            assert api.get_workflow_run_by_id().id == 123
+        second_headers = mock_get.call_args_list[1].kwargs["headers"]
+        assert second_headers["If-None-Match"] == '"abc"'
+
+    @patch("lib.github_api.get_session")
+    def test_previous_run_listing_served_from_cache(self, mock_get_session, tmp_path):
+        mock_get = mock_get_session.return_value.get
+        listing = {"workflow_runs": [{"head_sha": "sha2", "id": 2}], "total_count": 1}
+        mock_get.side_effect = [
+            fake_response(listing, headers={"ETag": '"runs"'}),
+            fake_response(None, status_code=304),
+        ]
+        run = {"id": 1, "head_sha": "sha1", "created_at": "2024-01-01T10:00:00Z"}
+        with patch.object(Config, "GHA_CACHE_DIR", str(tmp_path)):
+            # A new GithubApi has no memo, the listing is asked for again
+            for _ in range(2):
+                api = GithubApi()
+                assert api.get_previous_run_head_sha(WorkflowRun(run), "main") == "sha2"
+        second_headers = mock_get.call_args_list[1].kwargs["headers"]
+        assert second_headers["If-None-Match"] == '"runs"'
@@ -0,0 +1,24 @@
+import os
+
+from lib.http_cache import ResponseCache
+
+
+class TestResponseCache:
+    def test_round_trip(self, tmp_path):
+        cache = ResponseCache(str(tmp_path), 1024)
+        assert cache.get("https://x/a") is None
+        cache.put("https://x/a", '"etag"', b'{"a": 1}\n')
+        assert cache.get("https://x/a") == ('"etag"', b'{"a": 1}\n')
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResponseCache(str(tmp_path), 250)
+        cache.put("a", "1", b"a" * 100)
+        cache.put("b", "2", b"b" * 100)
+        # Make "a" older, then touch it so "b" becomes the eviction candidate
+        for key, mtime in (("a", 1), ("b", 2)):
+            os.utime(cache._path(key), (mtime, mtime))
+        cache.get("a")
+        cache.put("c", "3", b"c" * 100)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
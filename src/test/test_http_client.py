@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from lib.http_client import download_file
+
+
+def fake_response(status_code, chunks, error=None):
+    def iter_content(chunk_size):
+        yield from chunks
+        if error is not None:
+            raise error
+
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = {}
+    response.iter_content.side_effect = iter_content
+    response.__enter__.return_value = response
+    return response
+
+
+class TestDownloadFile:
+    @patch("lib.http_client.time.sleep")
+    @patch("lib.http_client.get_session")
+    def test_resumes_with_range_after_interruption(
+        self, mock_get_session, mock_sleep, tmp_path
+    ):
+        mock_get_session.return_value.get.side_effect = [
+            fake_response(
+                200, [b"abc"], requests.exceptions.ChunkedEncodingError("cut")
+            ),
+            fake_response(206, [b"def"]),
+        ]
+        path = tmp_path / "log.zip"
+        assert download_file("https://x/logs", {"A": "b"}, path) == 6
+        assert path.read_bytes() == b"abcdef"
+        second_call = mock_get_session.return_value.get.call_args_list[1]
+        assert second_call.kwargs["headers"] == {"A": "b", "Range": "bytes=3-"}
+
+    @patch("lib.http_client.time.sleep")
+    @patch("lib.http_client.get_session")
+    def test_restarts_when_range_is_ignored(
+        self, mock_get_session, mock_sleep, tmp_path
+    ):
+        mock_get_session.return_value.get.side_effect = [
+            fake_response(200, [b"ab"], requests.exceptions.ConnectionError()),
+            fake_response(200, [b"abcd"]),
+        ]
+        path = tmp_path / "log.zip"
+        assert download_file("https://x/logs", {}, path) == 4
+        assert path.read_bytes() == b"abcd"
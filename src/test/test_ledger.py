@@ -0,0 +1,65 @@
+import threading
+from unittest.mock import patch
+
+from lib.config import Config
+from lib.ledger import ExportLedger, get_ledger
+from lib.models import Job
+
+
+def jobs(*ids, attempt=1):
+    return [Job({"id": job_id, "run_attempt": attempt}) for job_id in ids]
+
+
+class TestExportLedger:
+    def test_exported_jobs_are_skipped(self, tmp_path):
+        ledger = ExportLedger(str(tmp_path / "ledger.db"))
+        first = jobs(1, 2)
+        assert ledger.claim_jobs(100, first) == first
+        assert ledger.claim_jobs(100, jobs(1, 2)) == []
+        ledger.finish_jobs(100, first, [])
+        assert ledger.finish_run(100, 1, first)
+        assert ledger.run_exported(100, 1)
+        assert not ledger.run_exported(100, 2)
+
+        # A re-run of job 2 is a new job of attempt 2, job 1 is carried over
+        rerun = jobs(1) + jobs(3, attempt=2)
+        assert [job.id for job in ledger.claim_jobs(100, rerun)] == [3]
+
+    def test_failed_jobs_are_released(self, tmp_path):
+        ledger = ExportLedger(str(tmp_path / "ledger.db"))
+        claimed = ledger.claim_jobs(100, jobs(1, 2))
+        ledger.finish_jobs(100, claimed[:1], claimed[1:])
+        assert not ledger.finish_run(100, 1, claimed)
+        assert [job.id for job in ledger.claim_jobs(100, jobs(1, 2))] == [2]
+
+    def test_stale_claims_are_taken_over(self, tmp_path):
+        path = str(tmp_path / "ledger.db")
+        ExportLedger(path).claim_jobs(100, jobs(1))
+        assert ExportLedger(path).claim_jobs(100, jobs(1)) == []
+        assert len(ExportLedger(path, claim_ttl=-1).claim_jobs(100, jobs(1))) == 1
+
+    def test_concurrent_exporters_claim_each_job_once(self, tmp_path):
+        path = str(tmp_path / "ledger.db")
+        ExportLedger(path)
+        claimed = []
+        lock = threading.Lock()
+
+        def exporter():
+            ledger = ExportLedger(path)
+            for start in range(0, 100, 10):
+                ids = [job.id for job in ledger.claim_jobs(100, jobs(*range(start, start + 10)))]
+                with lock:
+                    claimed.extend(ids)
+
+        threads = [threading.Thread(target=exporter) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(claimed) == list(range(100))
+
+    def test_get_ledger(self, tmp_path):
+        with patch.object(Config, "GHA_LEDGER", ""):
+            assert get_ledger() is None
+        with patch.object(Config, "GHA_LEDGER", str(tmp_path / "ledger.db")):
+            assert get_ledger() is get_ledger()
@@ -0,0 +1,279 @@
+import logging
+import pickle
+import zipfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+from lib.config import Config
+from lib.models import Job, Step
+from lib.log_parser import (
+    ERROR,
+    GROUP,
+    LogArchive,
+    LogBatchPool,
+    LogDirectory,
+    classify_line,
+    download_job_logs,
+    parse_log_files,
+    read_log_batch,
+    split_job_log,
+)
+
+
+@pytest.fixture
+def log_zip(tmp_path):
+    path = tmp_path / "log.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("1_build.txt", "full job log\n")
+        zf.writestr(
+            "build/1_Set up job.txt",
+            "2024-01-01T10:00:00.0000000Z Starting\n"
+            "2024-01-01T10:00:01.0000000Z ##[error]Boom\n",
+        )
+        zf.writestr("build/2_Run npm ci.txt", "2024-01-01T10:00:02.0000000Z ok\n")
+    return path
+
+
+class TestLogArchive:
+    def test_open_step_reads_member_by_job_and_step_number(self, log_zip):
+        with LogArchive(log_zip) as archive:
+            with archive.open_step("build", 2) as f:
+                assert list(f) == ["2024-01-01T10:00:02.0000000Z ok\n"]
+
+    def test_open_step_missing_member(self, log_zip):
+        with LogArchive(log_zip) as archive:
+            with pytest.raises(FileNotFoundError):
+                archive.open_step("build", 3)
+
+    def test_parse_log_files_from_archive(self, log_zip):
+        job = Job({"name": "build"})
+        step = Step({"name": "Set up job", "number": 1, "conclusion": "failure"})
+        job_logger = MagicMock()
+        child_0, child_1 = MagicMock(), MagicMock()
+        with LogArchive(log_zip) as archive:
+            parse_log_files(job, step, child_0, child_1, job_logger, logging, archive)
+        calls = job_logger._log.call_args_list
+        assert [c.kwargs["level"] for c in calls] == [logging.INFO, logging.ERROR]
+        assert calls[1].kwargs["extra"]["log.timestamp"] == 1704103201000.0
+        child_1.set_status.assert_called_once()
+
+    def test_parse_log_files_collapses_repeated_lines(self, tmp_path):
+        path = tmp_path / "log.zip"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr(
+                "build/1_test.txt",
+                "2024-01-01T10:00:00.0000000Z same\n" * 3
+                + "2024-01-01T10:00:01.0000000Z done\n",
+            )
+        job_logger = MagicMock()
+        with patch.object(Config, "GHA_LOG_DEDUP", True), LogArchive(path) as archive:
+            parse_log_files(
+                Job({"name": "build"}),
+                Step({"name": "test", "number": 1, "conclusion": "success"}),
+                MagicMock(),
+                MagicMock(),
+                job_logger,
+                logging,
+                archive,
+            )
+        calls = job_logger._log.call_args_list
+        assert [c.kwargs["msg"] for c in calls] == ["same", "done"]
+        assert calls[0].kwargs["extra"]["log.repeat_count"] == 3
+
+
+class TestLogBatchPool:
+    def test_batch_records_match_the_log(self, log_zip):
+        batch = read_log_batch(str(log_zip), "build/1_Set up job.txt")
+        batch = pickle.loads(pickle.dumps(batch))
+        assert list(batch.records()) == [
+            (
+                1704103200000000000,
+                logging.INFO,
+                None,
+                0,
+                "Starting",
+                "2024-01-01T10:00:00.000",
+            ),
+            (
+                1704103201000000000,
+                logging.ERROR,
+                ERROR,
+                len("##[error]"),
+                "##[error]Boom",
+                "2024-01-01T10:00:01.000",
+            ),
+        ]
+
+    def test_parse_log_files_from_worker_processes(self, log_zip):
+        job = Job(
+            {
+                "name": "build",
+                "steps": [
+                    {"name": "Set up job", "number": 1, "conclusion": "failure"},
+                    {"name": "Run npm ci", "number": 2, "conclusion": "success"},
+                    {"name": "Deploy", "number": 3, "conclusion": "success"},
+                ],
+            }
+        )
+        steps = job.steps
+        job_logger = MagicMock()
+        child_0, child_1 = MagicMock(), MagicMock()
+        pool = LogBatchPool(
+            LogArchive(log_zip), [("build", step.number) for step in steps], 2
+        )
+        try:
+            lines = [
+                parse_log_files(job, step, child_0, child_1, job_logger, logging, pool)
+                for step in steps
+            ]
+        finally:
+            pool.close()
+        assert lines == [2, 1, 0]
+        assert [c.kwargs["msg"] for c in job_logger._log.call_args_list] == [
+            "Starting",
+            "##[error]Boom",
+            "ok",
+        ]
+        child_1.set_status.assert_called_once()
+
+
+class TestLogDirectory:
+    def test_open_step_reads_extracted_file(self, log_zip, tmp_path):
+        with zipfile.ZipFile(log_zip) as zf:
+            zf.extractall(tmp_path / "logs")
+        log_directory = LogDirectory(tmp_path / "logs")
+        with log_directory.open_step("build", 2) as f:
+            assert list(f) == ["2024-01-01T10:00:02.0000000Z ok\n"]
+        with pytest.raises(FileNotFoundError):
+            log_directory.open_step("build", 3)
+
+
+JOB = {
+    "id": 7,
+    "name": "build",
+    "steps": [
+        {
+            "number": 1,
+            "conclusion": "success",
+            "started_at": "2024-01-01T10:00:00Z",
+            "completed_at": "2024-01-01T10:00:02Z",
+        },
+        {
+            "number": 2,
+            "conclusion": "success",
+            "started_at": "2024-01-01T10:00:02Z",
+            "completed_at": "2024-01-01T10:00:02Z",
+        },
+        {
+            "number": 3,
+            "conclusion": "failure",
+            "started_at": "2024-01-01T10:00:02Z",
+            "completed_at": "2024-01-01T10:00:05Z",
+        },
+        {"number": 4, "conclusion": "skipped", "started_at": None},
+    ],
+}
+JOB_LOG = (
+    "\ufeff2024-01-01T10:00:00.1000000Z Starting\n"
+    "2024-01-01T10:00:02.1000000Z Job setup done\n"
+    "2024-01-01T10:00:02.2000000Z ##[group]Run npm ci\n"
+    "2024-01-01T10:00:02.3000000Z ##[group]Run npm test\n"
+    "2024-01-01T10:00:04.0000000Z ##[error]Boom\n"
+)
+
+
+class TestJobLogs:
+    def test_split_job_log_by_step_times(self, tmp_path):
+        source = tmp_path / "job.txt"
+        source.write_text(JOB_LOG, encoding="utf-8")
+        paths = split_job_log(Job(JOB), str(source), str(tmp_path))
+        steps = {
+            number: open(path, encoding="utf-8").read().splitlines()
+            for number, path in paths.items()
+        }
+        assert [line[29:] for line in steps[1]] == ["Starting", "Job setup done"]
+        assert [line[29:] for line in steps[2]] == ["##[group]Run npm ci"]
+        assert [line[29:] for line in steps[3]] == [
+            "##[group]Run npm test",
+            "##[error]Boom",
+        ]
+        assert 4 not in steps
+
+    @patch("lib.log_parser.download_file")
+    def test_download_job_logs(self, mock_download_file, tmp_path):
+        def download(url, headers, path):
+            if "/actions/jobs/7/" not in url:
+                raise RuntimeError("HTTP 404")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(JOB_LOG)
+
+        mock_download_file.side_effect = download
+        other = dict(JOB, id=8, name="test")
+        with patch.object(Config, "GITHUB_API_URL", "https://api.github.com"):
+            job_logs = download_job_logs([Job(JOB), Job(other)], str(tmp_path))
+        with job_logs.open_step("build", 3) as f:
+            assert f.readline()[29:] == "##[group]Run npm test\n"
+        with pytest.raises(FileNotFoundError):
+            job_logs.open_step("test", 1)
+        # Jobs are downloaded concurrently, in no particular order
+        assert sorted(c.args[0] for c in mock_download_file.call_args_list) == [
+            "https://api.github.com/repos/o/r/actions/jobs/7/logs",
+            "https://api.github.com/repos/o/r/actions/jobs/8/logs",
+        ]
+
+
+class TestLineClassifier:
+    def test_classify_line(self):
+        assert classify_line("##[error]Boom") == (logging.ERROR, ERROR, 9)
+        assert classify_line("##[ERROR]Boom")[0] == logging.ERROR
+        assert classify_line("##[group]Run npm ci") == (logging.INFO, GROUP, 9)
+        assert classify_line("##[notice]x")[0] == 12
+        assert classify_line("##[unknown]x") == (logging.INFO, None, 0)
+        assert classify_line("plain ##[error]") == (logging.INFO, None, 0)
+
+    def test_groups_become_child_spans(self, tmp_path):
+        path = tmp_path / "log.zip"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr(
+                "build/1_test.txt",
+                "2024-01-01T10:00:00.0000000Z ##[group]Run npm ci\n"
+                "2024-01-01T10:00:01.0000000Z added 10 packages\n"
+                "2024-01-01T10:00:02.0000000Z ##[endgroup]\n"
+                "2024-01-01T10:00:03.0000000Z ##[group]Run npm test\n"
+                "2024-01-01T10:00:04.0000000Z ##[error]Tests failed\n",
+            )
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tracer = provider.get_tracer(__name__)
+        step_span = tracer.start_span("test")
+        job_logger = MagicMock()
+        with LogArchive(path) as archive:
+            parse_log_files(
+                Job({"name": "build"}),
+                Step({"name": "test", "number": 1, "conclusion": "failure"}),
+                MagicMock(),
+                step_span,
+                job_logger,
+                logging,
+                archive,
+                tracer,
+            )
+        step_span.end()
+
+        install, test, _ = exporter.get_finished_spans()
+        assert install.name == "Run npm ci"
+        assert install.parent.span_id == step_span.get_span_context().span_id
+        assert (install.start_time, install.end_time) == (
+            1704103200000000000,
+            1704103202000000000,
+        )
+        assert install.attributes["log.lines"] == 2
+        assert test.end_time == 1704103204000000000
+        assert test.status.status_code == StatusCode.ERROR
+        assert job_logger._log.call_count == 5
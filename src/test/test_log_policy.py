@@ -0,0 +1,31 @@
+from unittest.mock import patch
+
+from lib.config import Config
+from lib.log_policy import LogPolicy, name_matches, split_patterns
+from lib.models import Job, Step
+
+
+class TestLogPolicy:
+    def test_defaults_select_everything(self):
+        policy = LogPolicy.from_config()
+        job = Job({"name": "build", "conclusion": "success"})
+        assert policy.selects_job(job)
+        assert policy.selects_step(job, Step({"name": "Run tests"}))
+
+    def test_conclusion_job_and_step_globs(self):
+        with patch.object(Config, "GHA_LOG_JOBS", "test (*), lint"), patch.object(
+            Config, "GHA_LOG_STEPS", "run *"
+        ), patch.object(Config, "GHA_LOG_CONCLUSIONS", "failure, cancelled"):
+            policy = LogPolicy.from_config()
+        failed = {"name": "Test (ubuntu, 3.11)", "conclusion": "failure"}
+        assert policy.selects_job(Job(failed))
+        assert policy.selects_step(Job(failed), Step({"name": "Run tests"}))
+        assert not policy.selects_step(Job(failed), Step({"name": "Set up job"}))
+        assert not policy.selects_job(Job(dict(failed, conclusion="success")))
+        assert not policy.selects_job(Job({"name": "build", "conclusion": "failure"}))
+
+    def test_name_matches(self):
+        patterns = split_patterns("new-relic-exporter, deploy-*")
+        assert name_matches("New-Relic-Exporter", patterns)
+        assert name_matches("deploy-prod", patterns)
+        assert not name_matches("build", patterns)
@@ -0,0 +1,86 @@
+import logging
+from unittest.mock import patch
+
+from lib.config import Config
+from lib.log_reducer import LogReducer
+
+
+def reduce(reducer, lines):
+    records = []
+    for i, (level, msg) in enumerate(lines):
+        records.extend(reducer.add(level, msg, {"log.timestamp": i}))
+    records.extend(reducer.finish())
+    return records
+
+
+def info(n, prefix="line"):
+    return [(logging.INFO, "{} {}".format(prefix, i)) for i in range(n)]
+
+
+class TestLogReducer:
+    def test_disabled_by_default(self):
+        assert LogReducer.from_config() is None
+        with patch.object(Config, "GHA_LOG_MAX_LINES", 10):
+            assert LogReducer.from_config().tail_lines == 5
+
+    def test_collapses_repeated_lines(self):
+        lines = [(logging.INFO, "a")] * 3 + [(logging.INFO, "b"), (logging.INFO, "a")]
+        records = reduce(LogReducer(dedup=True), lines)
+        assert [(msg, extra.get("log.repeat_count")) for _, msg, extra in records] == [
+            ("a", 3),
+            ("b", None),
+            ("a", None),
+        ]
+        assert records[0][2]["log.timestamp"] == 0
+
+    def test_keeps_head_and_tail(self):
+        reducer = LogReducer(max_lines=4)
+        records = reduce(reducer, info(10))
+        assert [msg for _, msg, _ in records] == [
+            "line 0",
+            "line 1",
+            "... 6 log lines omitted ...",
+            "line 8",
+            "line 9",
+        ]
+        assert records[2][2]["log.omitted_count"] == 6
+        assert reducer.omitted == 6
+
+    def test_keeps_errors_with_context(self):
+        lines = info(10)
+        lines[5] = (logging.ERROR, "##[error]Boom")
+        records = reduce(LogReducer(max_lines=2, context=1), lines)
+        assert [msg for _, msg, _ in records] == [
+            "line 0",
+            "... 3 log lines omitted ...",
+            "line 4",
+            "##[error]Boom",
+            "line 6",
+            "... 2 log lines omitted ...",
+            "line 9",
+        ]
+
+    def test_context_larger_than_the_tail(self):
+        lines = info(100)
+        lines[50] = (logging.ERROR, "##[error]Boom")
+        records = reduce(LogReducer(max_lines=4, context=5), lines)
+        assert [msg for _, msg, _ in records] == (
+            ["line 0", "line 1", "... 43 log lines omitted ..."]
+            + ["line {}".format(i) for i in range(45, 50)]
+            + ["##[error]Boom"]
+            + ["line {}".format(i) for i in range(51, 56)]
+            + ["... 42 log lines omitted ...", "line 98", "line 99"]
+        )
+
+    def test_byte_budget(self):
+        records = reduce(LogReducer(max_bytes=20), info(10, prefix="12345678"))
+        assert [msg for _, msg, _ in records] == [
+            "12345678 0",
+            "... 8 log lines omitted ...",
+            "12345678 9",
+        ]
+
+    def test_omitted_count_includes_collapsed_lines(self):
+        lines = info(1) + [(logging.INFO, "same")] * 5 + info(2, prefix="end")
+        records = reduce(LogReducer(dedup=True, max_lines=2), lines)
+        assert records[1][1] == "... 6 log lines omitted ..."
@@ -0,0 +1,27 @@
+import json
+
+from lib.models import Job, WorkflowRun
+
+JOB = {
+    "id": 7,
+    "name": "build",
+    "conclusion": None,
+    "runner_name": "GitHub Actions 2",
+    "steps": [{"number": 1, "name": "Set up job", "conclusion": "success"}],
+}
+
+
+class TestModels:
+    def test_raw_keeps_the_payload_without_steps_and_nulls(self):
+        job = Job(JOB)
+        assert (job.id, job.name, job.conclusion) == (7, "build", None)
+        assert job.raw == {"id": 7, "name": "build", "runner_name": "GitHub Actions 2"}
+        assert job.steps[0].raw == JOB["steps"][0]
+
+    def test_workflow_run_from_bytes(self):
+        content = json.dumps(
+            {"id": 1, "head_sha": "abc", "repository": {"full_name": "o/r"}}
+        ).encode("utf-8")
+        workflow_run = WorkflowRun.from_json(content)
+        assert (workflow_run.id, workflow_run.head_sha) == (1, "abc")
+        assert workflow_run.raw["repository"] == {"full_name": "o/r"}
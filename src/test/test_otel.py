@@ -0,0 +1,149 @@
+import threading
+import time
+from unittest.mock import patch
+
+from opentelemetry.sdk.resources import Resource
+
+from lib import otel
+from lib.config import Config
+
+
+class TestProviderCache:
+    def teardown_method(self):
+        otel.shutdown_providers()
+
+    def test_tracers_share_one_span_pipeline(self):
+        endpoint, headers = "http://localhost:4317", "api-key=x"
+        threads_before = threading.active_count()
+        for step in range(20):
+            otel.get_tracer(
+                endpoint, headers, Resource(attributes={"step": step}), "step_tracer"
+            )
+        assert len(otel._span_processors) == 1
+        assert len(otel._tracer_providers) == 20
+        assert threading.active_count() - threads_before <= 1
+
+    def test_logger_is_cached_per_resource(self):
+        endpoint, headers = "http://localhost:4317", "api-key=x"
+        resource = Resource(attributes={"step": 1})
+        logger = otel.get_logger(endpoint, headers, resource, "job_logger")
+        assert otel.get_logger(endpoint, headers, resource, "job_logger") is logger
+        other = otel.get_logger(
+            endpoint, headers, Resource(attributes={"step": 2}), "job_logger"
+        )
+        assert other is not logger
+        assert len(otel._log_processors) == 1
+
+    def test_shutdown_clears_pipelines(self):
+        otel.get_tracer(
+            "http://localhost:4317", "api-key=x", Resource(attributes={}), "tracer"
+        )
+        otel.shutdown_providers()
+        assert otel._span_processors == {}
+        assert otel._tracer_providers == {}
+
+
+class TestTransport:
+    def teardown_method(self):
+        otel.shutdown_providers()
+
+    def test_grpc_with_gzip_by_default(self):
+        from grpc import Compression
+
+        exporter = otel._span_exporter("http://localhost:4317", "api-key=x")
+        assert exporter._compression == Compression.Gzip
+
+    def test_http_protobuf(self):
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        with patch.object(Config, "OTEL_EXPORTER_OTLP_PROTOCOL", "http/protobuf"):
+            exporter = otel._span_exporter("http://localhost:4318/", "api-key=x")
+            log_exporter = otel._log_exporter("http://localhost:4318", "api-key=x")
+        assert isinstance(exporter, OTLPSpanExporter)
+        assert exporter._endpoint == "http://localhost:4318/v1/traces"
+        assert log_exporter._endpoint == "http://localhost:4318/v1/logs"
+
+    def test_batch_settings_from_config(self):
+        resource = Resource(attributes={})
+        with patch.object(Config, "OTEL_BLRP_MAX_QUEUE_SIZE", 5), patch.object(
+            Config, "OTEL_BLRP_MAX_EXPORT_BATCH_SIZE", 5
+        ):
+            otel.get_logger("http://localhost:4317", "api-key=x", resource, "l")
+        (processor,) = otel._log_processors.values()
+        assert processor._queue_count.max_queue_size == 5
+
+
+class BlockingExporter:
+    def __init__(self, result):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        self.result = getattr(SpanExportResult, result)
+        self.release = threading.Event()
+        self.release.set()
+
+    def export(self, spans):
+        self.release.wait()
+        return self.result
+
+    def force_flush(self, timeout_millis=30000):
+        return True
+
+    def shutdown(self):
+        pass
+
+
+class TestExportAccounting:
+    def teardown_method(self):
+        otel.shutdown_providers()
+
+    def export_spans(self, endpoint, count):
+        tracer = otel.get_tracer(endpoint, "", Resource(attributes={}), "tracer")
+        for i in range(count):
+            tracer.start_span("span{}".format(i)).end()
+
+    def test_all_spans_exported(self, tmp_path):
+        self.export_spans("file://" + str(tmp_path / "capture.otlp"), 3)
+        report = otel.shutdown_providers()
+        assert report["spans"] == {"exported": 3, "failed": 0, "dropped": 0}
+        assert not otel.export_lost(report)
+
+    def test_failed_exports_are_reported(self):
+        with patch.object(
+            otel, "_span_exporter", lambda endpoint, headers: BlockingExporter("FAILURE")
+        ):
+            self.export_spans("http://localhost:4317", 2)
+        report = otel.shutdown_providers()
+        assert report["spans"]["failed"] == 2
+        assert otel.export_lost(report)
+
+    def test_full_queue_counts_as_lost(self):
+        exporter = BlockingExporter("SUCCESS")
+        exporter.release.clear()
+        lost = otel.records_lost()
+        with patch.object(
+            otel, "_span_exporter", lambda endpoint, headers: exporter
+        ), patch.object(Config, "OTEL_BSP_MAX_QUEUE_SIZE", 2), patch.object(
+            Config, "OTEL_BSP_MAX_EXPORT_BATCH_SIZE", 2
+        ):
+            self.export_spans("http://localhost:4317", 5)
+        assert otel.records_lost() - lost >= 3
+        exporter.release.set()
+
+    def test_flush_deadline(self):
+        for _ in range(3):
+            exporter = BlockingExporter("SUCCESS")
+            exporter.release.clear()
+            with patch.object(
+                otel, "_span_exporter", lambda endpoint, headers: exporter
+            ):
+                self.export_spans("http://localhost:4317", 2)
+            report = otel.shutdown_providers(timeout=0.2)
+            # The abandoned export finishing late does not count in later reports
+            exporter.release.set()
+            time.sleep(0.1)
+            assert report["spans"]["dropped"] == 2
+            assert report["flush_seconds"] < 1
+            assert otel.export_lost(report)
+        assert otel.shutdown_providers()["spans"]["exported"] == 0
@@ -0,0 +1,72 @@
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+from opentelemetry.sdk.resources import Resource
+
+from lib import otel
+from lib.otlp_file import LOGS, SPANS, OtlpFileWriter, read_batches, read_records
+
+
+def capture(path, spans=3, logs=2):
+    endpoint = "file://" + str(path)
+    tracer = otel.get_tracer(endpoint, "", Resource(attributes={"step": 1}), "t")
+    for i in range(spans):
+        tracer.start_span("span{}".format(i)).end()
+    logger = otel.get_logger(endpoint, "", Resource(attributes={"step": 1}), "l")
+    for i in range(logs):
+        logger.warning("line %s", i)
+    otel.shutdown_providers()
+
+
+class TestOtlpFile:
+    def test_exporters_write_capture_file(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        capture(path)
+        records = list(read_records(str(path)))
+        assert {kind for kind, _ in records} == {SPANS, LOGS}
+        spans = ExportTraceServiceRequest.FromString(
+            b"".join(payload for kind, payload in records if kind == SPANS)
+        )
+        names = [
+            span.name
+            for resource_spans in spans.resource_spans
+            for scope_spans in resource_spans.scope_spans
+            for span in scope_spans.spans
+        ]
+        assert names == ["span0", "span1", "span2"]
+
+    def test_gzip_capture_file(self, tmp_path):
+        path = tmp_path / "capture.otlp.gz"
+        capture(path)
+        with open(path, "rb") as f:
+            assert f.read(2) == b"\x1f\x8b"
+        assert len(list(read_records(str(path)))) == 2
+
+    def test_batches_merge_records_up_to_max_bytes(self, tmp_path):
+        path = str(tmp_path / "capture.otlp")
+        writer = OtlpFileWriter(path)
+        request = ExportTraceServiceRequest()
+        request.resource_spans.add().scope_spans.add().spans.add(name="a")
+        payload = request.SerializeToString()
+        for _ in range(5):
+            writer.write(SPANS, payload)
+        writer.write(LOGS, b"")
+        writer.close()
+
+        batches = list(read_batches(path, 2 * len(payload)))
+        assert [kind for kind, _ in batches] == [SPANS, SPANS, SPANS, LOGS]
+        merged = ExportTraceServiceRequest.FromString(batches[0][1])
+        assert len(merged.resource_spans) == 2
+
+    def test_truncated_file_raises(self, tmp_path):
+        path = str(tmp_path / "capture.otlp")
+        writer = OtlpFileWriter(path)
+        writer.write(SPANS, b"x" * 10)
+        writer.close()
+        with open(path, "r+b") as f:
+            f.truncate(8)
+        try:
+            list(read_records(path))
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import pytest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+
+from lib import otel
+from lib.config import Config
+from lib.otlp_file import SPANS, read_records
+from lib.profiler import Profiler
+
+
+def span_names(path):
+    request = ExportTraceServiceRequest.FromString(
+        b"".join(payload for kind, payload in read_records(path) if kind == SPANS)
+    )
+    return {
+        span.name: span
+        for resource_spans in request.resource_spans
+        for scope_spans in resource_spans.scope_spans
+        for span in scope_spans.spans
+    }
+
+
+class TestProfiler:
+    def test_disabled_profiler_is_free(self):
+        profiler = Profiler()
+
+        def parse():
+            return [1, 2]
+
+        assert profiler.timed("parse", count=len)(parse) is parse
+        with profiler.phase("export") as phase:
+            phase.items += 1
+        assert profiler.summary().count("\n") == 0
+
+    def test_from_config(self):
+        with patch.object(Config, "GHA_PROFILE", "true"):
+            assert Profiler.from_config().modes == {"phases"}
+        with patch.object(Config, "GHA_PROFILE", "cpu, spans"):
+            assert Profiler.from_config().modes == {"cpu", "spans"}
+        with patch.object(Config, "GHA_PROFILE", "everything"):
+            with pytest.raises(ValueError):
+                Profiler.from_config()
+
+    def test_phases_are_timed_and_counted(self):
+        profiler = Profiler(["phases"])
+        parse = profiler.timed("parse", count=len)(lambda: [1, 2, 3])
+        with profiler.phase("export"):
+            parse()
+            parse()
+        summary = profiler.summary().splitlines()
+        assert summary[1].split()[:3] == ["export", "1", "0"]
+        assert summary[2].split()[:3] == ["parse", "2", "6"]
+
+    def test_phases_exported_as_span_tree(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        profiler = Profiler(["spans"])
+        profiler.start()
+        with profiler.phase("export", items=2):
+            with profiler.phase("parse"):
+                pass
+        profiler.export_spans("file://" + str(path), "", run_id=1)
+        otel.shutdown_providers()
+
+        spans = span_names(str(path))
+        assert spans["parse"].parent_span_id == spans["export"].span_id
+        assert spans["export"].parent_span_id == spans["gha-exporter"].span_id
+        assert spans["export"].attributes[0].value.int_value == 2
+
+    def test_cpu_and_memory_dumps(self, tmp_path, capsys):
+        output = str(tmp_path / "profile")
+        profiler = Profiler(["cpu", "memory"], output)
+        profiler.start()
+        with profiler.phase("work"):
+            sum(range(1000))
+        profiler.stop()
+        assert (tmp_path / "profile.prof").exists()
+        assert (tmp_path / "profile.tracemalloc").exists()
+        assert "work" in capsys.readouterr().out
@@ -0,0 +1,74 @@
+import time
+from unittest.mock import MagicMock, patch
+
+from lib.rate_limit import RateLimitScheduler
+
+
+def fake_response(status_code=200, headers=None, text=""):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.text = text
+    return response
+
+
+class TestRateLimitScheduler:
+    @patch("lib.rate_limit.time.sleep")
+    def test_retries_after_retry_after(self, mock_sleep):
+        scheduler = RateLimitScheduler(rate=100, max_retries=3)
+        send = MagicMock(
+            side_effect=[
+                fake_response(403, {"Retry-After": "30"}),
+                fake_response(200),
+            ]
+        )
+        assert scheduler.call(send).status_code == 200
+        assert send.call_count == 2
+        assert scheduler.rate_limited == 1
+        assert 29 < mock_sleep.call_args.args[0] <= 30
+        assert scheduler.stats()["throttled_calls"] == 1
+
+    @patch("lib.rate_limit.time.sleep")
+    def test_waits_for_reset_when_budget_is_exhausted(self, mock_sleep):
+        scheduler = RateLimitScheduler(rate=100, max_retries=3)
+        reset = str(int(time.time()) + 60)
+        scheduler.call(
+            lambda: fake_response(
+                200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}
+            )
+        )
+        mock_sleep.assert_not_called()
+        scheduler.call(lambda: fake_response(200))
+        assert mock_sleep.call_args.args[0] > 55
+
+    @patch("lib.rate_limit.time.sleep")
+    def test_does_not_retry_other_errors(self, mock_sleep):
+        scheduler = RateLimitScheduler(rate=100, max_retries=3)
+        send = MagicMock(return_value=fake_response(403, text="Resource not accessible"))
+        assert scheduler.call(send).status_code == 403
+        assert send.call_count == 1
+
+    @patch("lib.rate_limit.time.sleep")
+    def test_token_bucket_paces_bursts(self, mock_sleep):
+        scheduler = RateLimitScheduler(rate=2, max_retries=0)
+        for _ in range(4):
+            scheduler.call(lambda: fake_response(200))
+        assert scheduler.stats()["calls"] == 4
+        assert scheduler.stats()["throttled_calls"] == 2
+
+    @patch("lib.rate_limit.time.sleep")
+    def test_zero_rate_is_unpaced(self, mock_sleep):
+        scheduler = RateLimitScheduler(rate=0, max_retries=0)
+        for _ in range(4):
+            scheduler.call(lambda: fake_response(200))
+        assert scheduler.stats()["throttled_calls"] == 0
+        reset = str(int(time.time()) + 60)
+        scheduler.call(
+            lambda: fake_response(
+                200, {"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": reset}
+            )
+        )
+        scheduler.call(lambda: fake_response(200))
+        scheduler.call(lambda: fake_response(200))
+        # Paced by the budget left once it runs low
+        assert mock_sleep.call_args.args[0] > 5
@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+import grpc
+import requests
+
+from benchmarks.otlp_sink import OtlpHttpSink, OtlpSink
+from lib.config import Config
+from lib.otlp_file import read_records
+from replay import parse_headers, replay
+from test.test_otlp_file import capture
+
+
+class TestReplay:
+    def test_parse_headers(self):
+        assert parse_headers("api-key=abc, X-Extra=1") == [
+            ("api-key", "abc"),
+            ("x-extra", "1"),
+        ]
+
+    def test_replay_sends_capture_to_collector(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        capture(path, spans=4, logs=3)
+        sink = OtlpSink().start()
+        try:
+            requests_sent, bytes_sent = replay(str(path), sink.endpoint, "", 1000000)
+        finally:
+            sink.stop()
+        assert (sink.spans, sink.log_records) == (4, 3)
+        assert requests_sent == 2
+        assert bytes_sent == sum(len(p) for _, p in read_records(str(path)))
+
+    def test_replay_raises_when_collector_is_down(self, tmp_path, monkeypatch):
+        path = tmp_path / "capture.otlp"
+        capture(path, spans=1, logs=0)
+        monkeypatch.setattr("replay.time.sleep", lambda seconds: None)
+        monkeypatch.setattr("replay.TIMEOUT", 1)
+        try:
+            replay(str(path), "http://127.0.0.1:1", "", 1000000)
+            assert False, "expected RpcError"
+        except grpc.RpcError as e:
+            assert e.code() == grpc.StatusCode.UNAVAILABLE
+
+    def test_replay_over_http(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        capture(path, spans=4, logs=3)
+        sink = OtlpHttpSink().start()
+        try:
+            with patch.object(Config, "OTEL_EXPORTER_OTLP_PROTOCOL", "http/protobuf"):
+                requests_sent, bytes_sent = replay(
+                    str(path), sink.endpoint, "", 1000000
+                )
+        finally:
+            sink.stop()
+        assert (sink.spans, sink.log_records) == (4, 3)
+        assert requests_sent == 2
+        assert bytes_sent == sum(len(p) for _, p in read_records(str(path)))
+
+    def test_replay_over_http_raises_on_rejected_request(self, tmp_path):
+        path = tmp_path / "capture.otlp"
+        capture(path, spans=1, logs=0)
+        sink = OtlpHttpSink().start()
+        try:
+            with patch.object(Config, "OTEL_EXPORTER_OTLP_PROTOCOL", "http/protobuf"):
+                replay(str(path), sink.endpoint + "/unknown", "", 1000000)
+            assert False, "expected HTTPError"
+        except requests.HTTPError as e:
+            assert e.response.status_code == 404
+        finally:
+            sink.stop()
@@ -0,0 +1,27 @@
+import pytest
+
+from lib.timestamps import parse_timestamp_ns
+
+
+class TestParseTimestampNs:
+    def test_api_timestamp(self):
+        assert parse_timestamp_ns("2024-01-01T10:00:00Z") == 1704103200000000000
+
+    def test_log_timestamp_keeps_full_precision(self):
+        assert (
+            parse_timestamp_ns("2024-01-01T10:00:00.1234567Z") == 1704103200123456700
+        )
+
+    def test_lines_in_the_same_second_share_the_prefix(self):
+        first = parse_timestamp_ns("2024-01-01T10:00:00.0000001Z")
+        second = parse_timestamp_ns("2024-01-01T10:00:00.0000002Z")
+        assert second - first == 100
+
+    def test_offsets_fall_back_to_isoformat(self):
+        assert (
+            parse_timestamp_ns("2024-01-01T12:00:00+02:00") == 1704103200000000000
+        )
+
+    def test_rejects_non_timestamps(self):
+        with pytest.raises(ValueError):
+            parse_timestamp_ns("Run actions/checkout@v4")